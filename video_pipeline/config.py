@@ -1,7 +1,7 @@
 """
 配置文件 - API keys 同路徑
 """
-from typing import Optional
+from typing import Any, Dict, List, Optional
 from pathlib import Path
 import os
 
@@ -56,6 +56,15 @@ class Settings(BaseSettings):
     
     # 模型設定
     WHISPER_MODEL: str = "large-v3"  # or "base", "small", "medium"
+    ASR_BACKEND: str = "whisper"  # or "faster-whisper"（CPU int8 + VAD）
+    ASR_COMPUTE_TYPE: str = "int8"  # faster-whisper compute type
+    ASR_CPU_THREADS: int = 0  # 每個 worker 的 CTranslate2 threads；0 = 自動
+    ASR_CHUNK_CONCURRENCY: int = 2  # 同時轉寫的語音 chunk 數
+    ASR_CHUNK_SECONDS: float = 30  # VAD 區段合併後的 chunk 上限
+    ASR_VAD_MIN_SILENCE_MS: int = 500
+    ASR_BEAM_SIZE: int = 5
+    ASR_LANGUAGE: str = ""  # 空白 = 自動偵測
+    ASR_PCM_STREAM: bool = True  # 抽音訊直接串流成記憶體中的 16 kHz PCM 交給 ASR（不寫 wav）；transcription 交給 stage worker 時自動改回 wav
     GPT_MODEL: str = "gpt-4o"
     
     # 其他參數
@@ -64,7 +73,120 @@ class Settings(BaseSettings):
     
     # 語言 (用作 syllable counting)
     LANGUAGE: str = "zh-TW"  # 或 "en", "zh-CN"
-    
+
+    # TTS
+    ELEVENLABS_VOICE_ID: str = "YOUR_VOICE_ID"
+    ELEVENLABS_MODEL_ID: str = "eleven_multilingual_v2"
+    TTS_SAMPLE_RATE: int = 44100  # ElevenLabs pcm_44100
+    TTS_MAX_CONCURRENCY: int = 4  # 同時合成的句數上限
+    TTS_SENTENCE_GAP: float = 0.0  # 句與句之間補的靜音（秒）
+    TTS_VOICE_SETTINGS: Dict[str, float] = {}  # e.g. {"stability": 0.5, "similarity_boost": 0.75}
+    TTS_CACHE_ENABLED: bool = True
+    TTS_CACHE_DIR: Path = BASE_DIR / "cache" / "tts"
+    TTS_CACHE_MAX_MB: int = 512
+
+    # 背景音樂
+    MUSIC_DURATION_BUCKET: int = 30  # 秒；長度相近的影片共用同一首
+    MUSIC_FADE_IN: float = 1.0
+    MUSIC_FADE_OUT: float = 3.0
+    MUSIC_CACHE_DIR: Path = BASE_DIR / "cache" / "music"
+    MUSIC_CACHE_MAX_MB: int = 2048
+
+    # ffmpeg / ffprobe 共用 executor
+    MEDIA_MAX_PROCESSES: int = 0  # 同時執行的 ffmpeg 數；0 = CPU 數 / 2
+    MEDIA_THREADS_PER_PROCESS: int = 0  # 每個 ffmpeg 的 -threads；0 = CPU 數 / 並行數
+    MEDIA_NICE: Dict[str, int] = {"probe": 0, "preview": 0, "final": 10}  # 各優先級的 nice 值
+    MEDIA_TIMEOUT: float = 1800  # 單一 process 逾時（秒）；0 = 不限
+
+    # 生圖 -> 圖生影片逐 clip 串流
+    PIPELINE_QUEUE_SIZE: int = 8  # 待編碼圖片 queue 上限（滿了生圖會暫停）
+    CLIP_ENCODE_WORKERS: int = 0  # clip 編碼 consumer 數；0 = media executor 並行上限
+    CLIP_VARIATIONS: bool = True  # 相同 prompt 只生一張圖，其餘 clip 以 zoompan 鏡頭運動衍生
+
+    # 單一 job profiling（start 帶 profile=true 時，選用套件 pyinstrument）
+    PROFILE_INTERVAL: float = 0.001  # 取樣間隔（秒）
+
+    # 跨 job 生圖快取（prompt 完全相同或相似度超過門檻時沿用，已通過檢查的圖跳過安全檢查）
+    PROMPT_CACHE_ENABLED: bool = True
+    PROMPT_CACHE_DIR: Path = BASE_DIR / "cache" / "images"
+    PROMPT_CACHE_MAX_MB: int = 4096
+    PROMPT_CACHE_SIMILARITY: float = 0.9  # 字元 n-gram Jaccard 相似度門檻；1.0 = 只用完全相同
+    PROMPT_CACHE_NGRAM: int = 3
+
+    # 輸出品質（完整版）
+    IMAGE_ENGINE: str = "stable-diffusion-xl-1024-v1-0"
+    IMAGE_WIDTH: int = 576  # 9:16
+    IMAGE_HEIGHT: int = 1024
+    X264_PRESET: str = "medium"
+    X264_CRF: int = 23
+    # 發佈用輸出規格：完整版組裝後一次 decode、分支縮放編碼；crop=true 為裁切填滿（方形），否則等比縮放補邊；[] = 不產生
+    RENDITIONS: List[Dict[str, Any]] = [
+        {"name": "1080x1920", "width": 1080, "height": 1920},
+        {"name": "720x1280", "width": 720, "height": 1280},
+        {"name": "square", "width": 1080, "height": 1080, "crop": True}
+    ]
+    RENDITION_SUBTITLES: bool = False  # 預設是否燒入字幕（個別規格可用 "subtitles" 覆寫）
+
+    # 草稿模式（mode=draft）：低解析度、每句少量 clip、不做 ChatGPT 二次判斷、快速編碼
+    DRAFT_IMAGE_ENGINE: str = "stable-diffusion-v1-6"
+    DRAFT_IMAGE_WIDTH: int = 320
+    DRAFT_IMAGE_HEIGHT: int = 576
+    DRAFT_IMAGE_STEPS: int = 15
+    DRAFT_MAX_CLIPS_PER_SENTENCE: int = 1
+    DRAFT_X264_PRESET: str = "ultrafast"
+    DRAFT_X264_CRF: int = 32
+
+    # Artifact 儲存（OUTPUT_DIR/YYYY/MM/DD/{job_id}/...）
+    STORAGE_INTERMEDIATE_RETENTION_HOURS: float = 24  # 完成後多久刪 img_raw / segments / concat.txt / temp_video.mp4
+    STORAGE_JOB_RETENTION_DAYS: float = 0  # 整個 job 目錄保留天數；0 = 永久
+
+    # Job 狀態（完成後超過 TTL 或 memory budget 時，大型 artifact 寫到磁碟）
+    JOB_STATE_DIR: Path = BASE_DIR / "job_state"
+    JOB_TTL_SECONDS: float = 900
+    JOB_MEMORY_BUDGET_MB: float = 64  # 已完成 job 在記憶體內的估計大小上限
+    JOB_SWEEP_INTERVAL: float = 60
+
+    # Batch 提交
+    BATCH_MAX_CONCURRENT_JOBS: int = 2  # 同一個 batch 同時執行的 job 數（本 process 執行時）
+    BATCH_MANIFEST_ROOT: Path = BASE_DIR / "inputs"  # manifest 的 path 只能指向這個目錄底下
+
+    # 啟動
+    WARMUP_ON_STARTUP: str = ""  # 啟動後在背景預載的服務，e.g. "transcription,chatgpt"
+
+    # 長片切段並行 ASR
+    SEGMENT_PARALLEL: bool = True
+    SEGMENT_MIN_DURATION: float = 600  # 秒；短於此不切段
+    SEGMENT_TARGET_SECONDS: float = 300  # 每段目標長度
+    SEGMENT_WORKERS: int = 0  # ASR process 數；0 = min(4, CPU 數)
+
+    # 統一風格（長影片走 map-reduce）
+    UNIFY_MAPREDUCE_MIN_FRAMES: int = 20
+    UNIFY_MAPREDUCE_MIN_SENTENCES: int = 40
+    UNIFY_FRAME_CHUNK: int = 8  # 每個 map 摘要的 frame 數
+    UNIFY_SCRIPT_CHUNK: int = 20  # 每個 map 摘要的句數
+    UNIFY_REDUCE_FAN_IN: int = 8  # 每次合併的摘要數上限
+    UNIFY_PROMPT_BATCH: int = 15  # 每個 prompt 生成請求的句數
+    UNIFY_MAX_CONCURRENCY: int = 4
+    UNIFY_STREAM: bool = True  # 串流 completion，每句 prompt 一完成就開始生圖
+    IMAGE_PREFETCH_CONCURRENCY: int = 4  # 串流期間同時預先生成的圖數
+
+    # 圖片安全檢查
+    SAFETY_MODE: str = "batch"  # "batch"（多圖一次 vision request）、"serial"（逐張 + ChatGPT）或 "speculative"（每 clip 多張候選）
+    SPECULATIVE_MAX_CANDIDATES: int = 4  # speculative：每次最多要幾張候選
+    SPECULATIVE_TARGET_PASS: float = 0.9  # 每輪至少一張通過的目標機率（依 job 觀察到的淘汰率推算候選數）
+    SPECULATIVE_PRIOR_REJECTION: float = 0.2  # 還沒有觀察資料時假設的淘汰率
+    SPECULATIVE_CLIP_CONCURRENCY: int = 4  # 同時處理的 clip 數
+    SAFETY_BATCH_SIZE: int = 6
+    SAFETY_CONFIDENCE_THRESHOLD: float = 0.75  # 低於此值才找 ChatGPT 二次判斷
+
+    # 分散式 worker（空字串 = 在 API process 內執行）
+    JOB_QUEUE_URL: str = ""  # e.g. "sqlite:queue.db" 或 "mypkg.broker:RedisJobQueue"
+    WORKER_LEASE_SECONDS: int = 60
+    WORKER_HEARTBEAT_SECONDS: int = 15
+    WORKER_POLL_INTERVAL: float = 2.0
+    WORKER_MAX_ATTEMPTS: int = 3
+    WORKER_STAGES: str = ""  # 交給 stage worker 執行的步驟，逗號分隔，e.g. "transcription"
+
     class Config:
         env_file = str(Path(__file__).parent.resolve() / ".env")
         case_sensitive = True
@@ -72,6 +194,53 @@ class Settings(BaseSettings):
 
 settings = Settings()
 
-# 建立必要資料夾
-for folder in [settings.UPLOAD_DIR, settings.OUTPUT_DIR, settings.TEMP_DIR]:
-    folder.mkdir(parents=True, exist_ok=True)
\ No newline at end of file
+_dirs_ready = False
+
+
+def ensure_dirs():
+    """建立必要資料夾（第一次需要時才做，不在 import 時碰檔案系統）"""
+    global _dirs_ready
+    if _dirs_ready:
+        return
+    for folder in [settings.UPLOAD_DIR, settings.OUTPUT_DIR, settings.TEMP_DIR]:
+        Path(folder).mkdir(parents=True, exist_ok=True)
+    _dirs_ready = True
+
+
+def render_profile(mode: str = "full") -> Dict[str, Any]:
+    """
+    生圖 / 安全檢查 / 編碼的品質設定
+    - full：完整品質（預設）
+    - draft：快速預覽，之後可 promote 成完整版
+    """
+    if mode == "draft":
+        return {
+            "mode": "draft",
+            "image_engine": settings.DRAFT_IMAGE_ENGINE,
+            "width": settings.DRAFT_IMAGE_WIDTH,
+            "height": settings.DRAFT_IMAGE_HEIGHT,
+            "image_steps": settings.DRAFT_IMAGE_STEPS,
+            "max_clips_per_sentence": settings.DRAFT_MAX_CLIPS_PER_SENTENCE,
+            "gpt_verification": False,
+            "safety_retries": 1,
+            "x264_preset": settings.DRAFT_X264_PRESET,
+            "x264_crf": settings.DRAFT_X264_CRF,
+            "media_priority": "preview",
+            "output_name": "preview_video.mp4",
+            "renditions": []
+        }
+    return {
+        "mode": "full",
+        "image_engine": settings.IMAGE_ENGINE,
+        "width": settings.IMAGE_WIDTH,
+        "height": settings.IMAGE_HEIGHT,
+        "image_steps": None,
+        "max_clips_per_sentence": 0,
+        "gpt_verification": True,
+        "safety_retries": settings.MAX_RETRIES,
+        "x264_preset": settings.X264_PRESET,
+        "x264_crf": settings.X264_CRF,
+        "media_priority": "final",
+        "output_name": "final_video.mp4",
+        "renditions": list(settings.RENDITIONS)
+    }
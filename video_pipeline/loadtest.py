@@ -0,0 +1,584 @@
+"""
+API Load Test Harness
+
+檔案說明（File description）:
+    - 以設定的到達率（jobs / 分鐘，Poisson 到達）對 API 送 `POST /api/pipeline/start`，
+      每個 job 依固定間隔輪詢 `GET /api/pipeline/status/{job_id}` 直到完成。
+    - API 在子 process 啟動（`--serve`），所有外部 provider（ASR、ChatGPT、Qwen、生圖、
+      圖生影片、TTS、音樂、ffmpeg 組裝）換成只 sleep 的本地 stub（`registry.override`），
+      所以量到的是 API 節點本身：event loop、job 狀態、磁碟 I/O 與記憶體。
+    - 每個到達率一個 step，報告 jobs/hour、status endpoint p50 / p99、event-loop lag 與 RSS 隨時間變化；
+      任一門檻超標即視為飽和，預設在第一個飽和的 step 後停止。
+    - `--baseline-out` 把結果（含飽和點）存成 JSON，`--compare` 與之前的 baseline 比較。
+
+用法 / Usage:
+    python loadtest.py --rates 30,60,120,240 --step-seconds 60
+    python loadtest.py --rates 60,120 --latency-scale 0.2 --baseline-out loadtest_baseline.json
+    python loadtest.py --rates 60,120 --compare loadtest_baseline.json
+    python loadtest.py --serve --port 8765          # 只啟動 stub API（例如搭配外部工具）
+
+注意 / Notes:
+    - 需要 uvicorn（API 子 process）與 httpx（load generator）。
+    - stub API 的 uploads / outputs / job state / 快取放在暫存目錄，不影響正式資料；
+      `--url` 指向既有的 API 時，沒有 `/api/loadtest/metrics` 就只回報 client 端的數字。
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+# 各 stub provider 呼叫的模擬延遲（秒），乘上 --latency-scale
+STUB_LATENCIES: Dict[str, float] = {
+    "metadata": 0.05, "extract_audio": 0.2, "transcribe": 2.0, "rewrite": 1.5,
+    "frames": 0.5, "analyze": 1.0, "unify": 2.0, "image": 1.5, "safety": 0.8,
+    "verify": 0.5, "clip": 0.3, "tts": 1.5, "music": 0.5, "mix": 0.2, "assemble": 0.5
+}
+
+# stub API 的資料目錄（暫存目錄底下，以環境變數覆寫 settings）
+SETTING_DIRS = {
+    "UPLOAD_DIR": "uploads", "OUTPUT_DIR": "outputs", "TEMP_DIR": "temp", "JOB_STATE_DIR": "job_state",
+    "PROMPT_CACHE_DIR": "cache/images", "TTS_CACHE_DIR": "cache/tts", "MUSIC_CACHE_DIR": "cache/music"
+}
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """nearest-rank percentile；沒有資料時回傳 None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    # nearest-rank：第 ceil(p/100 * N) 個（1-based）；先 round 掉浮點誤差（0.07 * 100 = 7.000000000000001）
+    rank = max(0, min(len(ordered) - 1, math.ceil(round(pct * len(ordered) / 100.0, 9)) - 1))
+    return ordered[rank]
+
+
+def _ms(value: Optional[float]) -> Optional[float]:
+    return round(value * 1000, 2) if value is not None else None
+
+
+def _rss_bytes() -> int:
+    """目前 RSS；非 Linux 時退回 peak RSS"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+# ==================== Stub API（子 process） ====================
+
+class StubProviders:
+    """
+    取代所有外部 provider 的最小實作：每個呼叫 sleep 對應的延遲，回傳 pipeline 需要的最少欄位。
+    同一個 instance 註冊成所有服務名稱（registry.override）。
+    """
+
+    def __init__(self, scale: float = 1.0, sentences: int = 6, clips_per_sentence: int = 3):
+        self.scale = scale
+        self.sentences = sentences
+        self.clips_per_sentence = clips_per_sentence
+
+    async def _wait(self, name: str):
+        await asyncio.sleep(STUB_LATENCIES.get(name, 0.1) * self.scale)
+
+    def _job_file(self, job_id: str, kind: str, name: str, content: bytes = b"stub") -> str:
+        try:
+            from video_pipeline.utils.storage import get_storage
+        except Exception:
+            from utils.storage import get_storage
+        path = get_storage().job_path(job_id, kind) / name
+        path.write_bytes(content)
+        return str(path)
+
+    # video_processor
+    async def extract_metadata(self, video_path: str):
+        await self._wait("metadata")
+        return {"duration": 3.0 * self.sentences, "fps": 30.0}
+
+    async def extract_audio(self, video_path: str):
+        await self._wait("extract_audio")
+        return str(Path(video_path).with_suffix(".wav"))
+
+    async def extract_pcm(self, video_path: str, *a, **k):
+        await self._wait("extract_audio")
+        return str(Path(video_path).with_suffix(".wav"))
+
+    # transcription
+    async def transcribe(self, audio_path: str, *a, **k):
+        await self._wait("transcribe")
+        return [
+            {"index": i, "text": f"sentence {i}", "start": 3.0 * i, "end": 3.0 * (i + 1), "duration": 3.0}
+            for i in range(self.sentences)
+        ]
+
+    # syllable_counter：目標 0 音節，改寫一次就通過
+    def count_all(self, transcript, duration):
+        return {"syllables_per_sec": 0.0, "total_syllables": 0}
+
+    def count_script(self, script):
+        return 0
+
+    # chatgpt
+    async def rewrite_script(self, transcript, syllable_data):
+        await self._wait("rewrite")
+        return [{"index": s.index, "text": s.text, "start": s.start, "end": s.end} for s in transcript]
+
+    async def unify_style_and_prompts(self, analyzed_frames, new_script, syllable_data, on_sentence=None):
+        await self._wait("unify")
+        per_sentence = []
+        for i in range(self.sentences):
+            sentence = {
+                "index": i, "text": f"sentence {i}", "duration": 3.0, "num_clips": self.clips_per_sentence,
+                "clips": [
+                    {"clip_id": f"{i:02d}{chr(ord('a') + c)}", "prompt": f"load test scene {i}"}
+                    for c in range(self.clips_per_sentence)
+                ]
+            }
+            per_sentence.append(sentence)
+            if on_sentence is not None:
+                on_sentence(sentence)
+        return {"summary": "load test", "per_sentence": per_sentence}
+
+    async def verify_image_quality(self, safety_result, prompt):
+        await self._wait("verify")
+        return {"status": "ok"}
+
+    # frame_extractor / qwen
+    async def extract_frames_per_sentence(self, video_path, transcript, fps, job_id, title):
+        await self._wait("frames")
+        return []
+
+    async def analyze_frames(self, frames_data):
+        await self._wait("analyze")
+        return frames_data
+
+    async def check_safety(self, img_path):
+        await self._wait("safety")
+        return {"raw": "safe"}
+
+    async def check_safety_batch(self, items):
+        await self._wait("safety")
+        return [{"clip_id": i["clip_id"], "status": "ok"} for i in items]
+
+    # image_gen
+    async def generate(self, prompt, job_id, title, clip_id, profile=None):
+        await self._wait("image")
+        return self._job_file(job_id, "img", f"clip_{clip_id}.jpg", f"{job_id}:{prompt}".encode())
+
+    async def generate_candidates(self, prompt, job_id, title, clip_id, n=1, profile=None):
+        return [await self.generate(prompt, job_id, title, f"{clip_id}_{k}", profile) for k in range(n)]
+
+    # video_gen
+    async def generate_clips_stream(self, queue, job_id, force=(), profile=None, workers=None, on_clip=None):
+        clips = []
+        while True:
+            item = await queue.get()
+            if item is None:
+                return clips
+            await self._wait("clip")
+            clip = dict(item, video_path=str(Path(item["img_path"]).with_suffix(".mp4")), reused=False)
+            clips.append(clip)
+            if on_clip is not None:
+                on_clip(clip)
+
+    async def generate_clips(self, images_result, job_id, title, force=(), profile=None):
+        queue: asyncio.Queue = asyncio.Queue()
+        for img in images_result["ok"]:
+            queue.put_nowait(img)
+        queue.put_nowait(None)
+        return await self.generate_clips_stream(queue, job_id, force, profile)
+
+    # tts / music
+    async def generate_dialogue(self, script, job_id, title, warnings=None):
+        await self._wait("tts")
+        return {
+            "audio_path": self._job_file(job_id, "audio", "dialogue.mp3"),
+            "duration": 3.0 * self.sentences, "sentence_timings": []
+        }
+
+    async def generate_and_cut_music(self, summary, duration, job_id, title, warnings=None):
+        await self._wait("music")
+        return self._job_file(job_id, "audio", "music.mp3")
+
+    # video_assembly
+    async def mix_audio(self, dialogue, music, job_id, profile=None):
+        await self._wait("mix")
+        return {"path": self._job_file(job_id, "audio", "mixed_audio.mp3")}
+
+    async def assemble(self, clips, dialogue, music, srt_data, job_id, title, profile=None, renditions=None):
+        await self._wait("assemble")
+        clips = list(clips)
+        return {
+            "video_path": self._job_file(job_id, "video", "final_video.mp4"),
+            "srt_path": "", "duration": 3.0 * self.sentences, "clips_count": len(clips), "renditions": []
+        }
+
+
+STUB_SERVICES = (
+    "video_processor", "transcription", "syllable_counter", "frame_extractor", "qwen",
+    "chatgpt", "image_gen", "video_gen", "tts", "music", "video_assembly"
+)
+
+
+def install_stub_api(scale: float = 1.0, sentences: int = 6, clips_per_sentence: int = 3):
+    """把所有 provider 換成 stub，並加上 `/api/loadtest/metrics`（RSS、event-loop lag、job 數）；回傳 app"""
+    try:
+        from video_pipeline import main as pipeline
+    except Exception:
+        import main as pipeline
+
+    stub = StubProviders(scale, sentences, clips_per_sentence)
+    for name in STUB_SERVICES:
+        pipeline.registry.override(name, instance=stub)
+
+    lag_samples: List[float] = []
+    lag_interval = 0.05
+
+    async def sample_loop_lag():
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(lag_interval)
+            lag_samples.append(max(0.0, time.perf_counter() - started - lag_interval))
+
+    @pipeline.app.on_event("startup")
+    async def _start_lag_sampler():
+        asyncio.create_task(sample_loop_lag())
+
+    @pipeline.app.get("/api/loadtest/metrics")
+    async def loadtest_metrics():
+        """自上次查詢以來的 event-loop lag 樣本（秒）、目前 RSS 與 job 數"""
+        samples = lag_samples[:]
+        del lag_samples[:len(samples)]
+        return {
+            "rss_bytes": _rss_bytes(),
+            "loop_lag": samples,
+            "jobs": len(pipeline.jobs),
+            "active_jobs": len(pipeline._active_job_ids())
+        }
+
+    return pipeline.app
+
+
+def serve(port: int, scale: float, sentences: int, clips_per_sentence: int):
+    """在本 process 啟動 stub API"""
+    import uvicorn
+    app = install_stub_api(scale, sentences, clips_per_sentence)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+# ==================== Load generator ====================
+
+class LoadRunner:
+
+    def __init__(self, base_url: str, poll_interval: float = 1.0, drain_seconds: float = 120,
+                 upload_bytes: int = 64 * 1024, mode: str = "full", seed: int = 0,
+                 max_status_p99_ms: float = 500, max_loop_lag_p99_ms: float = 100, min_completion: float = 0.9):
+        self.base_url = base_url
+        self.poll_interval = poll_interval
+        self.drain_seconds = drain_seconds
+        self.payload = b"\0" * upload_bytes
+        self.mode = mode
+        self.random = random.Random(seed)
+        self.max_status_p99_ms = max_status_p99_ms
+        self.max_loop_lag_p99_ms = max_loop_lag_p99_ms
+        self.min_completion = min_completion
+
+    async def wait_ready(self, client, timeout: float = 60):
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            try:
+                if (await client.get("/api/startup")).status_code == 200:
+                    return
+            except Exception:
+                pass
+            await asyncio.sleep(0.5)
+        raise RuntimeError(f"API at {self.base_url} did not become ready in {timeout:.0f}s")
+
+    async def _job(self, client, index: int, step: Dict[str, Any], deadline: float):
+        started = time.perf_counter()
+        try:
+            t0 = time.perf_counter()
+            resp = await client.post(
+                "/api/pipeline/start", params={"title": f"load_{index}", "mode": self.mode},
+                files={"file": (f"load_{index}.mp4", self.payload, "video/mp4")}
+            )
+            step["start_latency"].append(time.perf_counter() - t0)
+            resp.raise_for_status()
+            job_id = resp.json()["job_id"]
+        except Exception as e:
+            step["errors"].append(f"start: {e}")
+            return
+
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                t0 = time.perf_counter()
+                resp = await client.get(f"/api/pipeline/status/{job_id}")
+                step["status_latency"].append(time.perf_counter() - t0)
+                resp.raise_for_status()
+                status = resp.json().get("status")
+            except Exception as e:
+                step["errors"].append(f"status: {e}")
+                continue
+            if status in ("completed", "failed"):
+                step[status] += 1
+                step["job_latency"].append(time.perf_counter() - started)
+                return
+        step["unfinished"] += 1
+
+    async def _sample_metrics(self, client, step: Dict[str, Any], started: float):
+        while True:
+            try:
+                resp = await client.get("/api/loadtest/metrics")
+                if resp.status_code != 200:
+                    return
+                data = resp.json()
+                step["loop_lag"].extend(data["loop_lag"])
+                step["timeline"].append({
+                    "t": round(time.perf_counter() - started, 1),
+                    "rss_mb": round(data["rss_bytes"] / 1024 / 1024, 1),
+                    "active_jobs": data["active_jobs"],
+                    "loop_lag_max_ms": _ms(max(data["loop_lag"])) if data["loop_lag"] else 0.0
+                })
+            except Exception:
+                pass
+            await asyncio.sleep(1.0)
+
+    async def run_step(self, client, rate_per_min: float, seconds: float) -> Dict[str, Any]:
+        """一個到達率跑 `seconds` 秒，之後最多再等 `drain_seconds` 讓進行中的 job 完成"""
+        step: Dict[str, Any] = {
+            "start_latency": [], "status_latency": [], "job_latency": [], "loop_lag": [], "timeline": [],
+            "errors": [], "completed": 0, "failed": 0, "unfinished": 0
+        }
+        started = time.perf_counter()
+        deadline = started + seconds + self.drain_seconds
+        sampler = asyncio.create_task(self._sample_metrics(client, step, started))
+        tasks = []
+        next_arrival = started
+        while True:
+            next_arrival += self.random.expovariate(rate_per_min / 60.0)
+            if next_arrival - started >= seconds:
+                break
+            await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+            tasks.append(asyncio.create_task(self._job(client, len(tasks), step, deadline)))
+        await asyncio.sleep(max(0.0, started + seconds - time.perf_counter()))
+        if tasks:
+            await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+        return self._summarize(rate_per_min, len(tasks), elapsed, step)
+
+    def _summarize(self, rate: float, submitted: int, elapsed: float, step: Dict[str, Any]) -> Dict[str, Any]:
+        status_p99 = _ms(percentile(step["status_latency"], 99))
+        lag_p99 = _ms(percentile(step["loop_lag"], 99))
+        rss = [s["rss_mb"] for s in step["timeline"]]
+        completion = (step["completed"] + step["failed"]) / submitted if submitted else 1.0
+
+        reasons = []
+        if status_p99 is not None and status_p99 > self.max_status_p99_ms:
+            reasons.append(f"status p99 {status_p99}ms > {self.max_status_p99_ms}ms")
+        if lag_p99 is not None and lag_p99 > self.max_loop_lag_p99_ms:
+            reasons.append(f"loop lag p99 {lag_p99}ms > {self.max_loop_lag_p99_ms}ms")
+        if completion < self.min_completion:
+            reasons.append(f"only {completion:.0%} of jobs finished within the drain window")
+        if step["failed"] or step["errors"]:
+            reasons.append(f"{step['failed']} failed jobs, {len(step['errors'])} request errors")
+
+        return {
+            "rate_per_min": rate,
+            "offered_jobs_per_hour": round(rate * 60, 1),
+            "submitted": submitted,
+            "completed": step["completed"],
+            "failed": step["failed"],
+            "unfinished": step["unfinished"],
+            "elapsed_seconds": round(elapsed, 1),
+            "jobs_per_hour": round(step["completed"] / elapsed * 3600, 1) if elapsed else 0.0,
+            "job_latency_p50_s": round(percentile(step["job_latency"], 50) or 0, 2),
+            "job_latency_p99_s": round(percentile(step["job_latency"], 99) or 0, 2),
+            "start_p50_ms": _ms(percentile(step["start_latency"], 50)),
+            "start_p99_ms": _ms(percentile(step["start_latency"], 99)),
+            "status_requests": len(step["status_latency"]),
+            "status_p50_ms": _ms(percentile(step["status_latency"], 50)),
+            "status_p99_ms": status_p99,
+            "loop_lag_p50_ms": _ms(percentile(step["loop_lag"], 50)),
+            "loop_lag_p99_ms": lag_p99,
+            "loop_lag_max_ms": _ms(max(step["loop_lag"])) if step["loop_lag"] else None,
+            "rss_start_mb": rss[0] if rss else None,
+            "rss_max_mb": max(rss) if rss else None,
+            "rss_end_mb": rss[-1] if rss else None,
+            "saturated": bool(reasons),
+            "saturation_reasons": reasons,
+            "errors": step["errors"][:20],
+            "timeline": step["timeline"]
+        }
+
+    async def run(self, rates: List[float], step_seconds: float, keep_going: bool = False) -> Dict[str, Any]:
+        import httpx
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=200)
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=60, limits=limits) as client:
+            await self.wait_ready(client)
+            steps = []
+            for rate in rates:
+                print(f"--- {rate:g} jobs/min for {step_seconds:g}s")
+                result = await self.run_step(client, rate, step_seconds)
+                print(format_step(result))
+                steps.append(result)
+                if result["saturated"] and not keep_going:
+                    break
+        return {"steps": steps, "saturation": saturation_point(steps)}
+
+
+def saturation_point(steps: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """最後一個未飽和的到達率與第一個飽和的到達率"""
+    sustained = [s for s in steps if not s["saturated"]]
+    saturated = next((s for s in steps if s["saturated"]), None)
+    return {
+        "max_sustained_rate_per_min": sustained[-1]["rate_per_min"] if sustained else None,
+        "max_sustained_jobs_per_hour": sustained[-1]["jobs_per_hour"] if sustained else None,
+        "saturated_at_rate_per_min": saturated["rate_per_min"] if saturated else None,
+        "reasons": saturated["saturation_reasons"] if saturated else []
+    }
+
+
+def format_step(s: Dict[str, Any]) -> str:
+    flag = "SATURATED: " + "; ".join(s["saturation_reasons"]) if s["saturated"] else "ok"
+    return (
+        f"    {s['jobs_per_hour']:.0f} jobs/h (offered {s['offered_jobs_per_hour']:.0f}), "
+        f"done {s['completed']}/{s['submitted']} | status p50 {s['status_p50_ms']}ms p99 {s['status_p99_ms']}ms | "
+        f"loop lag p99 {s['loop_lag_p99_ms']}ms max {s['loop_lag_max_ms']}ms | "
+        f"RSS {s['rss_start_mb']} -> {s['rss_max_mb']} MB | {flag}"
+    )
+
+
+COMPARED_METRICS = ("jobs_per_hour", "status_p50_ms", "status_p99_ms", "loop_lag_p99_ms", "rss_max_mb")
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    """依到達率對齊兩次結果，列出各指標的變化（current - baseline）"""
+    previous = {s["rate_per_min"]: s for s in baseline.get("steps", [])}
+    steps = []
+    for step in current["steps"]:
+        before = previous.get(step["rate_per_min"])
+        if before is None:
+            continue
+        diff = {"rate_per_min": step["rate_per_min"]}
+        for key in COMPARED_METRICS:
+            if step.get(key) is not None and before.get(key) is not None:
+                diff[key] = {"baseline": before[key], "current": step[key], "delta": round(step[key] - before[key], 2)}
+        steps.append(diff)
+    return {
+        "baseline_created_at": baseline.get("created_at"),
+        "steps": steps,
+        "saturation": {
+            "baseline": baseline.get("saturation", {}).get("max_sustained_rate_per_min"),
+            "current": current["saturation"]["max_sustained_rate_per_min"]
+        }
+    }
+
+
+def _start_server(port: int, args, root: Path) -> subprocess.Popen:
+    env = dict(os.environ, JOB_QUEUE_URL="", WARMUP_ON_STARTUP="")
+    for key, sub in SETTING_DIRS.items():
+        env[key] = str(root / sub)
+    cmd = [
+        sys.executable, str(Path(__file__).resolve()), "--serve", "--port", str(port),
+        "--latency-scale", str(args.latency_scale), "--sentences", str(args.sentences),
+        "--clips-per-sentence", str(args.clips_per_sentence)
+    ]
+    # 以 package 方式 import（與 uvicorn video_pipeline.main:app 相同）
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(Path(__file__).resolve().parent.parent), env.get("PYTHONPATH")]))
+    return subprocess.Popen(cmd, env=env)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI Video Pipeline API load test")
+    parser.add_argument("--serve", action="store_true", help="只啟動 stub API（load test 子 process 使用）")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--url", default=None, help="對既有的 API 測試（不啟動 stub API）")
+    parser.add_argument("--rates", default="30,60,120,240", help="逗號分隔的到達率（jobs / 分鐘），由低到高")
+    parser.add_argument("--step-seconds", type=float, default=60)
+    parser.add_argument("--drain-seconds", type=float, default=120)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--upload-kb", type=int, default=64)
+    parser.add_argument("--mode", default="full", choices=("full", "draft"))
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="stub provider 延遲倍率")
+    parser.add_argument("--sentences", type=int, default=6)
+    parser.add_argument("--clips-per-sentence", type=int, default=3)
+    parser.add_argument("--max-status-p99-ms", type=float, default=500)
+    parser.add_argument("--max-loop-lag-p99-ms", type=float, default=100)
+    parser.add_argument("--min-completion", type=float, default=0.9)
+    parser.add_argument("--keep-going", action="store_true", help="飽和後仍繼續跑更高的到達率")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline-out", default=None, help="把結果存成 baseline JSON")
+    parser.add_argument("--compare", default=None, help="與之前的 baseline JSON 比較")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.latency_scale, args.sentences, args.clips_per_sentence)
+        return
+
+    rates = [float(r) for r in args.rates.split(",") if r.strip()]
+    server = None
+    tmp = None
+    base_url = args.url
+    if base_url is None:
+        tmp = tempfile.TemporaryDirectory(prefix="loadtest_")
+        server = _start_server(args.port, args, Path(tmp.name))
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    runner = LoadRunner(
+        base_url, poll_interval=args.poll_interval, drain_seconds=args.drain_seconds,
+        upload_bytes=args.upload_kb * 1024, mode=args.mode, seed=args.seed,
+        max_status_p99_ms=args.max_status_p99_ms, max_loop_lag_p99_ms=args.max_loop_lag_p99_ms,
+        min_completion=args.min_completion
+    )
+    try:
+        result = asyncio.run(runner.run(rates, args.step_seconds, args.keep_going))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        if tmp is not None:
+            tmp.cleanup()
+
+    result = dict(
+        {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+            "config": {k: v for k, v in vars(args).items() if k not in ("serve", "baseline_out", "compare")}
+        },
+        **result
+    )
+    sat = result["saturation"]
+    print(f"=== max sustained: {sat['max_sustained_rate_per_min']} jobs/min "
+          f"({sat['max_sustained_jobs_per_hour']} jobs/h); saturated at: {sat['saturated_at_rate_per_min']}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            result["comparison"] = compare(result, json.load(f))
+        for diff in result["comparison"]["steps"]:
+            changes = ", ".join(f"{k} {v['baseline']} -> {v['current']}" for k, v in diff.items() if isinstance(v, dict))
+            print(f"    {diff['rate_per_min']:g} jobs/min: {changes}")
+        print(f"    max sustained rate: {result['comparison']['saturation']['baseline']} -> "
+              f"{result['comparison']['saturation']['current']}")
+
+    if args.baseline_out:
+        with open(args.baseline_out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"baseline written to {args.baseline_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,11 +14,32 @@ File description (English):
 注意 / Notes:
     - Imports like `from services...` assume this module runs with the project root on `PYTHONPATH`.
       If you run via `python -m video_pipeline.main` or with a proper package entry, imports should resolve.
-    - 目前以 in-memory `jobs` 儲存狀態；多人或多程序部署時請改用共享儲存（Redis/DB）。
+    - 目前以 in-memory `jobs`（`utils/job_store.py`）儲存狀態，完成的 job 過期後 spill 到磁碟；
+      多人或多程序部署時請改用共享儲存（Redis/DB）。
+    - 設定 `JOB_QUEUE_URL` 後 job 改由 `worker.py` 從共享隊列執行，狀態經 heartbeat 回報。
+    - 服務模組經 `registry` 延遲載入；匯入本檔不會載入 whisper / torch 等重型依賴。
+      可用 `/api/warmup` 預先載入，`/api/startup` 查看各模組載入時間。
 """
+import copy
+import math
+import shutil
+import time
+
+# 啟動時間量測 / startup timing breakdown (ms per import block)
+_BOOT_STARTED = time.perf_counter()
+_last_mark = _BOOT_STARTED
+STARTUP_TIMINGS = {}
+
+
+def _mark(name: str):
+    global _last_mark
+    now = time.perf_counter()
+    STARTUP_TIMINGS[name] = round((now - _last_mark) * 1000, 2)
+    _last_mark = now
+
 
 try:
-    from fastapi import FastAPI, File, UploadFile, BackgroundTasks, HTTPException
+    from fastapi import FastAPI, File, Form, UploadFile, BackgroundTasks, HTTPException
     from fastapi.responses import JSONResponse
     HAVE_FASTAPI = True
 except Exception:
@@ -42,6 +63,9 @@ except Exception:
     def File(*args, **kwargs):  # type: ignore
         return None
 
+    def Form(*args, **kwargs):  # type: ignore
+        return None
+
     class UploadFile:  # type: ignore
         filename: str = ""
 
@@ -59,8 +83,9 @@ except Exception:
     class JSONResponse:  # type: ignore
         def __init__(self, *args, **kwargs):
             pass
+_mark("fastapi")
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 import os
 import json
 import asyncio
@@ -70,14 +95,17 @@ from pathlib import Path
 # 假設其他模塊已寫好（下面會提供）
 # Use package-qualified imports when possible; fall back to local imports when running as script.
 try:
-    from video_pipeline.config import settings
+    from video_pipeline.config import settings, ensure_dirs, render_profile
 except Exception:
-    from config import settings
+    from config import settings, ensure_dirs, render_profile
+
+_mark("config")
 
 try:
     from video_pipeline.models import *
 except Exception:
     from models import *
+_mark("models")
 
 def _import(name: str, attr: str):
     try:
@@ -100,7 +128,10 @@ def _import(name: str, attr: str):
                 async def extract_audio(self, video_path: str):
                     return str(Path(video_path).with_suffix('.wav'))
 
-                async def transcribe(self, audio_path: str):
+                async def extract_pcm(self, video_path: str, *a, **k):
+                    return str(Path(video_path).with_suffix('.wav'))
+
+                async def transcribe(self, audio_path: str, *a, **k):
                     return []
 
                 def count_all(self, transcript, duration):
@@ -127,6 +158,9 @@ def _import(name: str, attr: str):
                 async def check_safety(self, *a, **k):
                     return {"raw": "safe"}
 
+                async def check_safety_batch(self, items):
+                    return [{"clip_id": i["clip_id"], "status": "ok"} for i in items]
+
                 async def unify_style_and_prompts(self, *a, **k):
                     return {"summary": "", "per_sentence": []}
 
@@ -135,41 +169,268 @@ def _import(name: str, attr: str):
 
             return _Stub
 
-VideoProcessor = _import('services.video_processor', 'VideoProcessor')
-TranscriptionService = _import('services.transcription', 'TranscriptionService')
-SyllableCounter = _import('services.syllable_counter', 'SyllableCounter')
-FrameExtractor = _import('services.frame_extractor', 'FrameExtractor')
-QwenService = _import('services.qwen_service', 'QwenService')
-ChatGPTService = _import('services.chatgpt_service', 'ChatGPTService')
-ImageGenService = _import('services.image_gen', 'ImageGenService')
-VideoGenService = _import('services.video_gen', 'VideoGenService')
-TTSService = _import('services.tts_service', 'TTSService')
-MusicService = _import('services.music_service', 'MusicService')
-VideoAssembler = _import('services.video_assembly', 'VideoAssembler')
-FileManager = _import('utils.file_manager', 'FileManager')
-retry_with_limit = _import('utils.retry_handler', 'retry_with_limit')
+try:
+    from video_pipeline.utils.service_registry import ServiceRegistry
+except Exception:
+    from utils.service_registry import ServiceRegistry
+
+# 服務在第一次使用時才 import / 建立（singleton）；名稱照舊可直接呼叫，e.g. `TranscriptionService()`
+registry = ServiceRegistry(_import)
+VideoProcessor = registry.register('video_processor', 'services.video_processor', 'VideoProcessor')
+TranscriptionService = registry.register('transcription', 'services.transcription', 'TranscriptionService')
+SyllableCounter = registry.register('syllable_counter', 'services.syllable_counter', 'SyllableCounter')
+FrameExtractor = registry.register('frame_extractor', 'services.frame_extractor', 'FrameExtractor')
+QwenService = registry.register('qwen', 'services.qwen_service', 'QwenService')
+ChatGPTService = registry.register('chatgpt', 'services.chatgpt_service', 'ChatGPTService')
+ImageGenService = registry.register('image_gen', 'services.image_gen', 'ImageGenService')
+VideoGenService = registry.register('video_gen', 'services.video_gen', 'VideoGenService')
+TTSService = registry.register('tts', 'services.tts_service', 'TTSService')
+MusicService = registry.register('music', 'services.music_service', 'MusicService')
+VideoAssembler = registry.register('video_assembly', 'services.video_assembly', 'VideoAssembler')
+FileManager = registry.register('file_manager', 'utils.file_manager', 'FileManager', singleton=False)
+retry_with_limit = registry.register('retry_handler', 'utils.retry_handler', 'retry_with_limit', singleton=False)
+
+try:
+    from video_pipeline.utils.job_queue import load_job_queue, to_jsonable
+    from video_pipeline.utils.job_store import JobStore
+    from video_pipeline.utils.media_executor import get_media_executor
+    from video_pipeline.utils.render_manifest import CLIP_ID_RE, RenderManifest
+    from video_pipeline.utils.storage import get_storage, new_job_id
+    from video_pipeline.utils.prompt_cache import get_prompt_cache
+    from video_pipeline.utils.profiling import JobProfiler, profiling_available
+    from video_pipeline.utils.artifacts import settle
+    from video_pipeline.utils.pcm import PCMBuffer, pcm_available
+    from video_pipeline.utils.batch import BatchStore, new_batch_id, save_upload, hash_file, resolve_manifest_path
+except Exception:
+    from utils.job_queue import load_job_queue, to_jsonable
+    from utils.job_store import JobStore
+    from utils.media_executor import get_media_executor
+    from utils.render_manifest import CLIP_ID_RE, RenderManifest
+    from utils.storage import get_storage, new_job_id
+    from utils.prompt_cache import get_prompt_cache
+    from utils.profiling import JobProfiler, profiling_available
+    from utils.artifacts import settle
+    from utils.pcm import PCMBuffer, pcm_available
+    from utils.batch import BatchStore, new_batch_id, save_upload, hash_file, resolve_manifest_path
+
+_mark("registry")
 
 app = FastAPI(title="AI Video Pipeline", version="1.0.0")
 
 # 全局 job 狀態（生產環境用 Redis/DB）
-jobs: Dict[str, Dict[str, Any]] = {}
+# 完成的 job 超過 TTL / memory budget 後，大型 artifact 會寫到 JOB_STATE_DIR，記憶體只留摘要
+jobs = JobStore(
+    settings.JOB_STATE_DIR,
+    ttl_seconds=settings.JOB_TTL_SECONDS,
+    memory_budget_bytes=int(settings.JOB_MEMORY_BUDGET_MB * 1024 * 1024)
+)
+
+# batch 提交（內容去重後對應到 job）
+batches = BatchStore()
+
+# 共享隊列（設定 JOB_QUEUE_URL 後由 worker.py 執行 job / stage）
+_job_queue = None
+
+
+def get_job_queue():
+    """第一次使用時才建立隊列；未設定 JOB_QUEUE_URL 時回傳 None"""
+    global _job_queue
+    if _job_queue is None and getattr(settings, "JOB_QUEUE_URL", ""):
+        _job_queue = load_job_queue(settings.JOB_QUEUE_URL)
+    return _job_queue
+
+
+if HAVE_FASTAPI:
+    @app.on_event("startup")
+    async def _on_startup():
+        STARTUP_TIMINGS["ready_ms"] = round((time.perf_counter() - _BOOT_STARTED) * 1000, 2)
+        # 背景預載設定的服務；不阻塞 API 接收上傳
+        names = [n.strip() for n in getattr(settings, "WARMUP_ON_STARTUP", "").split(",") if n.strip()]
+        if names:
+            asyncio.create_task(asyncio.to_thread(registry.warmup, names))
+        asyncio.create_task(_sweep_jobs_forever())
+
+
+async def _sweep_jobs_forever():
+    """定期把過期的已完成 job spill 到磁碟，並依保留期限清理中間檔"""
+    while True:
+        await asyncio.sleep(settings.JOB_SWEEP_INTERVAL)
+        try:
+            await _reconcile_queued_jobs()
+            jobs.sweep()
+            await asyncio.to_thread(get_storage().gc, _active_job_ids())
+        except Exception as e:
+            print(f"job sweep failed: {e}")
+
+
+def _active_job_ids() -> List[str]:
+    return [job_id for job_id in jobs if jobs[job_id].get("status") not in ("completed", "failed")]
+
+
+TERMINAL_TASK_STATUSES = ("done", "failed")
+
+
+def _merge_task(job_id: str, task: Dict[str, Any]) -> Dict[str, Any]:
+    """本地紀錄 + 隊列中的 pipeline task（worker 透過 heartbeat 回報的狀態比本地紀錄新）"""
+    record = dict(jobs.get(job_id) or task["payload"].get("record") or {})
+    record.update(task.get("state") or {})
+    if task["status"] == "failed" and record.get("status") != "failed":
+        record["status"] = "failed"
+        record["errors"] = list(record.get("errors") or []) + [task.get("error") or "worker failed"]
+    record["queue"] = {
+        "status": task["status"],
+        "attempts": task["attempts"],
+        "worker": task["lease_owner"]
+    }
+    return record
+
+
+def _needs_reconcile(job_id: str) -> bool:
+    """交給 worker 的 job 在本地停在 queued，直到 task 結束後寫回"""
+    return job_id not in jobs or jobs[job_id].get("status") == "queued"
+
+
+async def _job_view(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    job 目前的狀態（找不到時回傳 None）；worker 執行的 job 合併隊列狀態，
+    task 結束（done / failed）時把結果寫回 `jobs`，之後 GC、spill、promote、rerender 都以本地紀錄為準
+    """
+    queue = get_job_queue()
+    task = None
+    if queue is not None and _needs_reconcile(job_id):
+        task = await asyncio.to_thread(queue.get, job_id)
+    if job_id not in jobs and task is None and jobs.restore(job_id) is None:
+        return None
+    if task is None:
+        return jobs[job_id]
+
+    record = _merge_task(job_id, task)
+    if task["status"] in TERMINAL_TASK_STATUSES:
+        jobs[job_id] = record
+        return jobs[job_id]
+    return record
+
+
+async def _reconcile_queued_jobs():
+    """把已結束的 worker job 寫回本地紀錄（sweep / GC 前執行）"""
+    if get_job_queue() is None:
+        return
+    for job_id in [j for j in jobs if _needs_reconcile(j)]:
+        await _job_view(job_id)
+
+
+@app.get("/api/startup")
+async def get_startup_timings():
+    """啟動時間明細：各 import 區塊與已載入服務的 import / init 時間（ms）"""
+    return {
+        "boot": STARTUP_TIMINGS,
+        "services": {
+            name: dict(registry.timings.get(name, {}), loaded=registry.is_loaded(name))
+            for name in registry.names()
+        }
+    }
+
+
+@app.post("/api/warmup")
+async def warmup(names: Optional[str] = None):
+    """
+    預先載入服務（逗號分隔，e.g. `transcription,chatgpt`；留空 = 全部）
+    在 thread 中執行，避免 Whisper 載入時卡住 event loop。
+    """
+    selected = [n.strip() for n in names.split(",") if n.strip()] if names else None
+    started = time.perf_counter()
+    report = await asyncio.to_thread(registry.warmup, selected)
+    return {"services": report, "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+
+@app.get("/api/asr/stats")
+async def get_asr_stats():
+    """本 process 內各 ASR backend / model 的累計 real-time factor（處理時間 / 音訊長度）"""
+    if not registry.is_loaded("transcription"):
+        return {"backends": {}}
+    return {"backends": getattr(TranscriptionService(), "stats", {})}
+
+
+@app.get("/api/media/stats")
+async def get_media_stats():
+    """共用 ffmpeg executor 的並行上限、執行中 / 排隊數與各優先級累計時間"""
+    return get_media_executor().snapshot()
+
+
+@app.get("/api/cache/images")
+async def get_image_cache_stats():
+    """跨 job 生圖快取：項目數、已通過 / 未通過檢查的數量與執行中 job 的命中統計"""
+    cache = get_prompt_cache()
+    if cache is None:
+        return {"enabled": False}
+    return dict(await asyncio.to_thread(cache.summary), enabled=True)
+
+
+def _check_mode(mode: str):
+    if mode not in ("full", "draft"):
+        raise HTTPException(status_code=400, detail="mode must be 'full' or 'draft'")
+
+
+def _init_job(job_id: str, video_path: str, title: Optional[str], options: Dict[str, Any]):
+    jobs[job_id] = {
+        "status": "started",
+        "video_path": video_path,
+        "title": title or f"video_{job_id}",
+        "job_dir": str(get_storage().job_dir(job_id, create=False)),
+        "current_step": "uploading",
+        "progress": 0,
+        "errors": [],
+        "warnings": [],
+        "options": options
+    }
+
+
+async def _enqueue_job(job_id: str, video_path: str, title: Optional[str]) -> bool:
+    """有共享隊列時放進隊列並回傳 True；沒有隊列時回傳 False（由呼叫端在本 process 執行）"""
+    queue = get_job_queue()
+    if queue is None:
+        return False
+    jobs[job_id]["status"] = "queued"
+    await asyncio.to_thread(
+        queue.enqueue,
+        "pipeline",
+        {"job_id": job_id, "video_path": video_path, "title": title, "record": jobs[job_id]},
+        job_id,
+        settings.WORKER_MAX_ATTEMPTS
+    )
+    return True
 
 
 @app.post("/api/pipeline/start")
 async def start_pipeline(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    title: Optional[str] = None
+    title: Optional[str] = None,
+    segment_parallel: Optional[bool] = None,
+    asr_backend: Optional[str] = None,
+    asr_model: Optional[str] = None,
+    mode: str = "full",
+    profile: bool = False
 ):
     """
     啟動完整 pipeline
+
+    - segment_parallel: 長片切段並行 ASR（None = 依 SEGMENT_MIN_DURATION 自動判斷）
+    - asr_backend / asr_model: 這個 job 使用的 ASR backend（whisper / faster-whisper）與 model 大小
+      （None = settings.ASR_BACKEND / WHISPER_MODEL）
+    - mode: "full"（預設）或 "draft"（低解析度、每句少量 clip、不做 ChatGPT 二次判斷、快速編碼；
+      完成後可用 `/api/pipeline/promote/{job_id}` 升級成完整版）
+    - profile: 以 pyinstrument 取樣這個 job，flamegraph 與各 stage 摘要存到 job 目錄（需安裝 pyinstrument）；
+      job 在自己的 thread / event loop 執行，profiling hook 不影響同 process 的其他 job
     """
-    job_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+    _check_mode(mode)
+    if profile and not profiling_available():
+        raise HTTPException(status_code=400, detail="profile=true requires pyinstrument to be installed")
+    job_id = new_job_id()
     
     # 儲存上傳檔案
-    upload_path = Path(settings.UPLOAD_DIR) / job_id
-    upload_path.mkdir(parents=True, exist_ok=True)
-    video_path = upload_path / file.filename
+    ensure_dirs()
+    video_path = get_storage().upload_path(job_id, file.filename)
     
     with open(video_path, "wb") as f:
         content = await file.read()
@@ -179,16 +440,19 @@ async def start_pipeline(
     # Note: reading the whole uploaded file into memory may cause high memory usage for large files.
     
     # 初始化 job 狀態
-    jobs[job_id] = {
-        "status": "started",
-        "video_path": str(video_path),
-        "title": title or f"video_{job_id}",
-        "current_step": "uploading",
-        "progress": 0,
-        "errors": [],
-        "warnings": []
-    }
+    _init_job(job_id, str(video_path), title, {
+        "segment_parallel": segment_parallel,
+        "asr_backend": asr_backend,
+        "asr_model": asr_model,
+        "mode": mode,
+        "profile": profile
+    })
     
+    # 有共享隊列時交給 worker；否則在本 process 背景執行
+    # With a shared queue the job goes to a worker; otherwise it runs in this process.
+    if await _enqueue_job(job_id, str(video_path), title):
+        return {"job_id": job_id, "message": "Pipeline queued"}
+
     # 背景執行
     # BackgroundTasks 可以接受 coroutine function；FastAPI/Starlette 會將其排程執行。
     # BackgroundTasks accepts coroutine functions; Starlette will schedule them on the event loop.
@@ -197,21 +461,325 @@ async def start_pipeline(
     return {"job_id": job_id, "message": "Pipeline started"}
 
 
+@app.post("/api/pipeline/batch")
+async def start_batch(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(default=[]),
+    manifest: Optional[str] = Form(default=None),
+    segment_parallel: Optional[bool] = None,
+    asr_backend: Optional[str] = None,
+    asr_model: Optional[str] = None,
+    mode: str = "full"
+):
+    """
+    一次提交多支影片（整個系列）
+
+    - files: 多個上傳檔
+    - manifest: JSON 陣列 `[{"path": "ep01.mp4", "title": "..."}]`，path 為 BATCH_MANIFEST_ROOT 底下的檔案
+    - 內容相同（sha256）的來源只建立一個 job，重複項目指向同一個 job_id
+    - batch 內的 job 共用 BATCH_MAX_CONCURRENT_JOBS 個並行名額（有共享隊列時交給 worker）
+    """
+    _check_mode(mode)
+    try:
+        entries = json.loads(manifest) if manifest else []
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"invalid manifest: {e}")
+    if not isinstance(entries, list) or not all(isinstance(e, dict) and e.get("path") for e in entries):
+        raise HTTPException(status_code=400, detail="manifest must be a list of {\"path\", \"title\"} objects")
+    if not files and not entries:
+        raise HTTPException(status_code=400, detail="no files or manifest entries")
+
+    ensure_dirs()
+    options = {
+        "segment_parallel": segment_parallel,
+        "asr_backend": asr_backend,
+        "asr_model": asr_model,
+        "mode": mode
+    }
+    batch_id = new_batch_id()
+    batch = batches.create(batch_id, options)
+    storage = get_storage()
+    pending: List[Dict[str, Any]] = []
+
+    def add(name: str, content_hash: str, job_id: str, video_path: str, title: Optional[str]):
+        item = batches.add_item(batch, name, content_hash, job_id, title)
+        if item["new"]:
+            _init_job(job_id, video_path, title, dict(options, batch_id=batch_id))
+            pending.append({"job_id": job_id, "video_path": video_path, "title": title})
+        return item
+
+    for upload in files:
+        job_id = new_job_id()
+        video_path = storage.upload_path(job_id, upload.filename)
+        content_hash = await save_upload(upload, video_path)
+        item = add(upload.filename, content_hash, job_id, str(video_path), None)
+        if not item["new"]:
+            # 重複內容：刪掉多存的一份
+            shutil.rmtree(video_path.parent, ignore_errors=True)
+
+    for entry in entries:
+        try:
+            source = resolve_manifest_path(settings.BATCH_MANIFEST_ROOT, str(entry["path"]))
+            content_hash = await asyncio.to_thread(hash_file, source)
+        except (OSError, ValueError) as e:
+            batches.add_item(batch, str(entry["path"]), "", None, entry.get("title"), error=str(e))
+            continue
+        add(str(entry["path"]), content_hash, new_job_id(), str(source), entry.get("title"))
+
+    if pending:
+        background_tasks.add_task(run_batch, batch_id, pending)
+    return batches.summary(batch, jobs)
+
+
+@app.get("/api/pipeline/batch/{batch_id}")
+async def get_batch_status(batch_id: str):
+    """batch 整體進度：unique job 的平均 progress、狀態計數、每個項目對應的 job"""
+    batch = batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    # 交給 worker 的 job 要合併隊列狀態，否則一直停在 queued / 0%
+    job_ids = dict.fromkeys(i["job_id"] for i in batch["items"] if i.get("job_id"))
+    views = await asyncio.gather(*(_job_view(job_id) for job_id in job_ids))
+    return batches.summary(batch, {job_id: view for job_id, view in zip(job_ids, views) if view is not None})
+
+
+async def run_batch(batch_id: str, pending: List[Dict[str, Any]]):
+    """依 BATCH_MAX_CONCURRENT_JOBS 並行執行 batch 內的 unique job；有共享隊列時全部交給 worker"""
+    limit = asyncio.Semaphore(max(1, int(settings.BATCH_MAX_CONCURRENT_JOBS)))
+
+    async def run_one(spec: Dict[str, Any]):
+        if await _enqueue_job(spec["job_id"], spec["video_path"], spec["title"]):
+            return
+        async with limit:
+            await run_pipeline(spec["job_id"], spec["video_path"], spec["title"])
+
+    await asyncio.gather(*(run_one(spec) for spec in pending))
+
+
 @app.get("/api/pipeline/status/{job_id}")
 async def get_status(job_id: str):
     """查詢 job 狀態"""
-    if job_id not in jobs:
+    record = await _job_view(job_id)
+    if record is None:
         raise HTTPException(status_code=404, detail="Job not found")
-    return jobs[job_id]
+    return record
+
+
+@app.get("/api/pipeline/artifact/{job_id}/{name}")
+async def get_artifact(job_id: str, name: str):
+    """讀取單一 artifact（transcript / new_script / unified_data ...）；已 spill 的從磁碟載入"""
+    if job_id not in jobs and jobs.restore(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    record = jobs[job_id]
+    try:
+        value = record[name]
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Artifact not found: {name}")
+    return {"job_id": job_id, "name": name, "value": to_jsonable(value)}
+
+
+@app.post("/api/pipeline/promote/{job_id}")
+async def promote(job_id: str, background_tasks: BackgroundTasks):
+    """把完成的草稿 job 以完整品質重跑生圖 / 圖生影片 / 組裝（其餘步驟沿用草稿結果）"""
+    view = await _job_view(job_id)
+    if view is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    # worker 仍在執行的 job 只有合併後的 view，下面的狀態檢查會回 409
+    record = jobs.get(job_id) or view
+    if (record.get("options") or {}).get("mode") != "draft":
+        raise HTTPException(status_code=409, detail="Job is not a draft")
+    if record.get("status") != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is {record.get('status')}")
+    record["status"] = "promoting"
+    background_tasks.add_task(promote_job, job_id)
+    return {"job_id": job_id, "message": "Promote started"}
+
+
+def _known_clip_ids(record: Dict[str, Any], manifest: RenderManifest) -> set:
+    """manifest 內的 clip，加上分鏡規劃的所有 clip（含之前被移到 bad_img、不在 manifest 的）"""
+    known = set(manifest.clips)
+    for sentence in (record.get("unified_data") or {}).get("per_sentence") or []:
+        known.update(clip["clip_id"] for clip in sentence.get("clips") or [])
+    return known
+
+
+@app.post("/api/pipeline/rerender/{job_id}")
+async def rerender(
+    job_id: str,
+    background_tasks: BackgroundTasks,
+    clip_id: Optional[str] = None,
+    file: Optional[UploadFile] = File(None),
+    force: Optional[str] = None
+):
+    """
+    增量重新算圖（只重新編碼變動的 clip）
+
+    - clip_id + file: 用上傳的圖取代該 clip 的圖（不在 manifest 內的 clip，例如之前被移到 bad_img 的，會依 clip_id 順序插入）
+    - force: 逗號分隔的 clip_id，不論 hash 是否改變都重新編碼
+    - 不帶參數時，重新掃描所有圖檔（例如直接在磁碟上換掉 img/ 內的檔案）
+    """
+    view = await _job_view(job_id)
+    if view is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    # worker 仍在執行的 job 只有合併後的 view，下面的狀態檢查會回 409
+    record = jobs.get(job_id) or view
+    if record.get("status") not in ("completed", "failed"):
+        raise HTTPException(status_code=409, detail=f"Job is {record.get('status')}")
+
+    storage = get_storage()
+    manifest = RenderManifest(storage.job_dir(job_id))
+    if not manifest.clips:
+        raise HTTPException(status_code=409, detail="Job has no render manifest")
+    if file is not None:
+        if not clip_id:
+            raise HTTPException(status_code=400, detail="clip_id is required with file")
+        # clip_id 會組進檔名：只接受 "07b" 這種格式，且必須是這個 job 的 clip
+        if CLIP_ID_RE.fullmatch(clip_id) is None or clip_id not in _known_clip_ids(record, manifest):
+            raise HTTPException(status_code=400, detail=f"Unknown clip_id: {clip_id}")
+        img_path = storage.job_path(job_id, "img") / f"clip_{clip_id}.jpg"
+        await save_upload(file, img_path)
+        # 一律改指向上傳的圖、hash 留空，generate_clips 會重新編碼它：新加入的 clip（例如之前被移到 bad_img 的），
+        # 以及 CLIP_VARIATIONS 下原本指向 parent 圖的 sibling clip
+        manifest.set_clip(clip_id, str(img_path), "", "")
+        manifest.save()
+
+    forced = [c.strip() for c in (force or "").split(",") if c.strip()]
+    record["status"] = "rerendering"
+    background_tasks.add_task(rerender_job, job_id, forced)
+    return {"job_id": job_id, "message": "Rerender started"}
+
+
+@app.get("/api/pipeline/storage/{job_id}")
+async def get_job_storage(job_id: str):
+    """job 的磁碟用量（依子目錄 / 檔案分列）"""
+    return await asyncio.to_thread(get_storage().disk_usage, job_id)
+
+
+@app.post("/api/storage/gc")
+async def run_storage_gc(intermediate_hours: Optional[float] = None, job_days: Optional[float] = None):
+    """
+    立即清理：超過 intermediate_hours 的 job 刪中間檔（img_raw / segments / concat.txt / temp_video.mp4），
+    超過 job_days 的整個刪除；未指定時用 STORAGE_* 設定。執行中的 job 不受影響。
+    """
+    await _reconcile_queued_jobs()
+    return await asyncio.to_thread(
+        get_storage().gc,
+        _active_job_ids(),
+        intermediate_hours * 3600 if intermediate_hours is not None else None,
+        job_days * 86400 if job_days is not None else None
+    )
+
+
+@app.get("/api/jobs/stats")
+async def get_job_store_stats():
+    """in-process job 狀態的數量、spill 狀況與 memory budget"""
+    return jobs.stats()
+
+
+def _remote_stages() -> List[str]:
+    return [s.strip() for s in getattr(settings, "WORKER_STAGES", "").split(",") if s.strip()]
+
+
+async def run_stage(stage: str, payload: Dict[str, Any], job_id: str, local):
+    """
+    執行單一 stage：若該 stage 設定為交給 stage worker（WORKER_STAGES），
+    就放進共享隊列並等待結果；否則直接執行 `local()`。
+    """
+    queue = get_job_queue()
+    if queue is None or stage not in _remote_stages():
+        return await local()
+
+    task_id = f"{job_id}:{stage}"
+    existing = await asyncio.to_thread(queue.get, task_id)
+    if existing is not None and existing["status"] == "failed":
+        # 之前失敗過（例如 job 重跑），用新的 task id 重新排隊
+        task_id = f"{task_id}:{int(datetime.now().timestamp())}"
+        existing = None
+    if existing is None:
+        await asyncio.to_thread(
+            queue.enqueue, stage, payload, task_id, settings.WORKER_MAX_ATTEMPTS
+        )
+
+    while True:
+        task = await asyncio.to_thread(queue.get, task_id)
+        if task["status"] == "done":
+            return task["result"]
+        if task["status"] == "failed":
+            raise RuntimeError(f"stage {stage} failed on worker: {task.get('error')}")
+        await asyncio.sleep(settings.WORKER_POLL_INTERVAL)
+
+
+async def transcribe_audio(
+    audio: Any,
+    segments: Optional[List[dict]] = None,
+    backend: Optional[str] = None,
+    model: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    語音轉文字（stage worker 與本地共用）；有多段時各段並行轉寫後合併
+    audio: wav 路徑（stage worker）或本地的 PCM buffer
+    回傳 {"sentences": [...], "asr": {"backend", "model", "audio_seconds", "processing_seconds", "rtf"}}
+    """
+    transcriber = TranscriptionService()
+    run_info: Dict[str, Any] = {}
+    if segments and len(segments) > 1:
+        transcript = await transcriber.transcribe_segments(segments, backend, model, run_info)
+    else:
+        transcript = await transcriber.transcribe(audio, backend, model, run_info)
+    return {
+        "sentences": [s.model_dump() if hasattr(s, "model_dump") else s for s in transcript],
+        "asr": run_info
+    }
+
+
+def _use_segments(options: Dict[str, Any], duration: float) -> bool:
+    """job 明確指定時照辦；否則長度超過 SEGMENT_MIN_DURATION 才切段"""
+    if options.get("segment_parallel") is not None:
+        return bool(options["segment_parallel"])
+    return bool(getattr(settings, "SEGMENT_PARALLEL", True)) and duration >= getattr(settings, "SEGMENT_MIN_DURATION", 600)
+
+
+_pcm_fallback_logged = False
+
+
+def _use_pcm() -> bool:
+    """
+    音訊以記憶體中的 PCM 交給 ASR；transcription 交給 stage worker 時（另一台機器）
+    仍需要 wav 路徑，維持寫檔
+    """
+    global _pcm_fallback_logged
+    if not getattr(settings, "ASR_PCM_STREAM", True):
+        return False
+    if not pcm_available():
+        if not _pcm_fallback_logged:
+            _pcm_fallback_logged = True
+            print("ASR_PCM_STREAM is enabled but numpy is not installed; extracting audio to wav instead")
+        return False
+    return "transcription" not in _remote_stages()
 
 
 async def run_pipeline(job_id: str, video_path: str, title: str):
     """
-    主 pipeline 流程
+    主 pipeline 流程；job 開了 profile 時整個流程在 pyinstrument 取樣下執行
+    （沒開的 job 直接執行，沒有額外成本）
     """
+    if (jobs[job_id].get("options") or {}).get("profile"):
+        if not profiling_available():
+            # e.g. worker 節點沒有安裝 pyinstrument
+            jobs[job_id]["warnings"].append("profile: pyinstrument is not installed, running without profiling")
+            return await _run_pipeline(job_id, video_path, title)
+        profiler = JobProfiler(job_id, get_storage().job_dir(job_id), jobs[job_id])
+        await profiler.run(lambda: _run_pipeline(job_id, video_path, title))
+    else:
+        await _run_pipeline(job_id, video_path, title)
+
+
+async def _run_pipeline(job_id: str, video_path: str, title: str):
     # NOTE: Each service used below (VideoProcessor, TranscriptionService, etc.)
     # should implement appropriate error handling and timeouts.
     # 如果希望更細緻的錯誤回復/重試策略，可在各服務或此處加入 retry 機制。
+    options = jobs[job_id].get("options") or {}
+    profile = render_profile(options.get("mode") or "full")
     try:
         # 1. 影片預處理
         jobs[job_id]["current_step"] = "video_processing"
@@ -219,19 +787,45 @@ async def run_pipeline(job_id: str, video_path: str, title: str):
         
         processor = VideoProcessor()
         video_meta = await processor.extract_metadata(video_path)
-        audio_path = await processor.extract_audio(video_path)
+        use_segments = _use_segments(options, video_meta["duration"])
+        if _use_pcm():
+            # 一次 decode：ffmpeg stdout -> PCM buffer -> ASR（不寫 wav）；切段時放 shared memory 給 process pool
+            audio = await processor.extract_pcm(video_path, video_meta["duration"], shared=use_segments)
+        else:
+            audio = await processor.extract_audio(video_path)
+        audio_path = None if isinstance(audio, PCMBuffer) else audio
         
         jobs[job_id]["video_meta"] = video_meta
         jobs[job_id]["audio_path"] = audio_path
-        
-        # 2. 語音轉文字
-        jobs[job_id]["current_step"] = "transcription"
-        jobs[job_id]["progress"] = 15
-        
-        transcriber = TranscriptionService()
-        transcript = await transcriber.transcribe(audio_path)
+
+        try:
+            # 長片：在靜音 / keyframe 處切段，各段並行 ASR
+            segments = None
+            if use_segments:
+                segments = await processor.split_for_parallel(
+                    video_path, audio, video_meta["duration"], job_id
+                )
+                jobs[job_id]["segments"] = [{"start": s["start"], "end": s["end"]} for s in segments]
+            
+            # 2. 語音轉文字
+            jobs[job_id]["current_step"] = "transcription"
+            jobs[job_id]["progress"] = 15
+            
+            asr_backend, asr_model = options.get("asr_backend"), options.get("asr_model")
+            transcript_data = await run_stage(
+                "transcription",
+                {"audio_path": audio_path, "segments": segments, "backend": asr_backend, "model": asr_model},
+                job_id,
+                lambda: transcribe_audio(audio, segments, asr_backend, asr_model)
+            )
+        finally:
+            # ASR 完就釋放音訊 buffer（shared memory 一併 unlink）
+            if isinstance(audio, PCMBuffer):
+                audio.close()
+        transcript = [TranscriptSentence(**s) for s in transcript_data["sentences"]]
         
         jobs[job_id]["transcript"] = transcript
+        jobs[job_id]["asr"] = transcript_data.get("asr") or {}
         
         # 3. 計算發音數
         jobs[job_id]["current_step"] = "syllable_counting"
@@ -273,67 +867,371 @@ async def run_pipeline(job_id: str, video_path: str, title: str):
         jobs[job_id]["current_step"] = "style_unification"
         jobs[job_id]["progress"] = 55
         
+        # 串流回應中每句 prompt 一完成就先生圖，與後面句子的 LLM 生成重疊
+        prefetch = ImagePrefetcher(ImageGenService(), job_id, title, profile)
         unified_data = await chatgpt.unify_style_and_prompts(
-            analyzed_frames, new_script, syllable_data
+            analyzed_frames, new_script, syllable_data, on_sentence=prefetch.submit
         )
+        # 之後的步驟以 dict 存取；也與 spill / promote 後讀回的格式一致
+        unified_data = to_jsonable(unified_data)
         
         jobs[job_id]["unified_data"] = unified_data
+        jobs[job_id]["unify_stream"] = prefetch.stats
         
-        # 8. 文生圖
-        jobs[job_id]["current_step"] = "image_generation"
-        jobs[job_id]["progress"] = 65
-        
-        image_gen = ImageGenService()
-        images_result = await generate_images_with_safety(
-            image_gen, qwen, chatgpt, unified_data, job_id, title
-        )
-        
-        # 9. 圖生影片
-        jobs[job_id]["current_step"] = "video_generation"
-        jobs[job_id]["progress"] = 75
-        
-        video_gen = VideoGenService()
-        clips = await video_gen.generate_clips(images_result, job_id, title)
-        
-        # 10. TTS
-        jobs[job_id]["current_step"] = "tts_generation"
-        jobs[job_id]["progress"] = 85
+        # 8 ~ 12. 生圖 -> 圖生影片 -> TTS -> 音樂 -> 組裝
+        await render_outputs(job_id, title, unified_data, new_script, profile, prefetch)
         
+    except Exception as e:
+        jobs[job_id]["status"] = "failed"
+        jobs[job_id]["errors"].append(str(e))
+        print(f"Pipeline failed: {e}")
+    finally:
+        # 在生圖前失敗時，預取階段的快取統計也要收尾
+        await asyncio.to_thread(_finish_prompt_cache, job_id)
+        jobs[job_id]["disk_usage"] = (await asyncio.to_thread(get_storage().disk_usage, job_id))["total_bytes"]
+        # 超過 memory budget 時立即 spill，不等下一次定期 sweep
+        jobs.sweep()
+
+
+def _trim_sentence(sentence: Dict[str, Any], limit: int) -> Dict[str, Any]:
+    """每句只保留前 limit 個 clip，clip 長度平均分配到整句（原地修改）"""
+    kept = sentence["clips"][:limit]
+    for clip in kept:
+        clip["duration"] = max(float(sentence.get("duration") or 0.0) / len(kept), 1.0)
+    sentence["clips"] = kept
+    sentence["num_clips"] = len(kept)
+    return sentence
+
+
+def _apply_profile(unified_data: Dict[str, Any], profile: Dict[str, Any]) -> Dict[str, Any]:
+    """草稿模式：每句只保留前 N 個 clip，clip 長度平均分配到整句"""
+    limit = int(profile.get("max_clips_per_sentence") or 0)
+    if not limit:
+        return unified_data
+    data = copy.deepcopy(unified_data)
+    for sentence in data["per_sentence"]:
+        _trim_sentence(sentence, limit)
+    return data
+
+
+def _split_variations(render_data: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, List[Dict[str, Any]]]]:
+    """
+    相同 prompt 的 clip 只留第一個去生圖 / 安全檢查；其餘記在 siblings[第一個 clip_id]，
+    依序給 variation 1, 2, ...，在編碼時以鏡頭運動（zoompan）從同一張圖衍生
+    """
+    data = copy.deepcopy(render_data)
+    siblings: Dict[str, List[Dict[str, Any]]] = {}
+    first_by_prompt: Dict[str, str] = {}
+    for sentence in data["per_sentence"]:
+        kept = []
+        for clip in sentence["clips"]:
+            first = first_by_prompt.get(clip["prompt"])
+            if first is None:
+                first_by_prompt[clip["prompt"]] = clip["clip_id"]
+                kept.append(clip)
+            else:
+                group = siblings.setdefault(first, [])
+                group.append(dict(clip, variation=len(group) + 1))
+        sentence["clips"] = kept
+    return data, siblings
+
+
+class ImagePrefetcher:
+    """
+    統一風格串流期間，每收到一句就先為它的 clip 生圖（第一次嘗試）；
+    安全檢查階段用 `take()` 取回，prompt 相同才沿用，否則重新生成。
+    CLIP_VARIATIONS 開啟時每個 prompt 只生一張（以 prompt 為 key，不論最後由哪個 clip 代表）。
+    """
+
+    def __init__(self, image_gen: Any, job_id: str, title: str, profile: Dict[str, Any]):
+        self.image_gen = image_gen
+        self.job_id = job_id
+        self.title = title
+        self.profile = profile
+        self.started = time.perf_counter()
+        self._tasks: Dict[str, Any] = {}
+        self.by_prompt = bool(getattr(settings, "CLIP_VARIATIONS", True))
+        self._limit = asyncio.Semaphore(max(1, int(getattr(settings, "IMAGE_PREFETCH_CONCURRENCY", 4))))
+        self.stats: Dict[str, Any] = {"sentences": 0, "prefetched": 0, "used": 0, "first_sentence_seconds": None}
+
+    def submit(self, sentence: Any):
+        sentence = to_jsonable(sentence)
+        limit = int(self.profile.get("max_clips_per_sentence") or 0)
+        if limit:
+            sentence = _trim_sentence(sentence, limit)
+        if self.stats["first_sentence_seconds"] is None:
+            self.stats["first_sentence_seconds"] = round(time.perf_counter() - self.started, 3)
+        self.stats["sentences"] += 1
+        for clip in sentence["clips"]:
+            key = self._key(clip["clip_id"], clip["prompt"])
+            if key not in self._tasks:
+                task = asyncio.create_task(self._generate(clip["prompt"], clip["clip_id"]))
+                self._tasks[key] = (clip["prompt"], task)
+                self.stats["prefetched"] += 1
+
+    def _key(self, clip_id: str, prompt: str) -> str:
+        return prompt if self.by_prompt else clip_id
+
+    async def _generate(self, prompt: str, clip_id: str) -> str:
+        async with self._limit:
+            return await self.image_gen.generate(prompt, self.job_id, self.title, clip_id, profile=self.profile)
+
+    async def take(self, clip_id: str, prompt: str) -> Optional[str]:
+        """取回預先生成的圖；沒有、prompt 不同或生成失敗時回傳 None"""
+        entry = self._tasks.pop(self._key(clip_id, prompt), None)
+        if entry is None:
+            return None
+        if entry[0] != prompt:
+            entry[1].cancel()
+            return None
+        try:
+            img_path = await entry[1]
+        except Exception:
+            return None
+        self.stats["used"] += 1
+        return img_path
+
+    def cancel(self):
+        """沒用到的預先生圖（例如最後的 prompt 與串流時不同）"""
+        for _, task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+
+
+async def _gather_or_cancel(*coros):
+    """並行執行；任一個失敗就取消其他的（避免 producer 卡在已滿的 queue 上）"""
+    tasks = [asyncio.ensure_future(c) for c in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _render_audio(
+    job_id: str,
+    title: str,
+    unified_data: Dict[str, Any],
+    new_script: List[Any],
+    profile: Dict[str, Any]
+) -> Dict[str, Any]:
+    """TTS -> 音樂 -> 預先混音（不依賴圖片，與畫面分支並行）"""
+    record = jobs[job_id]
+
+    # 10. TTS
+    dialogue_audio = record.get("dialogue_audio")
+    if not dialogue_audio:
         tts = TTSService()
-        dialogue_audio = await tts.generate_dialogue(new_script, job_id, title)
-        
-        # 11. 音樂
-        jobs[job_id]["current_step"] = "music_generation"
-        jobs[job_id]["progress"] = 90
-        
+        dialogue_audio = await tts.generate_dialogue(new_script, job_id, title, warnings=record["warnings"])
+
+        # 用實際 TTS 時間軸對齊字幕
+        for sentence, timing in zip(new_script, dialogue_audio.get("sentence_timings", [])):
+            sentence.start = timing["start"]
+            sentence.end = timing["end"]
+            sentence.duration = timing["end"] - timing["start"]
+        record["dialogue_audio"] = dialogue_audio
+    
+    # 11. 音樂
+    music_path = record.get("music_path")
+    if not music_path:
         music_service = MusicService()
         music_path = await music_service.generate_and_cut_music(
-            unified_data["summary"], dialogue_audio["duration"], job_id, title
+            unified_data["summary"], dialogue_audio["duration"], job_id, title,
+            warnings=record["warnings"]
         )
-        
-        # 12. 最終組裝
-        jobs[job_id]["current_step"] = "final_assembly"
-        jobs[job_id]["progress"] = 95
-        
-        assembler = VideoAssembler()
-        final_video = await assembler.assemble(
+        record["music_path"] = music_path
+
+    # 先混好音，組裝時只剩 concat + mux
+    mix = await VideoAssembler().mix_audio(dialogue_audio, music_path, job_id, profile)
+    if "error" in mix:
+        record["warnings"].append(f"audio pre-mix: {mix['error']}")
+    return {"dialogue_audio": dialogue_audio, "music_path": music_path}
+
+
+async def render_outputs(
+    job_id: str,
+    title: str,
+    unified_data: Dict[str, Any],
+    new_script: List[Any],
+    profile: Dict[str, Any],
+    prefetch: Optional[ImagePrefetcher] = None
+) -> Dict[str, Any]:
+    """
+    生圖 -> 圖生影片 -> 組裝，TTS / 音樂與畫面分支並行（run_pipeline 與 promote 共用）
+
+    - 通過安全檢查的圖立即送進有上限的 queue（PIPELINE_QUEUE_SIZE），由 clip 編碼 worker 邊收邊編碼；
+      編碼跟不上時生圖會暫停（backpressure），而不是在記憶體 / 磁碟堆滿待編碼的圖
+    - 組裝只等最後一個 clip 與音訊分支
+    job 紀錄中已有的 TTS / 音樂結果直接沿用（與 render profile 無關）。
+    """
+    record = jobs[job_id]
+    cache = get_prompt_cache()
+    if cache is not None:
+        # 執行中即時更新；結束時換成含命中率的快照
+        record["prompt_cache"] = cache.job_stats(job_id)
+    render_data = _apply_profile(unified_data, profile)
+    order: Dict[str, int] = {}
+    durations: Dict[str, float] = {}
+    for sentence in render_data["per_sentence"]:
+        for clip in sentence["clips"]:
+            order[clip["clip_id"]] = len(order)
+            if clip.get("duration"):
+                durations[clip["clip_id"]] = clip["duration"]
+    total = max(1, len(order))
+
+    # 8 + 9. 文生圖 -> 圖生影片（逐 clip 串流）
+    record["current_step"] = "image_generation"
+    record["progress"] = 65
+    # 一個 prompt 只生一張圖，兄弟 clip 在編碼時以鏡頭運動衍生
+    siblings: Dict[str, List[Dict[str, Any]]] = {}
+    image_data = render_data
+    if getattr(settings, "CLIP_VARIATIONS", True):
+        image_data, siblings = _split_variations(render_data)
+    pipeline_stats = {
+        "clips": len(order), "unique_images": len(order) - sum(len(g) for g in siblings.values()),
+        "images_ok": 0, "clips_encoded": 0, "first_clip_seconds": None
+    }
+    record["render_pipeline"] = pipeline_stats
+    started = time.perf_counter()
+    clip_queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, int(settings.PIPELINE_QUEUE_SIZE)))
+
+    async def on_image_ok(item: Dict[str, Any]):
+        pipeline_stats["images_ok"] += 1
+        derived = [dict(item, clip_id=s["clip_id"], variation=s["variation"]) for s in siblings.get(item["clip_id"], [])]
+        for clip_item in [item] + derived:
+            if clip_item["clip_id"] in durations:
+                clip_item = dict(clip_item, duration=durations[clip_item["clip_id"]])
+            await clip_queue.put(clip_item)
+
+    def on_clip(clip: Dict[str, Any]):
+        if pipeline_stats["first_clip_seconds"] is None:
+            pipeline_stats["first_clip_seconds"] = round(time.perf_counter() - started, 3)
+        pipeline_stats["clips_encoded"] += 1
+        record["current_step"] = "video_generation"
+        record["progress"] = 65 + int(25 * pipeline_stats["clips_encoded"] / total)
+
+    async def produce_images() -> dict:
+        try:
+            return await generate_images_with_safety(
+                ImageGenService(), QwenService(), ChatGPTService(), image_data, job_id, title,
+                profile=profile, prefetch=prefetch, on_ok=on_image_ok
+            )
+        finally:
+            if prefetch is not None:
+                prefetch.cancel()
+            await clip_queue.put(None)
+
+    async def render_visual():
+        images_result, clips = await _gather_or_cancel(
+            produce_images(),
+            VideoGenService().generate_clips_stream(clip_queue, job_id, profile=profile, on_clip=on_clip)
+        )
+        return sorted(clips, key=lambda c: order[c["clip_id"]])
+
+    # 10 + 11. TTS / 音樂（與畫面分支並行）
+    try:
+        clips, audio = await _gather_or_cancel(
+            render_visual(), _render_audio(job_id, title, unified_data, new_script, profile)
+        )
+    finally:
+        await asyncio.to_thread(_finish_prompt_cache, job_id)
+    record["clips"] = clips
+    pipeline_stats["visual_audio_seconds"] = round(time.perf_counter() - started, 3)
+    
+    # 12. 最終組裝
+    record["current_step"] = "final_assembly"
+    record["progress"] = 95
+    
+    assembler = VideoAssembler()
+    final_video = await assembler.assemble(
+        clips=clips,
+        dialogue=audio["dialogue_audio"],
+        music=audio["music_path"],
+        srt_data=new_script,
+        job_id=job_id,
+        title=title,
+        profile=profile
+    )
+    
+    if final_video.get("renditions_error"):
+        record["warnings"].append(f"renditions: {final_video['renditions_error']}")
+    
+    # 完成（草稿的結果放在 preview_video，不覆寫 final_video）
+    record["status"] = "completed"
+    record["progress"] = 100
+    record["preview_video" if profile["mode"] == "draft" else "final_video"] = final_video
+    return final_video
+
+
+async def promote_job(job_id: str):
+    """
+    把草稿 job 升級成完整版：沿用 transcript、改寫後的 script、風格 / prompts、TTS 與音樂，
+    只以完整品質重跑生圖（含 ChatGPT 二次判斷）、圖生影片與組裝。
+    """
+    record = jobs[job_id]
+    record["status"] = "promoting"
+    record["options"] = dict(record.get("options") or {}, mode="full", promoted_from="draft")
+    try:
+        new_script = [TranscriptSentence(**s) if isinstance(s, dict) else s for s in record["new_script"]]
+        unified_data = to_jsonable(record["unified_data"])
+        await render_outputs(job_id, record.get("title"), unified_data, new_script, render_profile("full"))
+    except Exception as e:
+        record["status"] = "failed"
+        record["errors"].append(f"promote: {e}")
+        print(f"Promote failed: {e}")
+    finally:
+        jobs.sweep()
+
+
+async def rerender_job(job_id: str, force: List[str]):
+    """
+    增量重新算圖：依 render manifest 只重新編碼圖檔有變動（或列在 force）的 clip，
+    其餘 clip 與混音沿用，最後以 stream copy 重新 concat / mux。
+    """
+    record = jobs[job_id]
+    started = time.perf_counter()
+    record["status"] = "rerendering"
+    profile = render_profile((record.get("options") or {}).get("mode") or "full")
+    try:
+        manifest = RenderManifest(get_storage().job_dir(job_id))
+        previous = {c["clip_id"]: c for c in record.get("clips") or []}
+        images = [
+            {
+                "clip_id": c["clip_id"],
+                "img_path": c["img_path"],
+                "duration": previous.get(c["clip_id"], {}).get("duration"),
+                "variation": previous.get(c["clip_id"], {}).get("variation", 0)
+            }
+            for c in manifest.ordered_clips()
+        ]
+        clips = await VideoGenService().generate_clips(
+            {"ok": images}, job_id, record.get("title"), force, profile=profile
+        )
+        final_video = await VideoAssembler().assemble(
             clips=clips,
-            dialogue=dialogue_audio,
-            music=music_path,
-            srt_data=new_script,
+            dialogue=record["dialogue_audio"],
+            music=record["music_path"],
+            srt_data=None,
             job_id=job_id,
-            title=title
+            title=record.get("title"),
+            profile=profile
         )
-        
-        # 完成
-        jobs[job_id]["status"] = "completed"
-        jobs[job_id]["progress"] = 100
-        jobs[job_id]["final_video"] = final_video
-        
+        record["clips"] = clips
+        record["preview_video" if profile["mode"] == "draft" else "final_video"] = final_video
+        record["rerender"] = {
+            "reencoded": [c["clip_id"] for c in clips if not c.get("reused")],
+            "reused": sum(1 for c in clips if c.get("reused")),
+            "elapsed_seconds": round(time.perf_counter() - started, 3)
+        }
+        record["status"] = "failed" if final_video.get("error") else "completed"
+        if final_video.get("error"):
+            record["errors"].append(f"rerender: {final_video['error']}")
+        if final_video.get("renditions_error"):
+            record["warnings"].append(f"renditions: {final_video['renditions_error']}")
     except Exception as e:
-        jobs[job_id]["status"] = "failed"
-        jobs[job_id]["errors"].append(str(e))
-        print(f"Pipeline failed: {e}")
+        record["status"] = "failed"
+        record["errors"].append(f"rerender: {e}")
+        print(f"Rerender failed: {e}")
 
 
 async def rewrite_script_with_retry(
@@ -380,6 +1278,41 @@ async def rewrite_script_with_retry(
     return new_script  # 返回最後一次結果
 
 
+async def _cached_verdict(img_path: str, prompt: str, profile: Optional[Dict[str, Any]], job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    跨 job 快取中已對同一個 prompt 通過檢查的圖：直接回傳 ok 判定，不再呼叫 vision / ChatGPT
+    （相似 prompt 命中的圖是對別的 prompt 檢查的，照常檢查）
+    """
+    cache = get_prompt_cache()
+    if cache is not None and await asyncio.to_thread(
+        cache.is_verified, img_path, prompt, cache.variant_of(profile or {}), job_id
+    ):
+        return {"status": "ok", "reason": "verified in prompt cache"}
+    return None
+
+
+async def _record_verdict(img_path: str, prompt: str, profile: Optional[Dict[str, Any]], ok: bool):
+    """把這張圖對這個 prompt 的檢查結果記到快取（未通過的圖之後不會再被命中）"""
+    cache = get_prompt_cache()
+    if cache is not None:
+        await asyncio.to_thread(cache.mark, img_path, prompt, cache.variant_of(profile or {}), ok)
+
+
+def _finish_prompt_cache(job_id: str):
+    """寫回快取索引，把這個 job 的命中統計（含命中率）留在 job 紀錄"""
+    cache = get_prompt_cache()
+    if cache is None:
+        return
+    stats = cache.release(job_id)
+    if stats is not None:
+        stats = dict(stats)
+        hits = stats["exact_hits"] + stats["similar_hits"]
+        stats["hit_rate"] = round(hits / stats["lookups"], 3) if stats["lookups"] else 0.0
+        if job_id in jobs:
+            jobs[job_id]["prompt_cache"] = stats
+    cache.save()
+
+
 async def generate_images_with_safety(
     image_gen: Any,
     qwen: Any,
@@ -387,11 +1320,31 @@ async def generate_images_with_safety(
     unified_data: dict,
     job_id: str,
     title: str,
-    max_retries: int = 3
+    max_retries: int = 3,
+    profile: Optional[Dict[str, Any]] = None,
+    prefetch: Optional[ImagePrefetcher] = None,
+    on_ok: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
 ) -> dict:
     """
     生成圖片 + 安全檢查，最多重試 3 次
+    草稿模式（profile.gpt_verification = False）一律走批次檢查且不做 ChatGPT 二次判斷
+    prefetch：統一風格串流期間已先生成的圖，第一次嘗試直接沿用
+    on_ok：每張通過的圖立即 await on_ok(item)（下游逐 clip 編碼用）
     """
+    profile = profile or {}
+    max_retries = profile.get("safety_retries") or max_retries
+    mode = getattr(settings, "SAFETY_MODE", "batch")
+    if mode == "speculative" and profile.get("gpt_verification", True):
+        return await generate_images_with_speculative_safety(
+            image_gen, qwen, chatgpt, unified_data, job_id, title, max_retries,
+            profile=profile, prefetch=prefetch, on_ok=on_ok
+        )
+    if mode == "batch" or not profile.get("gpt_verification", True):
+        return await generate_images_with_batch_safety(
+            image_gen, qwen, chatgpt, unified_data, job_id, title, max_retries,
+            verify_uncertain=profile.get("gpt_verification", True), profile=profile, prefetch=prefetch, on_ok=on_ok
+        )
+
     results = {"ok": [], "bad": []}
     
     for sentence in unified_data["per_sentence"]:
@@ -403,16 +1356,26 @@ async def generate_images_with_safety(
             success = False
             
             while attempt < max_retries and not success:
-                # 生圖
-                img_path = await image_gen.generate(prompt, job_id, title, clip_id)
+                # 生圖（第一次嘗試優先用串流期間預先生成的圖）
+                img_path = None
+                if attempt == 0 and prefetch is not None:
+                    img_path = await prefetch.take(clip_id, prompt)
+                if img_path is None:
+                    img_path = await image_gen.generate(prompt, job_id, title, clip_id, profile=profile)
                 
-                # Qwen 安全檢查
-                safety_result = await qwen.check_safety(img_path)
-                
-                # ChatGPT 二次判斷
-                gpt_check = await chatgpt.verify_image_quality(
-                    safety_result, prompt
-                )
+                # 跨 job 快取中已通過檢查的圖不再檢查
+                gpt_check = await _cached_verdict(img_path, prompt, profile, job_id)
+                if gpt_check is None:
+                    # Qwen 安全檢查
+                    safety_result = await qwen.check_safety(img_path)
+                    
+                    # ChatGPT 二次判斷
+                    gpt_check = await chatgpt.verify_image_quality(
+                        safety_result, prompt
+                    )
+                    await _record_verdict(img_path, prompt, profile, gpt_check["status"] == "ok")
+                # 檢查完才需要檔案：等背景寫檔完成、釋放記憶體中的圖
+                await settle(img_path)
                 
                 if gpt_check["status"] == "ok":
                     results["ok"].append({
@@ -420,6 +1383,8 @@ async def generate_images_with_safety(
                         "img_path": img_path,
                         "prompt": prompt
                     })
+                    if on_ok is not None:
+                        await on_ok(results["ok"][-1])
                     success = True
                 else:
                     attempt += 1
@@ -438,6 +1403,280 @@ async def generate_images_with_safety(
     return results
 
 
+async def _verify_uncertain(chatgpt: Any, verdict: Dict[str, Any], prompt: str, stats: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    uncertain 判定交給 ChatGPT 二次判斷；ChatGPT 看不到圖，只能依 vision 的描述判斷，
+    沒有描述時不問（視為這次嘗試未通過）
+    """
+    if not verdict.get("description"):
+        return dict(verdict, status="bad", reason=verdict.get("reason") or "no image description")
+    stats["gpt_calls"] += 1
+    return await chatgpt.verify_image_quality(verdict, prompt)
+
+
+def _draft_acceptable(verdict: Dict[str, Any]) -> bool:
+    """草稿模式下不經 ChatGPT 就採用的 uncertain 判定：vision 明確回答 safe 且沒有列出 issue"""
+    return verdict.get("safe") is True and not verdict.get("issues")
+
+
+async def generate_images_with_batch_safety(
+    image_gen: Any,
+    qwen: Any,
+    chatgpt: Any,
+    unified_data: dict,
+    job_id: str,
+    title: str,
+    max_retries: int = 3,
+    batch_size: Optional[int] = None,
+    verify_uncertain: bool = True,
+    profile: Optional[Dict[str, Any]] = None,
+    prefetch: Optional[ImagePrefetcher] = None,
+    on_ok: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+) -> dict:
+    """
+    批次版：每批數張圖一次 vision request 取得逐張判定，
+    只有判定為 uncertain 的圖才找 ChatGPT 二次判斷；未通過的 clip 放回隊尾重試。
+    verify_uncertain=False（草稿）時不呼叫 ChatGPT：uncertain 中 safe 且無 issue 的直接採用，其餘視為未通過。
+    """
+    batch_size = batch_size or getattr(settings, "SAFETY_BATCH_SIZE", 6)
+    results = {"ok": [], "bad": []}
+    stats = {"clips": 0, "images": 0, "vision_calls": 0, "gpt_calls": 0, "unverified": 0}
+    jobs[job_id]["safety_stats"] = stats
+
+    order: Dict[str, int] = {}
+    pending: List[Dict[str, Any]] = []
+    for sentence in unified_data["per_sentence"]:
+        for clip in sentence["clips"]:
+            order[clip["clip_id"]] = len(order)
+            pending.append({"clip_id": clip["clip_id"], "prompt": clip["prompt"], "attempt": 0})
+    stats["clips"] = len(pending)
+
+    async def generate(item: Dict[str, Any]) -> str:
+        if item["attempt"] == 0 and prefetch is not None:
+            img_path = await prefetch.take(item["clip_id"], item["prompt"])
+            if img_path is not None:
+                return img_path
+        return await image_gen.generate(item["prompt"], job_id, title, item["clip_id"], profile=profile)
+
+    while pending:
+        batch, pending = pending[:batch_size], pending[batch_size:]
+
+        # 同一批的圖可以並行生成
+        paths = await asyncio.gather(*(generate(item) for item in batch))
+        for item, img_path in zip(batch, paths):
+            item["img_path"] = img_path
+        stats["images"] += len(batch)
+
+        # 跨 job 快取中已通過檢查的圖不再送 vision
+        cached = await asyncio.gather(*(_cached_verdict(item["img_path"], item["prompt"], profile, job_id) for item in batch))
+        to_check = [item for item, verdict in zip(batch, cached) if verdict is None]
+        checked = iter(await qwen.check_safety_batch(to_check) if to_check else [])
+        if to_check:
+            stats["vision_calls"] += 1
+        verdicts = [verdict if verdict is not None else next(checked) for verdict in cached]
+        # 之後只用到檔案（編碼 / 移到 bad_img）：等背景寫檔完成、釋放記憶體中的圖
+        await asyncio.gather(*(settle(item["img_path"]) for item in batch))
+
+        for item, verdict, from_cache in zip(batch, verdicts, cached):
+            if verdict["status"] == "uncertain" and not verify_uncertain:
+                # 草稿省掉 ChatGPT，但不省判定：只有明確 safe 且沒有 issue 的低信心結果才採用，
+                # 沒有判定（API 錯誤 / 無法解析）或 safe=false 的當作這次嘗試失敗
+                if _draft_acceptable(verdict):
+                    verdict = dict(verdict, status="ok")
+                    stats["unverified"] += 1
+                else:
+                    verdict = dict(verdict, status="bad", reason=verdict.get("reason") or "unsafe")
+            else:
+                if verdict["status"] == "uncertain":
+                    # 只有信心不足時才花一次 ChatGPT 呼叫
+                    verdict = await _verify_uncertain(chatgpt, verdict, item["prompt"], stats)
+                if from_cache is None and not verdict.get("no_verdict"):
+                    await _record_verdict(item["img_path"], item["prompt"], profile, verdict["status"] == "ok")
+
+            if verdict["status"] == "ok":
+                results["ok"].append({
+                    "clip_id": item["clip_id"],
+                    "img_path": item["img_path"],
+                    "prompt": item["prompt"]
+                })
+                if on_ok is not None:
+                    await on_ok(results["ok"][-1])
+                continue
+
+            item["attempt"] += 1
+            if item["attempt"] < max_retries:
+                pending.append(item)
+                continue
+
+            bad_path = FileManager.move_to_bad(item["img_path"], job_id, title)
+            results["bad"].append({
+                "clip_id": item["clip_id"],
+                "img_path": bad_path,
+                "reason": verdict.get("reason", "")
+            })
+            jobs[job_id]["warnings"].append(
+                f"⚠️ {item['clip_id']} 生圖失敗 {max_retries} 次，需人工處理"
+            )
+
+    # 重試會打亂順序；組裝依 clip 順序
+    results["ok"].sort(key=lambda r: order[r["clip_id"]])
+    results["bad"].sort(key=lambda r: order[r["clip_id"]])
+    stats["calls_per_clip"] = round(
+        (stats["vision_calls"] + stats["gpt_calls"]) / max(1, stats["clips"]), 3
+    )
+    return results
+
+
+class CandidateController:
+    """
+    依 job 觀察到的淘汰率決定每次要幾張候選：
+    讓「N 張裡至少一張通過」的機率 1 - r^N 達到 SPECULATIVE_TARGET_PASS。
+    還沒有觀察資料時以 SPECULATIVE_PRIOR_REJECTION 當作 10 張的先驗。
+    """
+
+    PRIOR_WEIGHT = 10
+
+    def __init__(self):
+        self.max_candidates = max(1, int(getattr(settings, "SPECULATIVE_MAX_CANDIDATES", 4)))
+        self.target = min(0.999, float(getattr(settings, "SPECULATIVE_TARGET_PASS", 0.9)))
+        prior = float(getattr(settings, "SPECULATIVE_PRIOR_REJECTION", 0.2))
+        self.rejected = prior * self.PRIOR_WEIGHT
+        self.checked = float(self.PRIOR_WEIGHT)
+
+    @property
+    def rejection_rate(self) -> float:
+        return self.rejected / self.checked
+
+    def observe(self, ok: bool):
+        self.checked += 1
+        if not ok:
+            self.rejected += 1
+
+    def candidates(self) -> int:
+        r = self.rejection_rate
+        if r <= 0:
+            return 1
+        if r >= 1:
+            return self.max_candidates
+        return max(1, min(self.max_candidates, math.ceil(math.log(1 - self.target) / math.log(r))))
+
+
+async def generate_images_with_speculative_safety(
+    image_gen: Any,
+    qwen: Any,
+    chatgpt: Any,
+    unified_data: dict,
+    job_id: str,
+    title: str,
+    max_retries: int = 3,
+    profile: Optional[Dict[str, Any]] = None,
+    prefetch: Optional[ImagePrefetcher] = None,
+    on_ok: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+) -> dict:
+    """
+    speculative 版：每個 clip 一次要 N 張候選（API `samples`），並行檢查，
+    第一張通過的就採用並取消其餘檢查；N 依 job 的淘汰率調整（CandidateController）。
+    全部未通過才進下一輪，最多 max_retries 輪。
+    """
+    results = {"ok": [], "bad": []}
+    stats = {"clips": 0, "images": 0, "vision_calls": 0, "gpt_calls": 0, "cancelled": 0, "rounds": 0}
+    jobs[job_id]["safety_stats"] = stats
+    controller = CandidateController()
+    limit = asyncio.Semaphore(max(1, int(getattr(settings, "SPECULATIVE_CLIP_CONCURRENCY", 4))))
+    img_dir = get_storage().job_path(job_id, "img")
+
+    async def check(img_path: str, clip_id: str, prompt: str) -> Dict[str, Any]:
+        cached = await _cached_verdict(img_path, prompt, profile, job_id)
+        if cached is not None:
+            return dict(cached, img_path=img_path)
+        verdicts = await qwen.check_safety_batch([{"clip_id": clip_id, "img_path": img_path, "prompt": prompt}])
+        stats["vision_calls"] += 1
+        verdict = verdicts[0]
+        if verdict["status"] == "uncertain":
+            verdict = await _verify_uncertain(chatgpt, verdict, prompt, stats)
+        if not verdict.get("no_verdict"):
+            # 沒有判定（API 錯誤）不算淘汰，也不寫進快取
+            controller.observe(verdict["status"] == "ok")
+            await _record_verdict(img_path, prompt, profile, verdict["status"] == "ok")
+        return dict(verdict, img_path=img_path)
+
+    async def run_clip(clip: Dict[str, Any]):
+        clip_id, prompt = clip["clip_id"], clip["prompt"]
+        canonical = img_dir / f"clip_{clip_id}.jpg"
+        verdict: Dict[str, Any] = {}
+        for attempt in range(max_retries):
+            stats["rounds"] += 1
+            n = controller.candidates()
+            paths: List[str] = []
+            if attempt == 0 and prefetch is not None:
+                prefetched = await prefetch.take(clip_id, prompt)
+                if prefetched is not None:
+                    paths.append(prefetched)
+            if len(paths) < n:
+                paths += await image_gen.generate_candidates(prompt, job_id, title, clip_id, n - len(paths), profile=profile)
+            stats["images"] += len(paths)
+
+            checks = [asyncio.create_task(check(p, clip_id, prompt)) for p in paths]
+            accepted = None
+            try:
+                for next_done in asyncio.as_completed(checks):
+                    verdict = await next_done
+                    if verdict["status"] == "ok":
+                        accepted = verdict["img_path"]
+                        break
+            finally:
+                for task in checks:
+                    if not task.done():
+                        task.cancel()
+                        stats["cancelled"] += 1
+                # 搬移 / 刪除候選前等背景寫檔完成
+                await asyncio.gather(*(settle(p) for p in paths))
+
+            if accepted is not None:
+                if Path(accepted) != canonical:
+                    os.replace(accepted, canonical)
+                for p in paths:
+                    if p != accepted and Path(p) != canonical and os.path.exists(p):
+                        os.remove(p)
+                item = {"clip_id": clip_id, "img_path": str(canonical), "prompt": prompt}
+                results["ok"].append(item)
+                if on_ok is not None:
+                    await on_ok(item)
+                return
+
+            # 全部未通過：保留最後判定的那張，其餘刪掉
+            keep = verdict.get("img_path")
+            for p in paths:
+                if p != keep and os.path.exists(p):
+                    os.remove(p)
+
+        bad_path = FileManager.move_to_bad(verdict["img_path"], job_id, title) if verdict.get("img_path") else None
+        results["bad"].append({"clip_id": clip_id, "img_path": bad_path, "reason": verdict.get("reason", "no candidates")})
+        jobs[job_id]["warnings"].append(f"⚠️ {clip_id} 生圖失敗 {max_retries} 次，需人工處理")
+
+    async def run_bounded(clip: Dict[str, Any]):
+        async with limit:
+            await run_clip(clip)
+
+    clips = [clip for sentence in unified_data["per_sentence"] for clip in sentence["clips"]]
+    order = {clip["clip_id"]: i for i, clip in enumerate(clips)}
+    stats["clips"] = len(clips)
+    await asyncio.gather(*(run_bounded(clip) for clip in clips))
+
+    results["ok"].sort(key=lambda r: order[r["clip_id"]])
+    results["bad"].sort(key=lambda r: order[r["clip_id"]])
+    stats["rejection_rate"] = round(controller.rejection_rate, 3)
+    stats["next_candidates"] = controller.candidates()
+    stats["calls_per_clip"] = round(
+        (stats["vision_calls"] + stats["gpt_calls"]) / max(1, stats["clips"]), 3
+    )
+    return results
+
+
+_mark("main")
+STARTUP_TIMINGS["import_total"] = round((time.perf_counter() - _BOOT_STARTED) * 1000, 2)
+
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -5,6 +5,14 @@ from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 
 
+class TranscriptWord(BaseModel):
+    """單字時間戳（ASR word timestamps）"""
+    word: str
+    start: float
+    end: float
+    probability: float = 0.0
+
+
 class TranscriptSentence(BaseModel):
     """單句 transcript"""
     index: int
@@ -14,6 +22,7 @@ class TranscriptSentence(BaseModel):
     duration: float = 0.0
     syllables: int = 0
     syllables_per_sec: float = 0.0
+    words: List[TranscriptWord] = Field(default_factory=list)
 
 
 class VideoMetadata(BaseModel):
@@ -82,4 +91,5 @@ class FinalVideo(BaseModel):
     video_path: str
     srt_path: str
     duration: float
-    clips_count: int
\ No newline at end of file
+    clips_count: int
+    renditions: List[Dict[str, Any]] = []  # [{"name", "width", "height", "crop", "subtitles", "video_path", "reused"}, ...]
\ No newline at end of file
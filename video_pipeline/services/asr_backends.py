@@ -0,0 +1,232 @@
+"""
+ASR backends
+
+- `whisper`：openai-whisper（原本的實作，GPU / full precision）
+- `faster-whisper`：CTranslate2 int8 量化，CPU 專用；先用 Silero VAD 找出有語音的區段，
+  跳過靜音，再把語音 chunk 丟到多個 thread 並行轉寫。
+
+每個 backend 回傳統一格式的 segments（時間為秒，相對於音檔開頭）：
+    [{"text", "start", "end", "words": [{"word", "start", "end", "probability"}]}]
+以及音檔長度，供 `TranscriptionService` 計算 real-time factor。
+
+輸入 `audio` 可以是音檔路徑，或 16 kHz mono float32 的 numpy array（`utils/pcm.py` 的 PCM buffer，
+不經過 wav、不再 decode 一次）。
+"""
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple, Union
+
+# flexible settings import
+try:
+    from video_pipeline.config import settings
+except Exception:
+    try:
+        from config import settings
+    except Exception:
+        settings = type("_S", (), {})()
+
+# whisper fallback
+try:
+    import whisper
+except Exception:
+    whisper = None
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+# faster-whisper（選用）
+try:
+    from faster_whisper import WhisperModel
+    from faster_whisper.audio import decode_audio
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+except Exception:
+    WhisperModel = None
+
+
+SAMPLE_RATE = 16000
+
+# 音檔路徑或 16 kHz mono float32 array
+Audio = Union[str, Any]
+
+
+def wav_duration(audio_path: str) -> float:
+    """讀 wav header 取得長度（非 wav 或讀取失敗時回傳 0）"""
+    try:
+        with wave.open(audio_path, "rb") as f:
+            return f.getnframes() / float(f.getframerate() or 1)
+    except Exception:
+        return 0.0
+
+
+def audio_duration(audio: Audio) -> float:
+    if isinstance(audio, str):
+        return wav_duration(audio)
+    return len(audio) / SAMPLE_RATE
+
+
+def split_long_region(audio, start: int, end: int, max_len: int, frame: int = 480) -> List[Tuple[int, int]]:
+    """
+    把超過 max_len 的區段切成不超過 max_len 的數段：每個切點取 [start + max_len/2, start + max_len]
+    內能量最低的 30 ms frame（避免切在字中間）
+    """
+    pieces: List[Tuple[int, int]] = []
+    while end - start > max_len:
+        lo, hi = start + max_len // 2, start + max_len
+        frames = (hi - lo) // frame
+        if frames > 0:
+            window = np.asarray(audio[lo:lo + frames * frame], dtype=np.float32).reshape(frames, frame)
+            cut = lo + int(np.argmin(np.square(window).mean(axis=1))) * frame + frame // 2
+        else:
+            cut = hi
+        pieces.append((start, cut))
+        start = cut
+    pieces.append((start, end))
+    return pieces
+
+
+class ASRBackend:
+    """ASR backend 介面"""
+
+    name = "base"
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    def transcribe(self, audio: Audio) -> Tuple[List[Dict[str, Any]], float]:
+        """同步轉寫（會佔用 CPU / GPU，呼叫端請丟到 thread 或 process 執行）"""
+        raise NotImplementedError
+
+
+class WhisperBackend(ASRBackend):
+
+    name = "whisper"
+
+    def __init__(self, model_name: str):
+        super().__init__(model_name)
+        self.model = whisper.load_model(model_name) if whisper is not None else None
+
+    def transcribe(self, audio: Audio) -> Tuple[List[Dict[str, Any]], float]:
+        if self.model is None:
+            return [], audio_duration(audio)
+
+        # whisper 直接吃 float32 array（路徑才會自己跑 ffmpeg decode）
+        result = self.model.transcribe(audio, word_timestamps=True, verbose=False)
+        segments = [
+            {
+                "text": seg["text"],
+                "start": float(seg["start"]),
+                "end": float(seg["end"]),
+                "words": [
+                    {
+                        "word": w["word"],
+                        "start": float(w["start"]),
+                        "end": float(w["end"]),
+                        "probability": float(w.get("probability", 0.0))
+                    }
+                    for w in seg.get("words") or []
+                ]
+            }
+            for seg in result["segments"]
+        ]
+        return segments, audio_duration(audio)
+
+
+class FasterWhisperBackend(ASRBackend):
+    """
+    CPU int8 backend：
+    1. decode 成 16 kHz float32（已是 PCM array 時略過）
+    2. Silero VAD 找語音區段，合併成不超過 ASR_CHUNK_SECONDS 的 chunk（過長的區段在最安靜處切開）
+    3. chunk 並行轉寫（CTranslate2 的 num_workers 允許多個 thread 同時使用同一個 model）
+    """
+
+    name = "faster-whisper"
+
+    def __init__(self, model_name: str):
+        super().__init__(model_name)
+        if WhisperModel is None:
+            raise RuntimeError("faster-whisper is not installed (pip install faster-whisper)")
+        self.concurrency = max(1, int(getattr(settings, "ASR_CHUNK_CONCURRENCY", 2)))
+        self.model = WhisperModel(
+            model_name,
+            device="cpu",
+            compute_type=getattr(settings, "ASR_COMPUTE_TYPE", "int8"),
+            cpu_threads=int(getattr(settings, "ASR_CPU_THREADS", 0)),
+            num_workers=self.concurrency
+        )
+        self.language = getattr(settings, "ASR_LANGUAGE", None) or None
+
+    def speech_chunks(self, audio) -> List[Tuple[int, int]]:
+        """
+        VAD 語音區段 -> [(start_sample, end_sample)]，相鄰區段合併到 chunk 上限為止；
+        單一區段就超過上限時（長獨白）在最安靜處切開
+        """
+        max_len = int(float(getattr(settings, "ASR_CHUNK_SECONDS", 30)) * SAMPLE_RATE)
+        options = VadOptions(min_silence_duration_ms=int(getattr(settings, "ASR_VAD_MIN_SILENCE_MS", 500)))
+        chunks: List[Tuple[int, int]] = []
+        for ts in get_speech_timestamps(audio, options):
+            start, end = int(ts["start"]), int(ts["end"])
+            if chunks and end - chunks[-1][0] <= max_len:
+                chunks[-1] = (chunks[-1][0], end)
+            else:
+                chunks.extend(split_long_region(audio, start, end, max_len))
+        return chunks
+
+    def _transcribe_chunk(self, audio, start: int, end: int) -> List[Dict[str, Any]]:
+        offset = start / SAMPLE_RATE
+        segments, _ = self.model.transcribe(
+            audio[start:end],
+            language=self.language,
+            beam_size=int(getattr(settings, "ASR_BEAM_SIZE", 5)),
+            word_timestamps=True,
+            vad_filter=False,
+            condition_on_previous_text=False
+        )
+        return [
+            {
+                "text": seg.text,
+                "start": offset + seg.start,
+                "end": offset + seg.end,
+                "words": [
+                    {
+                        "word": w.word,
+                        "start": offset + w.start,
+                        "end": offset + w.end,
+                        "probability": float(w.probability)
+                    }
+                    for w in seg.words or []
+                ]
+            }
+            # segments 是 generator，要在 worker thread 內跑完
+            for seg in segments
+        ]
+
+    def transcribe(self, audio: Audio) -> Tuple[List[Dict[str, Any]], float]:
+        if isinstance(audio, str):
+            audio = decode_audio(audio, sampling_rate=SAMPLE_RATE)
+        chunks = self.speech_chunks(audio)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            results = list(pool.map(lambda c: self._transcribe_chunk(audio, *c), chunks))
+        return [seg for chunk in results for seg in chunk], len(audio) / SAMPLE_RATE
+
+
+BACKENDS = {
+    WhisperBackend.name: WhisperBackend,
+    FasterWhisperBackend.name: FasterWhisperBackend,
+}
+
+_backends: Dict[Tuple[str, str], ASRBackend] = {}
+_lock = threading.Lock()
+
+
+def get_asr_backend(name: str, model_name: str) -> ASRBackend:
+    """同一 process 內每個 (backend, model) 只載入一次"""
+    if name not in BACKENDS:
+        raise ValueError(f"unknown ASR backend: {name} (available: {', '.join(BACKENDS)})")
+    key = (name, model_name)
+    with _lock:
+        if key not in _backends:
+            _backends[key] = BACKENDS[name](model_name)
+        return _backends[key]
@@ -1,9 +1,10 @@
 """
 ChatGPT API 服務
 """
+import asyncio
 import json
 import re
-from typing import List, Dict, Any
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
 
 # flexible settings import
 try:
@@ -29,6 +30,11 @@ except Exception:
 
 from models import TranscriptSentence, SyllableData, UnifiedData, SentenceWithClips, Clip
 
+try:
+    from video_pipeline.utils.json_stream import JsonArrayStream
+except Exception:
+    from utils.json_stream import JsonArrayStream
+
 class SyllableCounter:
     """
     A lightweight heuristic syllable counter used to estimate syllable counts from text.
@@ -124,11 +130,20 @@ class ChatGPTService:
         self,
         analyzed_frames: List[Dict],
         new_script: List[TranscriptSentence],
-        syllable_data: SyllableData
+        syllable_data: SyllableData,
+        on_sentence: Optional[Callable[[SentenceWithClips], None]] = None
     ) -> UnifiedData:
         """
         統一風格 + 生成每句的 base prompt
+        長影片（frame 或句數超過門檻）改走 map-reduce 版本
+        on_sentence: 串流回應中每句 prompt 一完成就呼叫（可提早開始生圖）；最後仍回傳完整 UnifiedData
         """
+        if (
+            len(analyzed_frames) > int(getattr(settings, "UNIFY_MAPREDUCE_MIN_FRAMES", 20))
+            or len(new_script) > int(getattr(settings, "UNIFY_MAPREDUCE_MIN_SENTENCES", 40))
+        ):
+            return await self.unify_style_map_reduce(analyzed_frames, new_script, syllable_data, on_sentence)
+
         prompt = f"""
 你是 AI 影片製作專家。根據以下信息：
 
@@ -169,56 +184,299 @@ class ChatGPTService:
 }}
 """
         
-        response = await openai.ChatCompletion.acreate(
-            model=settings.GPT_MODEL,
-            messages=[
-                {"role": "system", "content": "你是 AI 影片風格設計師"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7
+        data = await self._chat_json(
+            "你是 AI 影片風格設計師", prompt, temperature=0.7,
+            stream_path=("per_sentence",),
+            on_item=self._sentence_emitter(new_script, syllable_data, on_sentence)
         )
+        return self._build_unified(data, data["per_sentence"], new_script, syllable_data)
+
+    def _sentence_emitter(
+        self,
+        new_script: List[TranscriptSentence],
+        syllable_data: SyllableData,
+        on_sentence: Optional[Callable[[SentenceWithClips], None]]
+    ) -> Optional[Callable[[Dict[str, Any]], None]]:
+        """把串流出來的 per_sentence item 轉成 SentenceWithClips 交給 on_sentence（不完整的 item 略過）"""
+        if on_sentence is None:
+            return None
+        counter = SyllableCounter()
+
+        def emit(item: Dict[str, Any]):
+            index = item.get("index")
+            if not isinstance(index, int) or not 0 <= index < len(new_script) or not item.get("base_prompt"):
+                return
+            on_sentence(self._sentence_with_clips(item, new_script, syllable_data, counter))
+
+        return emit
+
+    @staticmethod
+    def _sentence_with_clips(
+        item: Dict[str, Any],
+        new_script: List[TranscriptSentence],
+        syllable_data: SyllableData,
+        counter: SyllableCounter
+    ) -> SentenceWithClips:
+        sentence = new_script[item["index"]]
+        syllables = counter.count_syllables(sentence.text)
+        duration = syllables / syllable_data.syllables_per_sec
+        num_clips = max(1, int(duration / 3) + (1 if duration % 3 > 0 else 0))
         
-        content = response.choices[0].message.content
-        content = content.replace("```json", "").replace("```", "").strip()
-        data = json.loads(content)
+        # 暫時用 base_prompt 重複
+        clips = [
+            Clip(
+                clip_id=f"{item['index']:02d}{chr(97+i)}",  # 00a, 00b...
+                prompt=item["base_prompt"]
+            )
+            for i in range(num_clips)
+        ]
         
+        return SentenceWithClips(
+            index=item["index"],
+            text=item.get("text", sentence.text),
+            duration=duration,
+            num_clips=num_clips,
+            clips=clips
+        )
+
+    def _build_unified(
+        self,
+        style: Dict[str, Any],
+        per_sentence: List[Dict[str, Any]],
+        new_script: List[TranscriptSentence],
+        syllable_data: SyllableData
+    ) -> UnifiedData:
+        """把風格設定 + 每句 base_prompt 組成 UnifiedData（計算每句 num_clips）"""
         # 計算每句 num_clips
         counter = SyllableCounter()
-        per_sentence_with_clips = []
-        
-        for item in data["per_sentence"]:
-            sentence = new_script[item["index"]]
-            syllables = counter.count_syllables(sentence.text)
-            duration = syllables / syllable_data.syllables_per_sec
-            num_clips = max(1, int(duration / 3) + (1 if duration % 3 > 0 else 0))
-            
-            # 暫時用 base_prompt 重複
-            clips = [
-                Clip(
-                    clip_id=f"{item['index']:02d}{chr(97+i)}",  # 00a, 00b...
-                    prompt=item["base_prompt"]
-                )
-                for i in range(num_clips)
-            ]
-            
-            per_sentence_with_clips.append(
-                SentenceWithClips(
-                    index=item["index"],
-                    text=item["text"],
-                    duration=duration,
-                    num_clips=num_clips,
-                    clips=clips
-                )
-            )
+        per_sentence_with_clips = [
+            self._sentence_with_clips(item, new_script, syllable_data, counter) for item in per_sentence
+        ]
         
         return UnifiedData(
-            summary=data["summary"],
-            global_style=data["global_style"],
-            characters=data["characters"],
-            locations=data["locations"],
+            summary=style["summary"],
+            global_style=style["global_style"],
+            characters=style["characters"],
+            locations=style["locations"],
             per_sentence=per_sentence_with_clips
         )
-    
+
+    async def _chat_json(
+        self,
+        system: str,
+        prompt: str,
+        temperature: float = 0.7,
+        stream_path: Optional[tuple] = None,
+        on_item: Optional[Callable[[Any], None]] = None
+    ) -> Any:
+        """
+        呼叫 ChatGPT 並把回應解析成 JSON
+        有 on_item 時改用串流：`stream_path` 指定的陣列（() = 根陣列）每完成一個元素就呼叫 on_item
+        """
+        if on_item is not None and getattr(settings, "UNIFY_STREAM", True):
+            parser = JsonArrayStream(stream_path or ())
+            async for text in self._chat_stream(system, prompt, temperature):
+                for item in parser.feed(text):
+                    on_item(item)
+            return parser.close()
+
+        response = await openai.ChatCompletion.acreate(
+            model=settings.GPT_MODEL,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=temperature
+        )
+        content = response.choices[0].message.content
+        content = content.replace("```json", "").replace("```", "").strip()
+        return json.loads(content)
+
+    async def _chat_stream(self, system: str, prompt: str, temperature: float = 0.7) -> AsyncIterator[str]:
+        """串流 completion，逐段回傳文字（openai 版本不支援串流時一次回傳整段）"""
+        response = await openai.ChatCompletion.acreate(
+            model=settings.GPT_MODEL,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=temperature,
+            stream=True
+        )
+        if not hasattr(response, "__aiter__"):
+            yield response.choices[0].message.content
+            return
+        async for chunk in response:
+            choices = chunk["choices"]
+            text = choices[0]["delta"].get("content") if choices else None
+            if text:
+                yield text
+
+    # ==================== Map-reduce 統一風格（長影片） ====================
+
+    @staticmethod
+    def _chunks(items: List[Any], size: int) -> List[List[Any]]:
+        size = max(1, size)
+        return [items[i:i + size] for i in range(0, len(items), size)]
+
+    async def _gather_bounded(self, coros: List[Any]) -> List[Any]:
+        semaphore = asyncio.Semaphore(max(1, int(getattr(settings, "UNIFY_MAX_CONCURRENCY", 4))))
+
+        async def run(coro):
+            async with semaphore:
+                return await coro
+
+        return await asyncio.gather(*(run(c) for c in coros))
+
+    async def unify_style_map_reduce(
+        self,
+        analyzed_frames: List[Dict],
+        new_script: List[TranscriptSentence],
+        syllable_data: SyllableData,
+        on_sentence: Optional[Callable[[SentenceWithClips], None]] = None
+    ) -> UnifiedData:
+        """
+        長影片版統一風格：
+        1. map：frame 分析與 script 分塊並行摘要
+        2. reduce：分層合併成全域風格、角色、地點
+        3. 每句 prompt 分批並行生成
+        每一層都是並行的，延遲隨影片長度次線性成長，單次 completion 也不會無限變長。
+        """
+        frame_chunks = self._chunks(analyzed_frames, int(getattr(settings, "UNIFY_FRAME_CHUNK", 8)))
+        script_chunks = self._chunks(new_script, int(getattr(settings, "UNIFY_SCRIPT_CHUNK", 20)))
+
+        partials = await self._gather_bounded(
+            [self._summarize_frames(chunk) for chunk in frame_chunks]
+            + [self._summarize_script(chunk) for chunk in script_chunks]
+        )
+        style = await self._reduce_summaries(list(partials))
+
+        # 每句附上原影片同位置 frame 的描述（rewrite 保持句數，index 對應）
+        captions: Dict[int, List[str]] = {}
+        for frame in analyzed_frames:
+            if "sentence_index" in frame:
+                captions.setdefault(frame["sentence_index"], []).append(frame.get("prompt") or frame.get("caption", ""))
+
+        batches = self._chunks(new_script, int(getattr(settings, "UNIFY_PROMPT_BATCH", 15)))
+        emit = self._sentence_emitter(new_script, syllable_data, on_sentence)
+        results = await self._gather_bounded(
+            [self._prompts_for_batch(style, batch, captions, emit) for batch in batches]
+        )
+
+        per_sentence = []
+        for batch, items in zip(batches, results):
+            by_index = {item.get("index"): item for item in items if isinstance(item, dict)}
+            for sentence in batch:
+                item = by_index.get(sentence.index)
+                if not item or not item.get("base_prompt"):
+                    # 模型漏回某句時，以全域風格 + 句子內容補上
+                    item = {"index": sentence.index, "base_prompt": f"{style['summary']}. {sentence.text}"}
+                item["text"] = sentence.text
+                per_sentence.append(item)
+
+        return self._build_unified(style, per_sentence, new_script, syllable_data)
+
+    async def _summarize_frames(self, frames: List[Dict]) -> Dict[str, Any]:
+        prompt = f"""
+以下是影片中一段 frame 的分析結果（Qwen-VL3 反推）：
+{json.dumps([{"caption": f.get("caption", ""), "prompt": f.get("prompt", "")} for f in frames], ensure_ascii=False, indent=2)}
+
+請摘要這一段的主題、畫面風格、出現的角色與地點。返回 JSON：
+{{
+  "summary": "...",
+  "style": {{"art_style": "...", "color_tone": "...", "lighting": "..."}},
+  "characters": [{{"name": "...", "appearance": "..."}}],
+  "locations": [{{"name": "...", "description": "..."}}]
+}}
+"""
+        return await self._chat_json("你是 AI 影片風格設計師", prompt, temperature=0.3)
+
+    async def _summarize_script(self, sentences: List[TranscriptSentence]) -> Dict[str, Any]:
+        prompt = f"""
+以下是新 script 的一段：
+{json.dumps([{"index": s.index, "text": s.text} for s in sentences], ensure_ascii=False, indent=2)}
+
+請摘要這一段的主題，並列出提到的角色與地點。返回 JSON：
+{{
+  "summary": "...",
+  "characters": [{{"name": "...", "appearance": "..."}}],
+  "locations": [{{"name": "...", "description": "..."}}]
+}}
+"""
+        return await self._chat_json("你是專業編劇", prompt, temperature=0.3)
+
+    async def _reduce_summaries(self, partials: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """分層合併：超過 fan-in 時先分組並行合併，直到剩一份全域設定"""
+        fan_in = max(2, int(getattr(settings, "UNIFY_REDUCE_FAN_IN", 8)))
+        while len(partials) > fan_in:
+            partials = list(await self._gather_bounded(
+                [self._merge_summaries(group, final=False) for group in self._chunks(partials, fan_in)]
+            ))
+        return await self._merge_summaries(partials, final=True)
+
+    async def _merge_summaries(self, partials: List[Dict[str, Any]], final: bool) -> Dict[str, Any]:
+        style_key = "global_style" if final else "style"
+        prompt = f"""
+以下是同一支影片不同段落的摘要：
+{json.dumps(partials, ensure_ascii=False, indent=2)}
+
+請合併成一份一致的設定：
+1. 總結影片主題
+2. 統一角色設定（同一角色合併；外貌、服裝、特徵）
+3. 統一場景風格（寫實/卡通、色調、燈光）
+
+返回 JSON：
+{{
+  "summary": "影片主題總結...",
+  "{style_key}": {{"art_style": "realistic/anime/...", "color_tone": "warm/cold/...", "lighting": "soft/dramatic/..."}},
+  "characters": [{{"name": "角色A", "appearance": "..."}}],
+  "locations": [{{"name": "地點1", "description": "..."}}]
+}}
+"""
+        merged = await self._chat_json("你是 AI 影片風格設計師", prompt, temperature=0.5)
+        merged.setdefault("summary", "")
+        merged.setdefault(style_key, {})
+        merged.setdefault("characters", [])
+        merged.setdefault("locations", [])
+        return merged
+
+    async def _prompts_for_batch(
+        self,
+        style: Dict[str, Any],
+        sentences: List[TranscriptSentence],
+        captions: Dict[int, List[str]],
+        on_item: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> List[Dict[str, Any]]:
+        lines = [
+            {"index": s.index, "text": s.text, "reference": captions.get(s.index, [])[:2]}
+            for s in sentences
+        ]
+        prompt = f"""
+影片設定：
+{json.dumps({k: style[k] for k in ("summary", "global_style", "characters", "locations")}, ensure_ascii=False, indent=2)}
+
+請為以下每句生成統一風格的 base image prompt（reference 為原影片該句畫面描述，可參考構圖）：
+{json.dumps(lines, ensure_ascii=False, indent=2)}
+
+返回 JSON array：
+[
+  {{"index": 0, "base_prompt": "統一風格的場景描述..."}}
+]
+"""
+        texts = {s.index: s.text for s in sentences}
+
+        def emit(item: Any):
+            if isinstance(item, dict) and item.get("index") in texts:
+                on_item(dict(item, text=texts[item["index"]]))
+
+        data = await self._chat_json(
+            "你是 AI 影片風格設計師", prompt, temperature=0.7,
+            stream_path=(), on_item=emit if on_item is not None else None
+        )
+        if isinstance(data, dict):
+            data = data.get("per_sentence", [])
+        return data
+
     async def verify_image_quality(
         self,
         qwen_result: Dict,
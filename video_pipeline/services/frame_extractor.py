@@ -3,8 +3,9 @@
 """
 
 # ==================== Frame Extractor ====================
-import subprocess
+import asyncio
 from pathlib import Path
+from typing import Any, Dict, List
 
 # flexible settings import (not required but kept for consistency)
 try:
@@ -15,14 +16,26 @@ except Exception:
     except Exception:
         settings = type("_S", (), {})()
 
+try:
+    from video_pipeline.utils.media_executor import get_media_executor
+    from video_pipeline.utils.storage import get_storage
+except Exception:
+    from utils.media_executor import get_media_executor
+    from utils.storage import get_storage
+
 class FrameExtractor:
     async def extract_frames_per_sentence(
         self, video_path: str, sentences, fps: float, job_id: str, title: str
     ):
-        """每句每 3 秒抽一張 frame"""
-        output_dir = Path(f"outputs/{job_id}_{title}/img_raw")
-        output_dir.mkdir(parents=True, exist_ok=True)
+        """
+        每句每 3 秒抽一張 frame；每張 frame 各自 seek 後只解碼到該點，全部同時交給共用 media executor
+        （並行數由 executor 控制，長片不需要另外切段）
+        """
+        output_dir = get_storage().job_path(job_id, "img_raw")
         
+        return await self._extract(video_path, sentences, output_dir)
+
+    async def _extract(self, video_path: str, sentences, output_dir: Path) -> List[Dict[str, Any]]:
         frames = []
         for sentence in sentences:
             start, end = sentence.start, sentence.end
@@ -31,13 +44,6 @@ class FrameExtractor:
             
             while t < end:
                 frame_path = output_dir / f"sentence_{sentence.index:02d}_frame_{frame_idx:02d}.jpg"
-                
-                # ffmpeg 抽 frame
-                subprocess.run([
-                    "ffmpeg", "-ss", str(t), "-i", video_path,
-                    "-frames:v", "1", "-q:v", "2", "-y", str(frame_path)
-                ], check=True)
-                
                 frames.append({
                     "sentence_index": sentence.index,
                     "frame_time": t,
@@ -46,5 +52,15 @@ class FrameExtractor:
                 
                 t += 3.0
                 frame_idx += 1
+
+        # ffmpeg 抽 frame（單張 frame 只需要 1 個 thread）
+        executor = get_media_executor()
+        await asyncio.gather(*(
+            executor.ffmpeg([
+                "-ss", str(frame["frame_time"]), "-i", video_path,
+                "-frames:v", "1", "-q:v", "2", "-y", frame["img_path"]
+            ], priority="preview", threads=1)
+            for frame in frames
+        ))
         
-        return frames
\ No newline at end of file
+        return frames
@@ -1,9 +1,8 @@
 
 # ==================== Image Gen ====================
-from pathlib import Path
+import asyncio
 import os
-import base64
-from typing import Any
+from typing import Any, Dict, List, Optional
 
 # flexible settings import
 try:
@@ -36,34 +35,80 @@ except Exception:
             return Resp()
     httpx = type("httpx", (), {"AsyncClient": _HTTPXAsyncClient})
 
+try:
+    from video_pipeline.utils.artifacts import ImageArtifact
+    from video_pipeline.utils.prompt_cache import get_prompt_cache
+    from video_pipeline.utils.storage import get_storage
+except Exception:
+    from utils.artifacts import ImageArtifact
+    from utils.prompt_cache import get_prompt_cache
+    from utils.storage import get_storage
+
 class ImageGenService:
-    async def generate(self, prompt: str, job_id: str, title: str, clip_id: str) -> str:
-        """調用文生圖 API（Stability AI / DALL-E / 自己 SD）"""
-        output_dir = Path(f"outputs/{job_id}_{title}/img")
-        output_dir.mkdir(parents=True, exist_ok=True)
+    async def generate(
+        self, prompt: str, job_id: str, title: str, clip_id: str,
+        profile: Optional[Dict[str, Any]] = None
+    ) -> ImageArtifact:
+        """調用文生圖 API（Stability AI / DALL-E / 自己 SD）
+
+        profile: `config.render_profile()` 的結果；草稿模式用較小的 engine / 解析度 / steps
+        跨 job 快取（utils/prompt_cache）命中相同或相似的 prompt 時直接沿用，不呼叫 API；
+        相似命中以這個 prompt 另存一筆，之後的檢查結果記在這個 prompt 上
+        回傳 `ImageArtifact`（圖檔路徑，帶著 bytes 與 base64 給安全檢查用）；檔案在背景寫入
+        """
+        profile = profile or {}
+        output_dir = get_storage().job_path(job_id, "img")
         img_path = output_dir / f"clip_{clip_id}.jpg"
+        cache = get_prompt_cache()
+        variant = cache.variant_of(profile) if cache is not None else ""
+        cached = await asyncio.to_thread(cache.lookup, prompt, variant, job_id) if cache is not None else None
+        if cached is not None:
+            data, kind = cached
+            artifact = ImageArtifact(img_path, data).persist()
+            if kind == "similar":
+                await asyncio.to_thread(cache.put, prompt, variant, artifact)
+        else:
+            artifact = ImageArtifact.from_base64(img_path, (await self._request(prompt, 1, profile))[0]).persist()
+            if cache is not None:
+                await asyncio.to_thread(cache.put, prompt, variant, artifact)
+        
+        return artifact
+
+    async def generate_candidates(
+        self, prompt: str, job_id: str, title: str, clip_id: str, n: int,
+        profile: Optional[Dict[str, Any]] = None
+    ) -> List[ImageArtifact]:
+        """同一 prompt 一次要 n 張候選圖（API 的 `samples`），存成 `clip_{clip_id}_c{i}.jpg`（背景寫入）"""
+        output_dir = get_storage().job_path(job_id, "img")
+        images = await self._request(prompt, max(1, n), profile or {})
+        return [
+            ImageArtifact.from_base64(output_dir / f"clip_{clip_id}_c{i}.jpg", b64).persist()
+            for i, b64 in enumerate(images)
+        ]
+
+    async def _request(self, prompt: str, samples: int, profile: Dict[str, Any]) -> List[str]:
+        """回傳各張圖的 base64（不在這裡 decode，交給 `ImageArtifact` 只 decode 一次）"""
+        engine = profile.get("image_engine") or getattr(settings, "IMAGE_ENGINE", "stable-diffusion-xl-1024-v1-0")
+        body = {
+            "text_prompts": [{"text": prompt}],
+            "cfg_scale": 7,
+            "height": profile.get("height") or getattr(settings, "IMAGE_HEIGHT", 1024),
+            "width": profile.get("width") or getattr(settings, "IMAGE_WIDTH", 576),  # 9:16
+            "samples": samples
+        }
+        if profile.get("image_steps"):
+            body["steps"] = profile["image_steps"]
+
         async with httpx.AsyncClient(timeout=120.0) as client:
             response = await client.post(
-                "https://api.stability.ai/v1/generation/stable-diffusion-xl-1024-v1-0/text-to-image",
+                f"https://api.stability.ai/v1/generation/{engine}/text-to-image",
                 headers={
                     "Authorization": f"Bearer {os.getenv('IMAGE_GEN_API_KEY', '')}",
                     "Content-Type": "application/json"
                 },
-                json={
-                    "text_prompts": [{"text": prompt}],
-                    "cfg_scale": 7,
-                    "height": 1024,
-                    "width": 576,  # 9:16
-                    "samples": 1
-                }
+                json=body
             )
              
             
             data = response.json()
-            img_b64 = data["artifacts"][0]["base64"]
-            
-            import base64
-            with open(img_path, "wb") as f:
-                f.write(base64.b64decode(img_b64))
-        
-        return str(img_path)
\ No newline at end of file
+            return [artifact["base64"] for artifact in data["artifacts"]]
@@ -1,4 +1,11 @@
+import asyncio
+import hashlib
+import json
+import math
+import shutil
+import subprocess
 from pathlib import Path
+from typing import List, Optional
 
 # flexible settings import
 try:
@@ -9,23 +16,152 @@ except Exception:
     except Exception:
         settings = type("_S", (), {})()
 
+# httpx fallback
+try:
+    import httpx
+except Exception:
+    httpx = None
+
+try:
+    from video_pipeline.utils.disk_cache import DiskLRUCache
+    from video_pipeline.utils.media_executor import get_media_executor
+    from video_pipeline.utils.storage import get_storage
+except Exception:
+    from utils.disk_cache import DiskLRUCache
+    from utils.media_executor import get_media_executor
+    from utils.storage import get_storage
+
+
+_music_cache = None
+
+
+def get_music_cache() -> DiskLRUCache:
+    """同一 process 內共用的音樂快取（key = summary hash + 長度 bucket）"""
+    global _music_cache
+    if _music_cache is None:
+        cache_dir = getattr(settings, "MUSIC_CACHE_DIR", None) or Path(getattr(settings, "BASE_DIR", Path.cwd())) / "cache" / "music"
+        max_mb = int(getattr(settings, "MUSIC_CACHE_MAX_MB", 2048))
+        _music_cache = DiskLRUCache(Path(cache_dir), max_mb * 1024 * 1024, suffix=".mp3")
+    return _music_cache
+
+
 class MusicService:
-    async def generate_and_cut_music(self, summary: str, target_duration: float, job_id: str, title: str):
-        """生成音樂並 cut 到指定長度"""
-        output_dir = Path(f"outputs/{job_id}_{title}/audio")
-        output_dir.mkdir(parents=True, exist_ok=True)
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, transport=None):
+        # transport：給測試用的 httpx transport（e.g. `httpx.MockTransport`），正式環境為 None
+        self.transport = transport
+
+    async def generate_and_cut_music(self, summary: str, target_duration: float, job_id: str, title: str,
+                                     warnings: Optional[List[str]] = None):
+        """生成音樂並 cut 到指定長度
+
+        1. 以 summary hash + 長度 bucket 查快取，相近長度的影片共用同一首。
+        2. cache miss 時呼叫 `SUNO_API_URL`（測試可指向本地 stand-in），回應以 streaming 寫入磁碟。
+        3. 用 ffmpeg 串流解碼剪到 `target_duration` 並加 fade in / out，記憶體用量固定，不會整首載入。
+
+        音樂是可選的：provider 或 ffmpeg 失敗不會讓 job 失敗，改為寫入 `warnings`
+        並回傳空的 music 檔（`mix_audio` 會只用對白）。
+        """
+        output_dir = get_storage().job_path(job_id, "audio")
         music_path = output_dir / "music.mp3"
-        
-        # 假設用 Suno API
-        # 暫時返回空檔案
-        
-        # 用 pydub cut（若未安裝 pydub，則建立空檔作為 stub）
+
+        if not getattr(settings, "SUNO_API_KEY", None) or not getattr(settings, "SUNO_API_URL", None) or httpx is None:
+            # 沒有可用的 API key，建立空檔作為 stub
+            music_path.write_bytes(b"")
+            return str(music_path)
+
         try:
-            from pydub import AudioSegment
-            # audio = AudioSegment.from_mp3(...)
-            # cut_audio = audio[:int(target_duration * 1000)]
-            # cut_audio.export(music_path, format="mp3")
-        except Exception:
+            await self._generate(summary, target_duration, output_dir, music_path)
+        except Exception as e:
+            if warnings is not None:
+                warnings.append(f"music: {type(e).__name__}: {e}; continuing without music")
             music_path.write_bytes(b"")
-        
         return str(music_path)
+
+    async def _generate(self, summary: str, target_duration: float, output_dir: Path, music_path: Path) -> None:
+        bucket = self._duration_bucket(target_duration)
+        cache = get_music_cache()
+        key = DiskLRUCache.make_key(
+            summary_sha256=hashlib.sha256((summary or "").strip().encode("utf-8")).hexdigest(),
+            duration_bucket=bucket
+        )
+
+        track = await asyncio.to_thread(cache.get_path, key)
+        if track is None:
+            download_path = output_dir / "music_full.download"
+            await self._download_track(summary, bucket, download_path)
+            track = await asyncio.to_thread(cache.put_file, key, download_path, True)
+
+        await self._trim_and_fade(track, target_duration, music_path)
+
+    @staticmethod
+    def _duration_bucket(target_duration: float) -> int:
+        """把長度往上取整到 bucket（預設 30 秒），生成的曲子一定夠長"""
+        size = max(1, int(getattr(settings, "MUSIC_DURATION_BUCKET", 30)))
+        return max(size, int(math.ceil(max(target_duration, 0.0) / size)) * size)
+
+    async def _download_track(self, summary: str, duration: int, dest: Path) -> None:
+        """呼叫 Suno（或相容 provider），把音檔串流寫入 dest
+
+        Provider 可直接回傳音訊（`audio/*`），或回傳 JSON `{"audio_url": ...}` 再串流下載。
+        """
+        headers = {
+            "Authorization": f"Bearer {settings.SUNO_API_KEY}",
+            "Content-Type": "application/json"
+        }
+        body = {"prompt": summary, "duration": duration, "make_instrumental": True}
+
+        async with httpx.AsyncClient(timeout=getattr(settings, "TIMEOUT", 300), transport=self.transport) as client:
+            async with client.stream("POST", settings.SUNO_API_URL, headers=headers, json=body) as response:
+                response.raise_for_status()
+                if not response.headers.get("content-type", "").startswith("application/json"):
+                    await self._stream_to_file(response, dest)
+                    return
+                data = await response.aread()
+
+            audio_url = self._find_audio_url(json.loads(data))
+            if not audio_url:
+                raise RuntimeError("music provider returned no audio")
+            async with client.stream("GET", audio_url) as response:
+                response.raise_for_status()
+                await self._stream_to_file(response, dest)
+
+    async def _stream_to_file(self, response, dest: Path) -> None:
+        tmp = dest.with_suffix(dest.suffix + ".part")
+        with open(tmp, "wb") as f:
+            async for chunk in response.aiter_bytes(self.CHUNK_SIZE):
+                f.write(chunk)
+        tmp.replace(dest)
+
+    @staticmethod
+    def _find_audio_url(data) -> Optional[str]:
+        """支援 {"audio_url"}、{"data": [{"audio_url"}]}、[{"audio_url"}] 幾種常見格式"""
+        if isinstance(data, dict):
+            if data.get("audio_url"):
+                return data["audio_url"]
+            data = data.get("data") or data.get("clips") or []
+        if isinstance(data, list):
+            for item in data:
+                if isinstance(item, dict) and item.get("audio_url"):
+                    return item["audio_url"]
+        return None
+
+    async def _trim_and_fade(self, src: Path, target_duration: float, dest: Path) -> None:
+        """ffmpeg 串流剪輯 + fade；失敗時退回直接複製原曲（組裝時會以 -shortest 截斷）"""
+        duration = max(float(target_duration or 0.0), 0.1)
+        fade_in = min(float(getattr(settings, "MUSIC_FADE_IN", 1.0)), duration / 2)
+        fade_out = min(float(getattr(settings, "MUSIC_FADE_OUT", 3.0)), duration / 2)
+        filters = [
+            f"afade=t=in:st=0:d={fade_in:.3f}",
+            f"afade=t=out:st={duration - fade_out:.3f}:d={fade_out:.3f}"
+        ]
+
+        try:
+            await get_media_executor().ffmpeg([
+                "-i", str(src), "-t", f"{duration:.3f}",
+                "-af", ",".join(filters), "-c:a", "libmp3lame", "-q:a", "4",
+                "-y", str(dest)
+            ], priority="final")
+        except (FileNotFoundError, subprocess.CalledProcessError):
+            shutil.copyfile(str(src), str(dest))
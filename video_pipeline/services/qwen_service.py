@@ -1,8 +1,9 @@
 """
 Qwen-VL3 API 服務（阿里雲通義千問）
 """
-import base64
-from typing import List, Dict
+import asyncio
+import json
+from typing import List, Dict, Any
 from pathlib import Path
 
 # flexible settings import
@@ -28,11 +29,18 @@ except Exception:
         async def post(self, *a, **k):
             class Resp:
                 status_code = 501
+                def raise_for_status(self):
+                    raise RuntimeError("httpx is not installed")
                 def json(self):
                     return {"output": {"choices": [{"message": {"content": ""}}]}}
             return Resp()
     httpx = type("httpx", (), {"AsyncClient": _HTTPXAsyncClient})
 
+try:
+    from video_pipeline.utils.artifacts import read_b64
+except Exception:
+    from utils.artifacts import read_b64
+
 
 class QwenService:
     
@@ -50,9 +58,8 @@ class QwenService:
             for frame in frames_data:
                 img_path = frame["img_path"]
                 
-                # 讀圖並 base64
-                with open(img_path, "rb") as f:
-                    img_b64 = base64.b64encode(f.read()).decode()
+                # 讀圖並 base64（在 thread 讀檔，不阻塞 event loop）
+                img_b64 = await read_b64(img_path)
                 
                 # 調用 Qwen API
                 response = await client.post(
@@ -81,6 +88,8 @@ class QwenService:
                 caption = data["output"]["choices"][0]["message"]["content"]
                 
                 results.append({
+                    "sentence_index": frame.get("sentence_index"),
+                    "frame_time": frame.get("frame_time"),
                     "img_path": img_path,
                     "caption": caption,
                     "prompt": self._extract_prompt(caption)
@@ -95,10 +104,9 @@ class QwenService:
     
     async def check_safety(self, img_path: str) -> Dict:
         """
-        檢查圖片安全性 + 內容
+        檢查圖片安全性 + 內容（生圖結果的 base64 直接取自記憶體中的 artifact，不讀檔）
         """
-        with open(img_path, "rb") as f:
-            img_b64 = base64.b64encode(f.read()).decode()
+        img_b64 = await read_b64(img_path)
         
         async with httpx.AsyncClient(timeout=30.0) as client:
             response = await client.post(
@@ -127,4 +135,141 @@ class QwenService:
             content = data["output"]["choices"][0]["message"]["content"]
             
             # 簡化：直接返回
-            return {"raw": content}
\ No newline at end of file
+            return {"raw": content}
+
+    async def check_safety_batch(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        一次 vision request 檢查多張圖（連同各自的 prompt），回傳逐張結構化判定
+
+        items: [{"clip_id": "00a", "img_path": "...", "prompt": "..."}, ...]
+        回傳（與 items 同順序）:
+            [{"clip_id", "status": "ok"/"bad"/"uncertain", "safe", "matches_prompt",
+              "confidence", "issues", "reason"}, ...]
+
+        HTTP 錯誤 / 回覆無法解析 / 漏掉的圖會逐張重新檢查一次；仍然沒有判定的回傳
+        status "bad" + `no_verdict`（當作這次嘗試失敗，不交給 ChatGPT 猜）
+        """
+        if not items:
+            return []
+
+        try:
+            parsed = await self._request_batch(items)
+        except Exception:
+            parsed = []
+
+        by_index = {}
+        for pos, entry in enumerate(parsed):
+            if isinstance(entry, dict):
+                # 模型可能回 "0" 之類的字串 index
+                try:
+                    index = int(entry.get("index", pos))
+                except (TypeError, ValueError):
+                    index = pos
+                by_index[index] = entry
+
+        threshold = getattr(settings, "SAFETY_CONFIDENCE_THRESHOLD", 0.75)
+        verdicts = [
+            self._to_verdict(item["clip_id"], by_index.get(i), threshold)
+            for i, item in enumerate(items)
+        ]
+
+        missing = [i for i, verdict in enumerate(verdicts) if verdict.get("no_verdict")]
+        if missing and len(items) > 1:
+            rechecked = await asyncio.gather(*(self.check_safety_batch([items[i]]) for i in missing))
+            for i, result in zip(missing, rechecked):
+                verdicts[i] = result[0]
+        return verdicts
+
+    async def _request_batch(self, items: List[Dict[str, Any]]) -> List[Any]:
+        """送出一次多圖 vision request，回傳解析後的逐張結果（HTTP 錯誤 / 無法解析時拋出）"""
+
+        content: List[Dict[str, str]] = []
+        for i, item in enumerate(items):
+            img_b64 = await read_b64(item["img_path"])
+            content.append({"text": f"圖 {i}（clip {item['clip_id']}）原提示詞：{item['prompt']}"})
+            content.append({"image": f"data:image/jpeg;base64,{img_b64}"})
+        content.append({"text": (
+            f"以上共 {len(items)} 張圖。逐張檢查：1) 是否有 NSFW 或不當內容？"
+            "2) 是否符合該圖的原提示詞（風格、角色、場景）？3) 是否有明顯錯誤？"
+            "只返回 JSON array，每張一項："
+            "[{\"index\": 0, \"safe\": true/false, \"matches_prompt\": true/false, "
+            "\"confidence\": 0.0-1.0, \"issues\": [], \"description\": \"...\"}]"
+        )})
+
+        async with httpx.AsyncClient(timeout=60.0 + 15.0 * len(items)) as client:
+            response = await client.post(
+                self.api_url,
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "model": "qwen-vl-max",
+                    "input": {"messages": [{"role": "user", "content": content}]}
+                }
+            )
+            response.raise_for_status()
+            data = response.json()
+
+        raw = self._content_text(data["output"]["choices"][0]["message"]["content"])
+        parsed = json.loads(raw.replace("```json", "").replace("```", "").strip())
+        if isinstance(parsed, dict):
+            parsed = parsed.get("results", [])
+        if not isinstance(parsed, list):
+            raise ValueError("unexpected safety batch reply")
+        return parsed
+
+    @staticmethod
+    def _content_text(content: Any) -> str:
+        """DashScope 的 content 可能是字串或 [{"text": ...}] list"""
+        if isinstance(content, list):
+            return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+        return content or ""
+
+    @staticmethod
+    def _as_bool(value: Any) -> bool:
+        """嚴格解析：只有 true / "true" 算 True（`bool("false")` 是 True，安全檢查不能 fail open）"""
+        if isinstance(value, str):
+            return value.strip().lower() == "true"
+        return value is True
+
+    @staticmethod
+    def _to_verdict(clip_id: str, entry: Any, threshold: float) -> Dict[str, Any]:
+        """把單張結果轉成 ok / bad / uncertain；信心不足的為 uncertain，缺漏的為 bad（no_verdict）"""
+        if not entry:
+            return {"clip_id": clip_id, "status": "bad", "reason": "no verdict returned", "no_verdict": True}
+
+        safe = QwenService._as_bool(entry.get("safe"))
+        matches = QwenService._as_bool(entry.get("matches_prompt"))
+        try:
+            confidence = float(entry.get("confidence", 0.0))
+        except (TypeError, ValueError):
+            confidence = 0.0
+        issues = entry.get("issues") or []
+
+        if confidence < threshold:
+            status = "uncertain"
+        elif safe and matches:
+            status = "ok"
+        else:
+            status = "bad"
+
+        if issues:
+            reason = "; ".join(str(x) for x in issues)
+        elif not safe:
+            reason = "unsafe"
+        elif not matches:
+            reason = "prompt mismatch"
+        else:
+            reason = ""
+
+        return {
+            "clip_id": clip_id,
+            "status": status,
+            "safe": safe,
+            "matches_prompt": matches,
+            "confidence": confidence,
+            "issues": issues,
+            "description": entry.get("description", ""),
+            "reason": reason
+        }
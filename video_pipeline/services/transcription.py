@@ -1,7 +1,16 @@
 """
-ASR 服務 - Whisper
+ASR 服務 - Whisper / faster-whisper（backend 見 services/asr_backends.py）
+
+輸入可以是 wav 路徑，或 `utils/pcm.py` 的 PCM buffer（記憶體中的 16 kHz float32，不落地）；
+切段時各段以 wav 路徑或 shared memory 的 `PCMSlice` 交給 process pool。
 """
-from typing import List
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Union
 from models import TranscriptSentence
 
 # flexible settings import
@@ -13,47 +22,147 @@ except Exception:
     except Exception:
         settings = type("_S", (), {})()
 
-# whisper fallback
 try:
-    import whisper
+    from video_pipeline.services.asr_backends import get_asr_backend
+    from video_pipeline.utils.pcm import PCMBuffer, PCMSlice, attach_pcm
 except Exception:
-    class _WhisperModelStub:
-        def transcribe(self, audio_path, **kwargs):
-            return {"segments": []}
+    from services.asr_backends import get_asr_backend
+    from utils.pcm import PCMBuffer, PCMSlice, attach_pcm
 
-    class _Whisper:
-        @staticmethod
-        def load_model(name):
-            return _WhisperModelStub()
 
-    whisper = _Whisper()
+def _transcribe_segment_worker(
+    backend: str, model_name: str, audio: Union[str, PCMSlice]
+) -> Tuple[List[Dict[str, Any]], float]:
+    """
+    在子 process 內轉寫一段音訊（backend 每個 process 只載入一次），時間相對於該段開頭
+    audio: 切段 wav 路徑，或 shared memory 中的 PCMSlice（直接 attach，不複製）
+    """
+    if isinstance(audio, PCMSlice):
+        with attach_pcm(audio) as samples:
+            return get_asr_backend(backend, model_name).transcribe(samples)
+    return get_asr_backend(backend, model_name).transcribe(audio)
+
+
+def merge_segment_transcripts(
+    results: List[Tuple[float, float, List[Dict[str, Any]]]]
+) -> List[TranscriptSentence]:
+    """
+    合併各段結果：時間加上段落起點、限制在段落範圍內，index 依全片順序重新編號
+    results: [(segment_start, segment_end, segments), ...]
+    """
+    sentences: List[TranscriptSentence] = []
+    for seg_start, seg_end, segments in sorted(results, key=lambda r: r[0]):
+        for seg in segments:
+            text = seg["text"].strip()
+            if not text:
+                continue
+            start = min(seg_start + seg["start"], seg_end)
+            end = min(max(seg_start + seg["end"], start), seg_end)
+            words = [
+                dict(w, start=min(seg_start + w["start"], seg_end), end=min(seg_start + w["end"], seg_end))
+                for w in seg.get("words") or []
+            ]
+            sentences.append(
+                TranscriptSentence(
+                    index=len(sentences),
+                    text=text,
+                    start=start,
+                    end=end,
+                    duration=end - start,
+                    words=words
+                )
+            )
+    return sentences
 
 
 class TranscriptionService:
-    
+    """
+    ASR 服務：backend / model 可每個 job 指定（None = settings.ASR_BACKEND / WHISPER_MODEL），
+    並累計每個 backend 的 real-time factor（處理時間 / 音訊長度）。
+    """
+
     def __init__(self):
-        self.model = whisper.load_model(getattr(settings, 'WHISPER_MODEL', 'base'))
-    
-    async def transcribe(self, audio_path: str) -> List[TranscriptSentence]:
+        self.backend_name = getattr(settings, 'ASR_BACKEND', 'whisper')
+        self.model_name = getattr(settings, 'WHISPER_MODEL', 'base')
+        self._pool = None
+        self._stats_lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    def _resolve(self, backend: Optional[str], model: Optional[str]) -> Tuple[str, str]:
+        return backend or self.backend_name, model or self.model_name
+
+    def _record(self, backend: str, model: str, audio_seconds: float, elapsed: float) -> Dict[str, Any]:
+        key = f"{backend}:{model}"
+        with self._stats_lock:
+            entry = self.stats.setdefault(key, {"runs": 0, "audio_seconds": 0.0, "processing_seconds": 0.0})
+            entry["runs"] += 1
+            entry["audio_seconds"] += audio_seconds
+            entry["processing_seconds"] += elapsed
+            entry["rtf"] = round(entry["processing_seconds"] / entry["audio_seconds"], 4) if entry["audio_seconds"] else None
+        run = {
+            "backend": backend,
+            "model": model,
+            "audio_seconds": round(audio_seconds, 3),
+            "processing_seconds": round(elapsed, 3),
+            "rtf": round(elapsed / audio_seconds, 4) if audio_seconds else None
+        }
+        return run
+
+    async def transcribe(
+        self,
+        audio: Union[str, PCMBuffer, Any],
+        backend: Optional[str] = None,
+        model: Optional[str] = None,
+        run_info: Optional[Dict[str, Any]] = None
+    ) -> List[TranscriptSentence]:
         """
-        用 Whisper 轉文字，帶時間戳
+        轉文字，帶句子與單字時間戳
+        audio: wav 路徑、PCMBuffer 或 16 kHz mono float32 array（後兩者不經過磁碟）
+        run_info: 傳入 dict 時寫入這次的 backend / model / RTF
         """
-        result = self.model.transcribe(
-            audio_path,
-            word_timestamps=True,
-            verbose=False
+        backend, model = self._resolve(backend, model)
+        if isinstance(audio, PCMBuffer):
+            audio = audio.array
+        started = time.perf_counter()
+        segments, audio_seconds = await asyncio.to_thread(
+            lambda: get_asr_backend(backend, model).transcribe(audio)
         )
-        
-        sentences = []
-        for i, segment in enumerate(result["segments"]):
-            sentences.append(
-                TranscriptSentence(
-                    index=i,
-                    text=segment["text"].strip(),
-                    start=segment["start"],
-                    end=segment["end"],
-                    duration=segment["end"] - segment["start"]
-                )
+        run = self._record(backend, model, audio_seconds, time.perf_counter() - started)
+        if run_info is not None:
+            run_info.update(run)
+        return merge_segment_transcripts([(0.0, float("inf"), segments)])
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            workers = int(getattr(settings, "SEGMENT_WORKERS", 0) or 0) or min(4, os.cpu_count() or 1)
+            # spawn：避免 fork 已載入 torch 的 process
+            self._pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
             )
-        
-        return sentences
\ No newline at end of file
+        return self._pool
+
+    async def transcribe_segments(
+        self,
+        segments: List[Dict[str, Any]],
+        backend: Optional[str] = None,
+        model: Optional[str] = None,
+        run_info: Optional[Dict[str, Any]] = None
+    ) -> List[TranscriptSentence]:
+        """
+        各段音訊在 process pool 中並行轉寫，再合併成全片 transcript
+        segments: VideoProcessor.split_for_parallel 的結果（每段帶 "audio_path" 或 "pcm"）
+        """
+        backend, model = self._resolve(backend, model)
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        started = time.perf_counter()
+        outputs = await asyncio.gather(*(
+            loop.run_in_executor(pool, _transcribe_segment_worker, backend, model, seg.get("pcm") or seg["audio_path"])
+            for seg in segments
+        ))
+        run = self._record(backend, model, sum(seconds for _, seconds in outputs), time.perf_counter() - started)
+        if run_info is not None:
+            run_info.update(run, segments=len(segments))
+        return merge_segment_transcripts([
+            (seg["start"], seg["end"], out) for seg, (out, _) in zip(segments, outputs)
+        ])
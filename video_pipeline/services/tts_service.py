@@ -1,7 +1,8 @@
 # ==================== TTS ====================
-import subprocess
+import asyncio
+import wave
 from pathlib import Path
-from typing import List, Any, Dict
+from typing import List, Any, Dict, Optional
 
 import httpx
 
@@ -10,19 +11,57 @@ try:
 except Exception:
     from config import settings
 
+try:
+    from video_pipeline.utils.disk_cache import DiskLRUCache
+    from video_pipeline.utils.storage import get_storage
+except Exception:
+    from utils.disk_cache import DiskLRUCache
+    from utils.storage import get_storage
+
+
+_audio_cache = None
+
+
+def get_audio_cache() -> DiskLRUCache:
+    """同一 process 內共用的 TTS 句子快取"""
+    global _audio_cache
+    if _audio_cache is None:
+        cache_dir = getattr(settings, "TTS_CACHE_DIR", None) or Path(getattr(settings, "BASE_DIR", Path.cwd())) / "cache" / "tts"
+        max_mb = int(getattr(settings, "TTS_CACHE_MAX_MB", 512))
+        _audio_cache = DiskLRUCache(Path(cache_dir), max_mb * 1024 * 1024, suffix=".pcm")
+    return _audio_cache
+
 
 class TTSService:
-    async def generate_dialogue(self, script: List[Any], job_id: str, title: str) -> Dict:
+    # ElevenLabs `pcm_*` 輸出為 16-bit little-endian mono raw PCM
+    SAMPLE_WIDTH = 2
+
+    def __init__(self, transport=None):
+        # transport：給測試用的 httpx transport（e.g. `httpx.MockTransport`），正式環境為 None
+        self.transport = transport
+        self.sample_rate = int(getattr(settings, "TTS_SAMPLE_RATE", 44100))
+        self.max_concurrency = max(1, int(getattr(settings, "TTS_MAX_CONCURRENCY", 4)))
+        self.cache = get_audio_cache() if getattr(settings, "TTS_CACHE_ENABLED", True) else None
+
+    async def generate_dialogue(self, script: List[Any], job_id: str, title: str,
+                                warnings: Optional[List[str]] = None) -> Dict:
         """用 ElevenLabs 生成對白 / Generate dialogue audio via ElevenLabs
 
+        每句分開並行合成（最多 `TTS_MAX_CONCURRENCY` 個同時進行），再依順序把 PCM 無損接成一個 wav；
+        每句的 start / end 直接由 PCM 長度計算，不需要 ffprobe。
+        已合成過的句子（同文字 + voice + model + voice settings）直接從快取取用，只改一句就只重合成那一句；
+        同一份稿內重複的句子只合成一次。快取讀寫在 thread 執行，不卡 event loop。
+
+        某句合成失敗（API 錯誤 / 逾時）時，以該句原本長度（transcript 的 duration）的靜音代替，
+        後面句子的時間軸不會位移；失敗的句子寫入 `warnings`。
+
         注意：此方法假設 `settings.ELEVENLABS_API_KEY` 與 `settings.ELEVENLABS_API_URL` 已設定。
         若環境沒有這些參數，會嘗試仍然完成檔案路徑建立並回傳 stub 結果。
         """
-        output_dir = Path(f"outputs/{job_id}_{title}/audio")
-        output_dir.mkdir(parents=True, exist_ok=True)
+        output_dir = get_storage().job_path(job_id, "audio")
         audio_path = output_dir / "dialogue.wav"
 
-        # 合併所有句子文字（若 script 中元素沒有 text 屬性，會忽略）
+        # 逐句取文字（若 script 中元素沒有 text 屬性，改用 str()）
         texts = []
         for s in script:
             try:
@@ -31,42 +70,129 @@ class TTSService:
                 try:
                     texts.append(str(s))
                 except Exception:
-                    continue
-        full_text = " ".join(texts).strip()
-
-        if full_text and getattr(settings, "ELEVENLABS_API_KEY", None) and getattr(settings, "ELEVENLABS_API_URL", None):
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                response = await client.post(
-                    f"{settings.ELEVENLABS_API_URL}/YOUR_VOICE_ID",
-                    headers={
-                        "xi-api-key": settings.ELEVENLABS_API_KEY,
-                        "Content-Type": "application/json"
-                    },
-                    json={"text": full_text, "model_id": "eleven_multilingual_v2"}
-                )
-                try:
-                    response.raise_for_status()
-                except Exception:
-                    # 若 API 呼叫失敗，建立空的檔案並回傳 error duration 0
-                    audio_path.write_bytes(b"")
-                else:
-                    audio_path.write_bytes(response.content)
+                    texts.append("")
+
+        cache_stats = {"hits": 0, "misses": 0}
+        if any(t.strip() for t in texts) and getattr(settings, "ELEVENLABS_API_KEY", None) and getattr(settings, "ELEVENLABS_API_URL", None):
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            async with httpx.AsyncClient(timeout=120.0, transport=self.transport) as client:
+                # 相同文字（strip 後）只送一次
+                unique = list(dict.fromkeys(t.strip() for t in texts))
+                results = await asyncio.gather(*(
+                    self._synthesize_bounded(semaphore, client, text, cache_stats) for text in unique
+                ), return_exceptions=True)
+            by_text = dict(zip(unique, results))
+            pcm_parts = [by_text[t.strip()] for t in texts]
+            pcm_parts = [
+                self._silence_for(i, script[i], part, warnings) if isinstance(part, BaseException) else part
+                for i, part in enumerate(pcm_parts)
+            ]
         else:
-            # 沒有可用的 API key 或文字，建立空檔作為 stub
-            audio_path.write_bytes(b"")
-
-        # 用 ffprobe 取時長（若 ffprobe 不存在或解析失敗，回傳 0）
-        duration = 0.0
-        try:
-            result = subprocess.run(
-                ["ffprobe", "-v", "quiet", "-show_entries", "format=duration",
-                 "-of", "default=noprint_wrappers=1:nokey=1", str(audio_path)],
-                capture_output=True, text=True, check=True
-            )
-            out = result.stdout.strip()
-            if out:
-                duration = float(out)
-        except Exception:
-            duration = 0.0
-
-        return {"audio_path": str(audio_path), "duration": duration, "sentence_timings": []}
+            # 沒有可用的 API key 或文字，輸出空音訊作為 stub
+            pcm_parts = [b"" for _ in texts]
+
+        gap = b"\x00" * (int(self.sample_rate * float(getattr(settings, "TTS_SENTENCE_GAP", 0.0))) * self.SAMPLE_WIDTH)
+        sentence_timings = []
+        cursor = 0  # 以 sample 計算，避免浮點誤差累積
+        with wave.open(str(audio_path), "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(self.SAMPLE_WIDTH)
+            wav.setframerate(self.sample_rate)
+            for i, pcm in enumerate(pcm_parts):
+                if i > 0 and gap:
+                    wav.writeframes(gap)
+                    cursor += len(gap) // self.SAMPLE_WIDTH
+                start = cursor
+                wav.writeframes(pcm)
+                cursor += len(pcm) // self.SAMPLE_WIDTH
+                sentence_timings.append({
+                    "index": i,
+                    "start": start / self.sample_rate,
+                    "end": cursor / self.sample_rate
+                })
+
+        duration = cursor / self.sample_rate
+        return {
+            "audio_path": str(audio_path),
+            "duration": duration,
+            "sentence_timings": sentence_timings,
+            "cache": cache_stats
+        }
+
+    async def _synthesize_bounded(
+        self, semaphore: asyncio.Semaphore, client: Any, text: str, cache_stats: Dict[str, int]
+    ) -> bytes:
+        key = self._cache_key(text)
+        if self.cache is not None and text.strip():
+            pcm = await asyncio.to_thread(self.cache.get, key)
+            if pcm is not None:
+                cache_stats["hits"] += 1
+                return pcm
+            cache_stats["misses"] += 1
+
+        async with semaphore:
+            pcm = await self._synthesize(client, text)
+
+        # 空音訊不寫入快取
+        if self.cache is not None and pcm:
+            await asyncio.to_thread(self.cache.put, key, pcm)
+        return pcm
+
+    def _cache_key(self, text: str) -> str:
+        return DiskLRUCache.make_key(
+            text=(text or "").strip(),
+            voice_id=self._voice_id(),
+            model_id=self._model_id(),
+            voice_settings=self._voice_settings(),
+            output_format=f"pcm_{self.sample_rate}"
+        )
+
+    def _silence_for(self, index: int, sentence: Any, error: BaseException, warnings: Optional[List[str]]) -> bytes:
+        """合成失敗的句子：回傳原本長度的靜音並記錄 warning（job 取消時照常往上拋）"""
+        if isinstance(error, asyncio.CancelledError):
+            raise error
+        seconds = float(getattr(sentence, "duration", 0.0) or 0.0)
+        if seconds <= 0:
+            seconds = max(0.0, float(getattr(sentence, "end", 0.0) or 0.0) - float(getattr(sentence, "start", 0.0) or 0.0))
+        message = f"TTS: sentence {index} failed ({type(error).__name__}: {error}), inserted {seconds:.2f}s of silence"
+        print(message)
+        if warnings is not None:
+            warnings.append(message)
+        return b"\x00" * (int(round(seconds * self.sample_rate)) * self.SAMPLE_WIDTH)
+
+    async def _synthesize(self, client: Any, text: str) -> bytes:
+        """合成單句，回傳 raw PCM；空句回傳空 bytes，API 失敗 / 逾時直接拋出"""
+        if not text or not text.strip():
+            return b""
+        response = await client.post(
+            f"{settings.ELEVENLABS_API_URL}/{self._voice_id()}",
+            params={"output_format": f"pcm_{self.sample_rate}"},
+            headers={
+                "xi-api-key": settings.ELEVENLABS_API_KEY,
+                "Content-Type": "application/json"
+            },
+            json=self._request_body(text)
+        )
+        response.raise_for_status()
+        pcm = response.content
+        # 確保 sample 對齊，避免後面的句子錯位
+        return pcm[: len(pcm) - len(pcm) % self.SAMPLE_WIDTH]
+
+    def _request_body(self, text: str) -> Dict[str, Any]:
+        body: Dict[str, Any] = {"text": text.strip(), "model_id": self._model_id()}
+        voice_settings = self._voice_settings()
+        if voice_settings:
+            body["voice_settings"] = voice_settings
+        return body
+
+    @staticmethod
+    def _voice_settings() -> Dict[str, Any]:
+        return dict(getattr(settings, "TTS_VOICE_SETTINGS", None) or {})
+
+    @staticmethod
+    def _voice_id() -> str:
+        return getattr(settings, "ELEVENLABS_VOICE_ID", "YOUR_VOICE_ID")
+
+    @staticmethod
+    def _model_id() -> str:
+        return getattr(settings, "ELEVENLABS_MODEL_ID", "eleven_multilingual_v2")
@@ -1,5 +1,5 @@
+import asyncio
 import subprocess
-import shutil
 from pathlib import Path
 from typing import Any, Dict, Iterable, List, Optional
 
@@ -12,19 +12,39 @@ except Exception:
     except Exception:
         settings = None
 
+try:
+    from video_pipeline.utils.media_executor import get_media_executor
+    from video_pipeline.utils.render_manifest import RenderManifest, file_hash
+    from video_pipeline.utils.storage import get_storage
+except Exception:
+    from utils.media_executor import get_media_executor
+    from utils.render_manifest import RenderManifest, file_hash
+    from utils.storage import get_storage
+
 
 class VideoAssembler:
-    async def assemble(self, clips: Iterable[Any], dialogue: Dict[str, Any], music: str, srt_data: List[Any], job_id: str, title: str) -> Dict[str, Any]:
+    MIX_FILTER = "[0:a]volume=1.0[a1];[1:a]volume=0.3[a2];[a1][a2]amix=inputs=2[aout]"
+
+    async def assemble(self, clips: Iterable[Any], dialogue: Dict[str, Any], music: str, srt_data: Optional[List[Any]], job_id: str, title: str, profile: Optional[Dict[str, Any]] = None, renditions: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
         """Assemble final video.
 
-        - Ensures `outputs/{job_id}_{title}` exists.
+        - Writes into the job directory owned by `StorageManager` (under `settings.OUTPUT_DIR`).
         - Guards ffmpeg calls and returns helpful error info on failure.
+        - Clips are concatenated and muxed with stream copy only; the dialogue/music mix is
+          reused when its inputs are unchanged (tracked in the render manifest), so an
+          incremental re-render only pays for the clips that were re-encoded.
+        - `srt_data=None` keeps the existing subtitles file.
+        - `profile` (see `config.render_profile`) picks the output name and ffmpeg priority,
+          so a draft preview does not overwrite the final video.
+        - `renditions` (default: `profile["renditions"]`, i.e. `settings.RENDITIONS` for full
+          renders) are encoded from the final video in one extra ffmpeg pass, see `render_renditions()`.
+          A rendition failure does not fail the assembly; it is reported as `renditions_error`.
         """
-        base = Path(getattr(settings, "BASE_DIR", Path.cwd())) if settings else Path.cwd()
-        output_dir = base / f"outputs/{job_id}_{title}"
-        output_dir.mkdir(parents=True, exist_ok=True)
+        profile = profile or {}
+        priority = profile.get("media_priority", "final")
+        output_dir = get_storage().job_dir(job_id)
 
-        final_video = output_dir / "final_video.mp4"
+        final_video = output_dir / profile.get("output_name", "final_video.mp4")
         srt_path = output_dir / "subtitles.srt"
 
         # helper to normalize clip item -> video path string
@@ -50,66 +70,202 @@ class VideoAssembler:
 
         temp_video = output_dir / "temp_video.mp4"
 
-        ffmpeg_cmd = shutil.which("ffmpeg") or "ffmpeg"
+        executor = get_media_executor()
 
         try:
-            subprocess.run([
-                ffmpeg_cmd, "-f", "concat", "-safe", "0",
+            await executor.ffmpeg([
+                "-f", "concat", "-safe", "0",
                 "-i", str(concat_list), "-c", "copy", "-y", str(temp_video)
-            ], check=True)
+            ], priority=priority)
         except FileNotFoundError:
             return {"error": "ffmpeg not found on PATH"}
         except subprocess.CalledProcessError as e:
             return {"error": "ffmpeg concat failed", "details": str(e)}
 
-        # 2. Mix dialogue + music audio
-        mixed_audio = output_dir / "mixed_audio.mp3"
-        dialogue_audio = dialogue.get("audio_path") if isinstance(dialogue, dict) else getattr(dialogue, "audio_path", None)
-        if not dialogue_audio:
-            return {"error": "dialogue audio not provided"}
-
-        try:
-            subprocess.run([
-                ffmpeg_cmd,
-                "-i", str(dialogue_audio),
-                "-i", str(music),
-                "-filter_complex", "[0:a]volume=1.0[a1];[1:a]volume=0.3[a2];[a1][a2]amix=inputs=2[aout]",
-                "-map", "[aout]", "-y", str(mixed_audio)
-            ], check=True)
-        except FileNotFoundError:
-            return {"error": "ffmpeg not found on PATH"}
-        except subprocess.CalledProcessError as e:
-            return {"error": "ffmpeg mix failed", "details": str(e)}
+        # 2. Mix dialogue + music audio (reused when already mixed from the same inputs)
+        mix = await self.mix_audio(dialogue, music, job_id, profile)
+        if "error" in mix:
+            return mix
+        mixed_audio = mix["path"]
 
         # 3. Merge video + audio
         try:
-            subprocess.run([
-                ffmpeg_cmd,
+            await executor.ffmpeg([
                 "-i", str(temp_video),
                 "-i", str(mixed_audio),
                 "-c:v", "copy", "-c:a", "aac", "-shortest",
                 "-y", str(final_video)
-            ], check=True)
+            ], priority=priority)
         except FileNotFoundError:
             return {"error": "ffmpeg not found on PATH"}
         except subprocess.CalledProcessError as e:
             return {"error": "ffmpeg merge failed", "details": str(e)}
 
         # 4. Generate SRT
-        try:
-            self._generate_srt(srt_data, srt_path)
-        except Exception as e:
-            return {"error": "srt generation failed", "details": str(e)}
+        if srt_data is not None or not srt_path.exists():
+            try:
+                self._generate_srt(srt_data or [], srt_path)
+            except Exception as e:
+                return {"error": "srt generation failed", "details": str(e)}
 
         duration = dialogue.get("duration") if isinstance(dialogue, dict) else getattr(dialogue, "duration", None)
 
-        return {
+        result = {
             "video_path": str(final_video),
             "srt_path": str(srt_path),
             "duration": duration,
-            "clips_count": written
+            "clips_count": written,
+            "renditions": []
         }
 
+        # 5. Rendition ladder (one decode, one scaled encode per rendition)
+        ladder = renditions if renditions is not None else profile.get("renditions") or []
+        if ladder:
+            out = await self.render_renditions(final_video, ladder, job_id, profile, srt_path)
+            if "error" in out:
+                result["renditions_error"] = out["error"] + (f": {out['details']}" if out.get("details") else "")
+            else:
+                result["renditions"] = out["renditions"]
+
+        return result
+
+    @staticmethod
+    def _filter_path(path: Path) -> str:
+        """Escape a path for use inside a quoted filtergraph option (Windows drive colons)."""
+        return str(path).replace("\\", "/").replace(":", "\\:").replace("'", "\\'")
+
+    @classmethod
+    def rendition_filter(cls, rendition: Dict[str, Any], srt_path: Optional[Path] = None) -> str:
+        """Filter chain for one rendition.
+
+        `crop: true` fills the frame and crops the overflow (e.g. a square cut of a 9:16 video);
+        otherwise the video is fitted and padded. `srt_path` burns the subtitles in at the
+        rendition's own resolution.
+        """
+        w, h = int(rendition["width"]), int(rendition["height"])
+        if rendition.get("crop"):
+            chain = f"scale={w}:{h}:force_original_aspect_ratio=increase,crop={w}:{h}"
+        else:
+            chain = f"scale={w}:{h}:force_original_aspect_ratio=decrease,pad={w}:{h}:(ow-iw)/2:(oh-ih)/2"
+        chain += ",setsar=1"
+        if srt_path is not None:
+            chain += f",subtitles='{cls._filter_path(srt_path)}'"
+        return chain
+
+    async def render_renditions(self, source: Path, ladder: List[Dict[str, Any]], job_id: str, profile: Optional[Dict[str, Any]] = None, srt_path: Optional[Path] = None) -> Dict[str, Any]:
+        """Encode every rendition of `source` in a single ffmpeg run.
+
+        The source is decoded once and `split` into one scaled (optionally subtitled) branch per
+        rendition; audio is stream-copied. Ladder entries: `{"name", "width", "height",
+        "crop": bool, "subtitles": bool}` (`subtitles` defaults to `settings.RENDITION_SUBTITLES`).
+        Renditions whose inputs hash (source video, spec, encoder settings, subtitles) matches the
+        render manifest are reused, so only stale ones are encoded.
+        Returns `{"renditions": [...]}` in ladder order, or an error dict like `assemble()`.
+        """
+        profile = profile or {}
+        priority = profile.get("media_priority", "final")
+        output_dir = get_storage().job_path(job_id, "renditions")
+        burn_default = bool(getattr(settings, "RENDITION_SUBTITLES", False))
+        preset = profile.get("x264_preset") or getattr(settings, "X264_PRESET", "medium")
+        crf = str(profile.get("x264_crf") or getattr(settings, "X264_CRF", 23))
+
+        manifest = RenderManifest(get_storage().job_dir(job_id))
+        source_hash = await asyncio.to_thread(file_hash, str(source))
+        srt_hash = await asyncio.to_thread(file_hash, str(srt_path)) if srt_path is not None else None
+
+        results: List[Dict[str, Any]] = []
+        stale: List[Dict[str, Any]] = []
+        for rendition in ladder:
+            name = str(rendition["name"])
+            burn = bool(rendition.get("subtitles", burn_default)) and srt_path is not None and Path(srt_path).exists()
+            spec = {
+                "name": name, "width": int(rendition["width"]), "height": int(rendition["height"]),
+                "crop": bool(rendition.get("crop")), "subtitles": burn
+            }
+            content_hash = file_hash("", source_hash, spec, preset, crf, srt_hash if burn else None)
+            video_path = output_dir / f"{Path(source).stem}_{name}.mp4"
+            entry = dict(spec, video_path=str(video_path), reused=False)
+            previous = manifest.data["renditions"].get(name) or {}
+            if previous.get("hash") == content_hash and video_path.exists():
+                entry["reused"] = True
+            else:
+                stale.append(dict(entry, hash=content_hash))
+            results.append(entry)
+
+        if stale:
+            executor = get_media_executor()
+            branches = [f"[v{i}]" for i in range(len(stale))]
+            graph = [f"[0:v]split={len(stale)}{''.join(branches)}" if len(stale) > 1 else "[0:v]null[v0]"]
+            args: List[str] = ["-i", str(source)]
+            # the whole run holds one executor slot: share its thread budget across the encoders
+            threads = max(1, executor.threads_per_process // len(stale))
+            for i, entry in enumerate(stale):
+                graph.append(f"[v{i}]{self.rendition_filter(entry, srt_path if entry['subtitles'] else None)}[o{i}]")
+            args += ["-filter_complex", ";".join(graph)]
+            for i, entry in enumerate(stale):
+                args += [
+                    "-map", f"[o{i}]", "-map", "0:a?",
+                    "-c:v", "libx264", "-preset", preset, "-crf", crf, "-pix_fmt", "yuv420p",
+                    "-c:a", "copy", "-movflags", "+faststart",
+                    "-threads", str(threads),
+                    "-y", entry["video_path"]
+                ]
+            try:
+                await executor.ffmpeg(args, priority=priority)
+            except FileNotFoundError:
+                return {"error": "ffmpeg not found on PATH"}
+            except subprocess.CalledProcessError as e:
+                return {"error": "ffmpeg renditions failed", "details": str(e)}
+            for entry in stale:
+                manifest.data["renditions"][entry["name"]] = {"hash": entry["hash"], "video_path": entry["video_path"]}
+            manifest.save(only=("renditions",))
+
+        return {"renditions": results}
+
+    async def mix_audio(self, dialogue: Dict[str, Any], music: str, job_id: str, profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Mix dialogue + music into `mixed_audio.mp3` in the job directory.
+
+        Skips ffmpeg when the inputs hash matches the render manifest. The pipeline calls this
+        as soon as TTS and music are ready, so `assemble()` only has to concat and mux.
+        Returns `{"path": ...}` or an error dict like `assemble()`.
+        """
+        priority = (profile or {}).get("media_priority", "final")
+        output_dir = get_storage().job_dir(job_id)
+        mixed_audio = output_dir / "mixed_audio.mp3"
+        dialogue_audio = dialogue.get("audio_path") if isinstance(dialogue, dict) else getattr(dialogue, "audio_path", None)
+        if not dialogue_audio:
+            return {"error": "dialogue audio not provided"}
+
+        manifest = RenderManifest(output_dir)
+        # 音樂生成失敗 / 沒有 API key 時 music 為空檔或不存在：只用對白
+        has_music = bool(music) and await asyncio.to_thread(
+            lambda: Path(music).is_file() and Path(music).stat().st_size > 0
+        )
+        mix_filter = self.MIX_FILTER if has_music else None
+        mix_hash = await asyncio.to_thread(
+            lambda: file_hash(str(dialogue_audio), file_hash(str(music)) if has_music else None, mix_filter)
+        )
+        if manifest.data["mixed_audio"].get("hash") != mix_hash or not mixed_audio.exists():
+            if has_music:
+                args = [
+                    "-i", str(dialogue_audio),
+                    "-i", str(music),
+                    "-filter_complex", self.MIX_FILTER,
+                    "-map", "[aout]", "-y", str(mixed_audio)
+                ]
+            else:
+                args = ["-i", str(dialogue_audio), "-y", str(mixed_audio)]
+            try:
+                await get_media_executor().ffmpeg(args, priority=priority)
+            except FileNotFoundError:
+                return {"error": "ffmpeg not found on PATH"}
+            except subprocess.CalledProcessError as e:
+                return {"error": "ffmpeg mix failed", "details": str(e)}
+            manifest.data["mixed_audio"] = {"hash": mix_hash, "path": str(mixed_audio)}
+            # clip encoding may save the manifest concurrently; only write our key
+            manifest.save(only=("mixed_audio",))
+        return {"path": mixed_audio}
+
     def _generate_srt(self, script: List[Any], output_path: Path) -> None:
         """Write .srt subtitle file. Accepts list of objects or dicts with start/end/text."""
         with open(output_path, "w", encoding="utf-8") as f:
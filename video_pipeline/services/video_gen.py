@@ -1,5 +1,3 @@
-from pathlib import Path
-import subprocess
 
 # flexible settings import
 try:
@@ -10,32 +8,149 @@ except Exception:
     except Exception:
         settings = type("_S", (), {})()
 
+import asyncio
+import math
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+try:
+    from video_pipeline.utils.media_executor import get_media_executor
+    from video_pipeline.utils.render_manifest import RenderManifest, file_hash
+    from video_pipeline.utils.storage import get_storage
+except Exception:
+    from utils.media_executor import get_media_executor
+    from utils.render_manifest import RenderManifest, file_hash
+    from utils.storage import get_storage
+
 
 class VideoGenService:
-    async def generate_clips(self, images_result: dict, job_id: str, title: str):
-        """圖生 3 秒影片（Runway / Pika / 自己 ComfyUI）"""
-        output_dir = Path(f"outputs/{job_id}_{title}/video")
-        output_dir.mkdir(parents=True, exist_ok=True)
-        
-        clips = []
-        for img_data in images_result["ok"]:
+
+    # 同一張圖衍生的兄弟 clip（variation 1, 2, ...）輪流用的鏡頭運動
+    MOTIONS = ("zoom_in", "pan_right", "zoom_out", "pan_left")
+    MOTION_FPS = 25
+
+    @classmethod
+    def motion_filter(cls, variation: int, width: int, height: int, duration: float) -> str:
+        """variation >= 1：在 encoder 內用 zoompan 做推近 / 拉遠 / 平移，不需要另外生圖"""
+        frames = max(1, math.ceil(duration * cls.MOTION_FPS))
+        motion = cls.MOTIONS[(variation - 1) % len(cls.MOTIONS)]
+        center_x, center_y = "iw/2-(iw/zoom/2)", "ih/2-(ih/zoom/2)"
+        if motion == "zoom_in":
+            z, x, y = "min(zoom+0.0015,1.3)", center_x, center_y
+        elif motion == "zoom_out":
+            z, x, y = "if(eq(on,0),1.3,max(zoom-0.0015,1))", center_x, center_y
+        elif motion == "pan_right":
+            z, x, y = "1.2", f"(iw-iw/zoom)*on/{frames}", center_y
+        else:
+            z, x, y = "1.2", f"(iw-iw/zoom)*(1-on/{frames})", center_y
+        # 先放大再 zoompan，避免整數座標造成的抖動
+        return (
+            f"scale={width * 2}:{height * 2},"
+            f"zoompan=z='{z}':x='{x}':y='{y}':d={frames}:s={width}x{height}:fps={cls.MOTION_FPS}"
+        )
+
+    @classmethod
+    def encode_args(cls, profile: Dict[str, Any], duration: float = 3.0, variation: int = 0) -> List[str]:
+        """x264 參數（依 render profile）；也算進 clip hash，改了參數的 clip 都會重新編碼"""
+        width, height = int(profile.get("width") or 576), int(profile.get("height") or 1024)
+        video_filter = cls.motion_filter(variation, width, height, duration) if variation else f"scale={width}:{height}"
+        return [
+            "-c:v", "libx264",
+            "-preset", profile.get("x264_preset") or getattr(settings, "X264_PRESET", "medium"),
+            "-crf", str(profile.get("x264_crf") or getattr(settings, "X264_CRF", 23)),
+            "-t", f"{duration:g}", "-pix_fmt", "yuv420p",
+            "-vf", video_filter
+        ]
+
+    async def generate_clips(
+        self, images_result: dict, job_id: str, title: str, force: Iterable[str] = (),
+        profile: Optional[Dict[str, Any]] = None
+    ):
+        """圖生 3 秒影片（Runway / Pika / 自己 ComfyUI）
+
+        增量：依 render manifest 比對「圖檔內容 + 編碼參數」的 hash，沒變的 clip 直接沿用上次的 mp4，
+        只重新編碼有變動（或列在 `force`）的 clip。回傳的每個 clip 帶 `reused` 標記。
+        草稿模式（profile）用低解析度與快速 preset；圖片項目帶 `duration` 時 clip 長度跟著調整。
+        """
+        images = list(images_result["ok"])
+        queue: asyncio.Queue = asyncio.Queue()
+        for img in images:
+            queue.put_nowait(img)
+        queue.put_nowait(None)
+        clips = await self.generate_clips_stream(queue, job_id, force, profile, workers=max(1, len(images)))
+        order = {img["clip_id"]: i for i, img in enumerate(images)}
+        return sorted(clips, key=lambda c: order[c["clip_id"]])
+
+    async def generate_clips_stream(
+        self,
+        queue: "asyncio.Queue",
+        job_id: str,
+        force: Iterable[str] = (),
+        profile: Optional[Dict[str, Any]] = None,
+        workers: Optional[int] = None,
+        on_clip: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        串流版：從 queue 取圖片項目（`None` 表示結束）邊收邊編碼，圖片不必全部通過安全檢查才開始。
+        `workers` 個 consumer 並行（預設 CLIP_ENCODE_WORKERS，0 = media executor 的並行上限）；
+        queue 有上限時，編碼跟不上會讓上游生圖暫停（backpressure）。回傳依完成順序。
+        """
+        profile = profile or {}
+        priority = profile.get("media_priority", "final")
+        output_dir = get_storage().job_path(job_id, "video")
+        manifest = RenderManifest(get_storage().job_dir(job_id))
+        force = set(force)
+        workers = workers or int(getattr(settings, "CLIP_ENCODE_WORKERS", 0) or 0) or get_media_executor().max_processes
+        clips: List[Dict[str, Any]] = []
+        seen: List[str] = []
+
+        async def render(img_data: dict) -> dict:
             clip_id = img_data["clip_id"]
             img_path = img_data["img_path"]
             video_path = output_dir / f"clip_{clip_id}.mp4"
+            variation = int(img_data.get("variation") or 0)
+            encode_args = self.encode_args(profile, float(img_data.get("duration") or 3.0), variation)
+            content_hash = await asyncio.to_thread(file_hash, img_path, encode_args)
+            clip = {"clip_id": clip_id, "video_path": str(video_path), "reused": False}
+            if variation:
+                clip["variation"] = variation
+            if img_data.get("duration"):
+                clip["duration"] = float(img_data["duration"])
+            if clip_id not in force and manifest.is_fresh(clip_id, content_hash):
+                return dict(clip, video_path=manifest.clips[clip_id]["video_path"], reused=True)
             
             # 示範：假設用 Runway API
             # 實際你可用 ComfyUI workflow
             
-            # 暫時用 ffmpeg 做靜態 3 秒片（佔位）
-            subprocess.run([
-                "ffmpeg", "-loop", "1", "-i", img_path,
-                "-c:v", "libx264", "-t", "3", "-pix_fmt", "yuv420p",
-                "-vf", "scale=576:1024", "-y", str(video_path)
-            ], check=True)
-            
-            clips.append({
-                "clip_id": clip_id,
-                "video_path": str(video_path)
-            })
+            # 暫時用 ffmpeg 做靜態 3 秒片（佔位）；兄弟 clip 由 zoompan 從單張圖產生 d 個 frame，不用 -loop
+            input_args = ["-i", img_path] if variation else ["-loop", "1", "-i", img_path]
+            await get_media_executor().ffmpeg(
+                input_args + encode_args + ["-y", str(video_path)],
+                priority=priority
+            )
+            manifest.set_clip(clip_id, img_path, content_hash, str(video_path))
+            return clip
+
+        async def consume():
+            while True:
+                img_data = await queue.get()
+                if img_data is None:
+                    # 把結束標記留給其他 consumer
+                    await queue.put(None)
+                    return
+                seen.append(img_data["clip_id"])
+                clip = await render(img_data)
+                clips.append(clip)
+                if on_clip is not None:
+                    on_clip(clip)
+
+        tasks = [asyncio.create_task(consume()) for _ in range(workers)]
+        try:
+            await asyncio.gather(*tasks)
+            manifest.drop_missing(seen)
+        finally:
+            # 一個 clip 失敗就停止其他 consumer；已完成的 clip 仍記在 manifest，下次只需補做失敗的
+            for task in tasks:
+                task.cancel()
+            manifest.save(only=("clips",))
         
-        return clips
\ No newline at end of file
+        return clips
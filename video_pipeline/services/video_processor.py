@@ -1,85 +1,182 @@
 """
-Pydantic 數據模型
+影片預處理服務：metadata、抽音訊（wav 或記憶體中的 PCM buffer）、長片切段
 """
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
-
-
-class TranscriptSentence(BaseModel):
-    """單句 transcript"""
-    index: int
-    text: str
-    start: float  # 秒
-    end: float
-    duration: float = 0.0
-    syllables: int = 0
-    syllables_per_sec: float = 0.0
-
-
-class VideoMetadata(BaseModel):
-    """影片 metadata"""
-    fps: float
-    total_frames: int
-    width: int
-    height: int
-    duration: float  # 秒
-
-
-class SyllableData(BaseModel):
-    """發音數據"""
-    total_syllables: int
-    total_duration: float
-    syllables_per_sec: float
-    sentences: List[TranscriptSentence]
-
-
-class Frame(BaseModel):
-    """單張 frame"""
-    sentence_index: int
-    frame_time: float  # 在影片中的時間點
-    img_path: str
-    qwen_title: Optional[str] = None
-    qwen_caption: Optional[str] = None
-    qwen_prompt: Optional[str] = None
-
-
-class Clip(BaseModel):
-    """單個 3 秒 clip"""
-    clip_id: str  # e.g., "00a", "00b"
-    prompt: str
-    img_path: Optional[str] = None
-    video_path: Optional[str] = None
-    status: str = "pending"  # pending, ok, bad
-
-
-class SentenceWithClips(BaseModel):
-    """單句 + 對應 clips"""
-    index: int
-    text: str
-    duration: float
-    num_clips: int
-    clips: List[Clip]
-
-
-class UnifiedData(BaseModel):
-    """統一風格後的數據"""
-    summary: str
-    global_style: Dict[str, Any]
-    characters: List[Dict[str, Any]]
-    locations: List[Dict[str, Any]]
-    per_sentence: List[SentenceWithClips]
-
-
-class DialogueAudio(BaseModel):
-    """TTS 結果"""
-    audio_path: str
-    duration: float
-    sentence_timings: List[Dict[str, float]]  # [{"start": 0.0, "end": 3.2}, ...]
-
-
-class FinalVideo(BaseModel):
-    """最終輸出"""
-    video_path: str
-    srt_path: str
-    duration: float
-    clips_count: int
\ No newline at end of file
+import asyncio
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+# flexible settings import
+try:
+    from video_pipeline.config import settings
+except Exception:
+    try:
+        from config import settings
+    except Exception:
+        settings = type("_S", (), {})()
+
+try:
+    from video_pipeline.utils.media_executor import get_media_executor
+    from video_pipeline.utils.pcm import SAMPLE_RATE, PCMBuffer, pcm_silences
+    from video_pipeline.utils.storage import get_storage
+except Exception:
+    from utils.media_executor import get_media_executor
+    from utils.pcm import SAMPLE_RATE, PCMBuffer, pcm_silences
+    from utils.storage import get_storage
+
+
+class VideoProcessor:
+
+    SILENCE_RE = re.compile(r"silence_(start|end): (-?[\d.]+)")
+
+    async def extract_metadata(self, video_path: str) -> Dict[str, Any]:
+        """用 ffprobe 讀 fps / 解像度 / 時長"""
+        result = await get_media_executor().ffprobe([
+            "-v", "quiet", "-print_format", "json",
+            "-show_format", "-show_streams", "-select_streams", "v:0", video_path
+        ])
+        info = json.loads(result.stdout or "{}")
+        stream = (info.get("streams") or [{}])[0]
+
+        num, _, den = (stream.get("avg_frame_rate") or "0/1").partition("/")
+        fps = float(num) / float(den) if den and float(den) else 0.0
+        duration = float(info.get("format", {}).get("duration") or stream.get("duration") or 0.0)
+        total_frames = int(stream.get("nb_frames") or round(fps * duration))
+
+        return {
+            "fps": fps,
+            "total_frames": total_frames,
+            "width": int(stream.get("width") or 0),
+            "height": int(stream.get("height") or 0),
+            "duration": duration
+        }
+
+    async def extract_audio(self, video_path: str) -> str:
+        """抽出 16 kHz mono wav（Whisper 的輸入格式）"""
+        audio_path = Path(video_path).with_suffix(".wav")
+        await get_media_executor().ffmpeg([
+            "-i", video_path, "-vn", "-ac", "1", "-ar", "16000",
+            "-c:a", "pcm_s16le", "-y", str(audio_path)
+        ], priority="preview")
+        return str(audio_path)
+
+    async def extract_pcm(self, video_path: str, duration: float = 0.0, shared: bool = False) -> PCMBuffer:
+        """
+        一個 ffmpeg process 把音訊 decode 成 16 kHz mono float32，從 stdout 直接寫進 `PCMBuffer`（不寫檔）
+        duration: metadata 的長度，用來一次配置 buffer；shared: 放在 shared memory（給 ASR process pool）
+        """
+        buffer = PCMBuffer(duration, shared=shared)
+        try:
+            await get_media_executor().ffmpeg([
+                "-i", video_path, "-vn", "-ac", "1", "-ar", str(SAMPLE_RATE),
+                "-f", "f32le", "-acodec", "pcm_f32le", "pipe:1"
+            ], priority="preview", on_stdout=buffer.feed)
+        except BaseException:
+            buffer.close()
+            raise
+        return buffer
+
+    # ==================== 長片切段 ====================
+
+    async def detect_silences(
+        self, audio: Union[str, PCMBuffer], noise_db: float = -35.0, min_silence: float = 0.4
+    ) -> List[Tuple[float, float]]:
+        """ffmpeg silencedetect（PCM buffer 則在記憶體中用 numpy 算），回傳 [(start, end), ...]"""
+        if isinstance(audio, PCMBuffer):
+            return await asyncio.to_thread(pcm_silences, audio.array, noise_db, min_silence)
+        audio_path = audio
+        result = await get_media_executor().ffmpeg([
+            "-i", audio_path,
+            "-af", f"silencedetect=noise={noise_db}dB:d={min_silence}",
+            "-f", "null", "-"
+        ], priority="preview", check=False)
+
+        silences = []
+        start: Optional[float] = None
+        for kind, value in self.SILENCE_RE.findall(result.stderr or ""):
+            if kind == "start":
+                start = max(0.0, float(value))
+            elif start is not None:
+                silences.append((start, float(value)))
+                start = None
+        return silences
+
+    async def keyframe_times(self, video_path: str) -> List[float]:
+        """ffprobe 只讀 keyframe 的時間點（沒有靜音可切時的備案）"""
+        result = await get_media_executor().ffprobe([
+            "-v", "quiet", "-select_streams", "v:0", "-skip_frame", "nokey",
+            "-show_entries", "frame=pts_time", "-of", "csv=p=0", video_path
+        ], check=False)
+        times = []
+        for line in (result.stdout or "").splitlines():
+            try:
+                times.append(float(line.strip().strip(",")))
+            except ValueError:
+                continue
+        return times
+
+    @staticmethod
+    def plan_segments(
+        duration: float,
+        boundaries: List[float],
+        target_len: float,
+        tolerance: float = 0.25
+    ) -> List[Tuple[float, float]]:
+        """
+        以 target_len 為目標長度切段，每個切點選最接近目標位置的候選邊界
+        （靜音中點 / keyframe），在 ±tolerance*target_len 內找不到時才硬切。
+        """
+        if duration <= 0 or target_len <= 0 or duration <= target_len * (1 + tolerance):
+            return [(0.0, max(duration, 0.0))]
+
+        candidates = sorted(b for b in boundaries if 0.0 < b < duration)
+        segments = []
+        start = 0.0
+        while duration - start > target_len * (1 + tolerance):
+            ideal = start + target_len
+            window = [b for b in candidates if abs(b - ideal) <= target_len * tolerance and b > start]
+            cut = min(window, key=lambda b: abs(b - ideal)) if window else ideal
+            segments.append((start, cut))
+            start = cut
+        segments.append((start, duration))
+        return segments
+
+    async def split_for_parallel(
+        self,
+        video_path: str,
+        audio: Union[str, PCMBuffer],
+        duration: float,
+        job_id: str
+    ) -> List[Dict[str, Any]]:
+        """
+        在靜音處（沒有靜音時退回 keyframe）把長片切成數段，並切出每段的 wav
+        回傳 [{"index", "start", "end", "audio_path"}, ...]
+        audio 是 shared memory 的 PCM buffer 時不切檔，每段改帶 {"pcm": PCMSlice}
+        """
+        target_len = float(getattr(settings, "SEGMENT_TARGET_SECONDS", 300))
+        silences = await self.detect_silences(audio)
+        boundaries = [(s + e) / 2 for s, e in silences]
+        if not boundaries:
+            boundaries = await self.keyframe_times(video_path)
+        plan = self.plan_segments(duration, boundaries, target_len)
+
+        if isinstance(audio, PCMBuffer):
+            return [
+                {"index": i, "start": s, "end": e, "pcm": audio.slice(s, e)}
+                for i, (s, e) in enumerate(plan)
+            ]
+        audio_path = audio
+
+        out_dir = get_storage().job_path(job_id, "segments")
+        executor = get_media_executor()
+
+        async def cut(index: int, start: float, end: float) -> Dict[str, Any]:
+            seg_path = out_dir / f"segment_{index:03d}.wav"
+            await executor.ffmpeg([
+                "-ss", f"{start:.3f}", "-t", f"{end - start:.3f}",
+                "-i", audio_path, "-c", "copy", "-y", str(seg_path)
+            ], priority="preview")
+            return {"index": index, "start": start, "end": end, "audio_path": str(seg_path)}
+
+        return list(await asyncio.gather(*(cut(i, s, e) for i, (s, e) in enumerate(plan))))
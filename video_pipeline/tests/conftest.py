@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# 與 main.py / worker.py 相同：以 video_pipeline 目錄為 import 根目錄
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
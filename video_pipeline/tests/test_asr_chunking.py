@@ -0,0 +1,47 @@
+"""
+split_long_region：過長的 VAD 區段在最安靜處切開；每段不超過上限、前後相接
+"""
+import numpy as np
+
+from services.asr_backends import SAMPLE_RATE, split_long_region
+
+FRAME = 480
+
+
+def tone(seconds: float, quiet_at=()):
+    """持續的正弦波，quiet_at 內的秒數（各 60 ms）靜音"""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    audio = (0.5 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+    for q in quiet_at:
+        lo = int(q * SAMPLE_RATE)
+        audio[lo:lo + int(0.06 * SAMPLE_RATE)] = 0.0
+    return audio
+
+
+def test_short_region_is_unchanged():
+    audio = tone(10)
+    assert split_long_region(audio, 0, len(audio), 30 * SAMPLE_RATE) == [(0, len(audio))]
+
+
+def test_cuts_at_the_quietest_frame_in_the_second_half():
+    audio = tone(50, quiet_at=[5.0, 22.0])  # 5 秒處不在 [15, 30] 內，不會被選
+    max_len = 30 * SAMPLE_RATE
+    pieces = split_long_region(audio, 0, len(audio), max_len, frame=FRAME)
+
+    assert len(pieces) == 2
+    cut = pieces[0][1]
+    assert abs(cut / SAMPLE_RATE - 22.03) < 0.05
+    assert pieces == [(0, cut), (cut, len(audio))]
+
+
+def test_pieces_cover_the_region_and_respect_max_len():
+    audio = tone(200)
+    start, end = 3 * SAMPLE_RATE, 197 * SAMPLE_RATE
+    max_len = 30 * SAMPLE_RATE
+    pieces = split_long_region(audio, start, end, max_len, frame=FRAME)
+
+    assert pieces[0][0] == start and pieces[-1][1] == end
+    assert all(a[1] == b[0] for a, b in zip(pieces, pieces[1:]))
+    assert all(0 < e - s <= max_len for s, e in pieces)
+    # 每刀至少前進半個上限
+    assert len(pieces) <= (end - start) // (max_len // 2) + 1
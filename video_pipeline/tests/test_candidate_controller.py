@@ -0,0 +1,47 @@
+"""
+CandidateController：候選數 N 使 1 - r^N 達到 SPECULATIVE_TARGET_PASS，並以觀察到的淘汰率更新
+"""
+import math
+
+import pytest
+
+import main
+from main import CandidateController
+
+
+@pytest.fixture
+def controller_with(monkeypatch):
+    def build(prior=0.2, target=0.9, max_candidates=4):
+        monkeypatch.setattr(main.settings, "SPECULATIVE_PRIOR_REJECTION", prior, raising=False)
+        monkeypatch.setattr(main.settings, "SPECULATIVE_TARGET_PASS", target, raising=False)
+        monkeypatch.setattr(main.settings, "SPECULATIVE_MAX_CANDIDATES", max_candidates, raising=False)
+        return CandidateController()
+    return build
+
+
+def test_prior_sets_initial_candidates(controller_with):
+    controller = controller_with(prior=0.2, target=0.9)
+    assert controller.rejection_rate == pytest.approx(0.2)
+    # 0.2^1 = 0.2 > 0.1，0.2^2 = 0.04 <= 0.1
+    assert controller.candidates() == 2
+
+
+def test_observations_move_the_rate(controller_with):
+    controller = controller_with(prior=0.2, target=0.9, max_candidates=6)
+    for _ in range(10):
+        controller.observe(False)
+    # (2 + 10) / (10 + 10) = 0.6 -> ceil(log 0.1 / log 0.6) = 5
+    assert controller.rejection_rate == pytest.approx(0.6)
+    assert controller.candidates() == math.ceil(math.log(0.1) / math.log(0.6)) == 5
+
+    for _ in range(200):
+        controller.observe(True)
+    assert controller.candidates() == 1
+
+
+def test_bounds(controller_with):
+    assert controller_with(prior=0.0).candidates() == 1
+    assert controller_with(prior=1.0, max_candidates=3).candidates() == 3
+    high = controller_with(prior=0.9, target=0.99, max_candidates=4)
+    assert high.candidates() == 4  # 需要 44 張，受上限限制
+    assert controller_with(max_candidates=0).max_candidates == 1
@@ -0,0 +1,65 @@
+"""
+DiskLRUCache：LRU 淘汰順序、覆寫時的大小計算、不會每次 put 都掃目錄
+"""
+import os
+from pathlib import Path
+
+import pytest
+
+from utils.disk_cache import DiskLRUCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return DiskLRUCache(tmp_path / "cache", max_bytes=300, suffix=".bin")
+
+
+def test_evicts_least_recently_used_first(cache):
+    for key in ("a", "b", "c"):
+        cache.put(key, b"x" * 100)
+    assert cache.get("a") == b"x" * 100  # a 變成最近使用
+
+    cache.put("d", b"x" * 100)
+    assert cache.get_path("b") is None
+    assert {k for k in "acd" if cache.get_path(k)} == set("acd")
+    assert cache.total_bytes == 300
+
+
+def test_overwrite_replaces_size(cache):
+    cache.put("a", b"x" * 200)
+    cache.put("a", b"y" * 50)
+    cache.put("b", b"z" * 250)
+    assert cache.total_bytes == 300
+    assert cache.get("a") == b"y" * 50
+
+
+def test_scans_directory_once(cache, monkeypatch):
+    scans = []
+    rglob = Path.rglob
+    monkeypatch.setattr(Path, "rglob", lambda self, pattern: scans.append(self) or rglob(self, pattern))
+
+    for i in range(20):
+        cache.put(f"k{i}", b"x" * 100)
+    assert len(scans) == 1
+    assert cache.total_bytes == 300
+    assert sum(1 for p in cache.root.rglob("*") if p.is_file()) == 3
+
+
+def test_new_instance_rebuilds_lru_order_from_mtime(cache):
+    for key in ("a", "b", "c"):
+        cache.put(key, b"x" * 100)
+    for age, key in enumerate(("c", "a", "b")):  # c 最舊
+        os.utime(cache._path(key), (1000 + age, 1000 + age))
+
+    reopened = DiskLRUCache(cache.root, max_bytes=300, suffix=".bin")
+    assert reopened.total_bytes == 300
+    reopened.put("d", b"x" * 100)
+    assert reopened.get_path("c") is None
+    assert reopened.get_path("a") is not None
+
+
+def test_missing_file_is_dropped_from_index(cache):
+    cache.put("a", b"x" * 100)
+    cache._path("a").unlink()  # 例如被其他 process 淘汰
+    assert cache.get("a") is None
+    assert cache.total_bytes == 0
@@ -0,0 +1,58 @@
+"""
+SQLiteJobQueue 的 lease / 過期 / 重新排隊語意
+"""
+import pytest
+
+from utils.job_queue import JobQueue, SQLiteJobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteJobQueue(str(tmp_path / "queue.db"))
+
+
+def test_interface_is_abstract():
+    with pytest.raises(TypeError):
+        JobQueue()
+
+
+def test_expired_lease_goes_back_to_queue(queue):
+    task_id = queue.enqueue("pipeline", {"job_id": "j1"}, "j1", max_attempts=3)
+
+    # lease_seconds < 0：lease 立即過期（模擬 worker 死掉、沒有 heartbeat）
+    task = queue.lease("w1", ["pipeline"], lease_seconds=-1)
+    assert task["task_id"] == task_id
+    assert task["attempts"] == 1
+
+    assert queue.requeue_expired() == 1
+    requeued = queue.get(task_id)
+    assert requeued["status"] == "queued"
+    assert requeued["attempts"] == 1
+    assert requeued["lease_owner"] is None
+
+    # 失去 lease 的 worker 不能再延長或完成
+    assert queue.heartbeat(task_id, "w1") is False
+    assert queue.complete(task_id, "w1", {"status": "completed"}) is False
+
+    task = queue.lease("w2", ["pipeline"], lease_seconds=60)
+    assert task["task_id"] == task_id
+    assert task["attempts"] == 2
+    assert task["lease_owner"] == "w2"
+    assert queue.complete(task_id, "w2", {"status": "completed"}) is True
+    assert queue.get(task_id)["status"] == "done"
+
+
+def test_expired_lease_fails_after_max_attempts(queue):
+    task_id = queue.enqueue("pipeline", {"job_id": "j1"}, "j1", max_attempts=2)
+
+    for attempt in (1, 2):
+        task = queue.lease("w1", lease_seconds=-1)
+        assert task["attempts"] == attempt
+        queue.requeue_expired()
+
+    failed = queue.get(task_id)
+    assert failed["status"] == "failed"
+    assert failed["attempts"] == 2
+    assert "lease expired" in failed["error"]
+    assert queue.lease("w1") is None
+    assert queue.stats() == {"failed": 1}
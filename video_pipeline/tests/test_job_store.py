@@ -0,0 +1,81 @@
+"""
+JobStore：TTL / memory budget spill、spill 後以 `__missing__` 讀回、重啟後還原、執行中的 job 不 spill
+"""
+import pytest
+
+from models import TranscriptSentence
+from utils.job_store import JobStore
+
+TRANSCRIPT = [TranscriptSentence(index=0, text="hello", start=0.0, end=1.0)]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(tmp_path / "state", ttl_seconds=100, memory_budget_bytes=1 << 20)
+
+
+def finished(status="completed", **artifacts):
+    return dict({"status": status, "progress": 100, "warnings": [], "transcript": TRANSCRIPT}, **artifacts)
+
+
+def test_spills_after_ttl_and_reads_back_lazily(store):
+    store["j1"] = finished(new_script=["line"])
+
+    assert store.sweep(now=1000) == []  # 第一次看到完成：開始計時
+    assert store.sweep(now=1099) == []
+    assert store.sweep(now=1100) == ["j1"]
+
+    record = store["j1"]
+    assert dict.get(record, "transcript") is None  # 不在記憶體
+    assert record.get_spilled() == ["new_script", "transcript"]
+    assert record["status"] == "completed" and record["progress"] == 100
+    # 讀回的是 JSON 結構，不是 pydantic 物件
+    assert record["transcript"] == [TRANSCRIPT[0].model_dump()]
+    assert record.get("new_script") == ["line"]
+    assert record.get("missing", "default") == "default"
+    with pytest.raises(KeyError):
+        record["missing"]
+    assert store.stats()["spilled_records"] == 1
+
+
+def test_running_jobs_are_never_spilled(store):
+    store["j1"] = finished(status="running")
+    assert store.sweep(now=1000) == []
+    assert store.sweep(now=10_000) == []
+    assert dict.get(store["j1"], "transcript") == TRANSCRIPT
+
+
+def test_memory_budget_spills_oldest_finished_first(tmp_path):
+    store = JobStore(tmp_path / "state", ttl_seconds=10_000, memory_budget_bytes=1500)  # 約只容得下一個
+    for i, job_id in enumerate(("old", "mid", "new")):
+        store[job_id] = finished(new_script=["x" * 1000])
+        store.sweep(now=1000 + i)
+
+    assert sorted(j for j in store if store[j].get_spilled()) == ["mid", "old"]
+    assert store["old"]["new_script"] == ["x" * 1000]
+
+
+def test_respill_keeps_earlier_artifacts(store):
+    store["j1"] = finished()
+    store.sweep(now=0)
+    store.spill("j1")
+    store["j1"]["clips"] = [{"clip_id": "00a"}]  # e.g. rerender 後新增
+    store.spill("j1")
+
+    record = store["j1"]
+    assert record.get_spilled() == ["clips", "transcript"]
+    assert record["clips"] == [{"clip_id": "00a"}]
+    assert record["transcript"][0]["text"] == "hello"
+
+
+def test_restore_after_restart(store, tmp_path):
+    store["j1"] = finished(final_video="out.mp4")
+    store.spill("j1")
+
+    restarted = JobStore(tmp_path / "state")
+    assert "j1" not in restarted
+    assert restarted.restore("missing") is None
+    record = restarted.restore("j1")
+    assert record["final_video"] == "out.mp4"
+    assert record["transcript"][0]["text"] == "hello"
+    assert restarted["j1"] is record
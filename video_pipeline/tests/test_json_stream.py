@@ -0,0 +1,98 @@
+"""
+JsonArrayStream：切碎的 chunk、字串內的跳脫引號 / 括號、```json fence、前面有說明文字時退回不串流
+"""
+import json
+
+import pytest
+
+from utils.json_stream import JsonArrayStream
+
+DOCUMENT = {
+    "summary": "a {tricky} \"quoted\" [summary]",
+    "per_sentence": [
+        {"index": 0, "base_prompt": "say \"hi\" {now}", "tags": ["a]", "[b"]},
+        {"index": 1, "base_prompt": "back\\slash \\\" and }", "nested": {"per_sentence": [{"x": 1}]}},
+        {"index": 2, "base_prompt": "中文 ]]] {{{", "tags": []},
+    ],
+    "characters": [{"name": "x"}],
+}
+
+
+def run(text, chunk_size, path=("per_sentence",)):
+    stream = JsonArrayStream(path)
+    items = []
+    for i in range(0, len(text), chunk_size):
+        items.extend(stream.feed(text[i:i + chunk_size]))
+    return stream, items, stream.close()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 100000])
+def test_items_emitted_across_chunk_splits(chunk_size):
+    text = json.dumps(DOCUMENT, ensure_ascii=False, indent=2)
+    stream, items, document = run(text, chunk_size)
+
+    assert items == DOCUMENT["per_sentence"]
+    assert stream.items_emitted == 3
+    assert document == DOCUMENT
+
+
+def test_items_emitted_before_document_completes():
+    text = json.dumps(DOCUMENT)
+    cut = text.index('{"index": 1')
+    stream = JsonArrayStream(("per_sentence",))
+    assert stream.feed(text[:cut]) == [DOCUMENT["per_sentence"][0]]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 100000])
+@pytest.mark.parametrize("fence", ["```json\n", "```\n", "  \n```json", "```JSON\r\n"])
+def test_fenced_output(fence, chunk_size):
+    text = fence + json.dumps(DOCUMENT) + "\n```\n"
+    stream, items, document = run(text, chunk_size)
+
+    assert stream.streaming
+    assert items == DOCUMENT["per_sentence"]
+    assert document == DOCUMENT
+
+
+def test_root_array():
+    items = [{"i": i, "s": "]},{" * i} for i in range(4)]
+    _, emitted, document = run(json.dumps(items), 5, path=())
+    assert emitted == items
+    assert document == items
+
+
+def non_streaming_parse(text):
+    """與 ChatGPTService._chat_json 的非串流路徑相同"""
+    return json.loads(text.replace("```json", "").replace("```", "").strip())
+
+
+@pytest.mark.parametrize("preamble", ["Here are the prompts [v2]:\n", "Sure! {see below}\n", "json\n"])
+def test_leading_prose_falls_back_to_non_streaming(preamble):
+    text = preamble + json.dumps(DOCUMENT)
+    stream = JsonArrayStream(("per_sentence",))
+    items = [item for i in range(0, len(text), 3) for item in stream.feed(text[i:i + 3])]
+
+    assert not stream.streaming
+    assert items == []
+    # 有說明文字時非串流路徑一樣解析失敗，由呼叫端處理
+    with pytest.raises(ValueError):
+        non_streaming_parse(text)
+    with pytest.raises(ValueError):
+        stream.close()
+
+
+def test_second_fence_falls_back_and_still_parses():
+    text = "```json\n```json\n" + json.dumps(DOCUMENT)
+    stream, items, document = run(text, 2)
+
+    assert not stream.streaming
+    assert items == []
+    assert document == non_streaming_parse(text) == DOCUMENT
+
+
+def test_backticks_that_are_not_a_fence():
+    stream = JsonArrayStream(("per_sentence",))
+    assert stream.feed("`") == []
+    assert stream.streaming  # 可能是 fence 的開頭，先等
+    stream.feed("x`" + json.dumps(DOCUMENT))
+    assert not stream.streaming
@@ -0,0 +1,93 @@
+"""
+MusicService：provider 串流下載 -> trim / fade -> 快取命中；provider 失敗不影響 job
+"""
+import asyncio
+import json
+from pathlib import Path
+
+import httpx
+import pytest
+
+from services import music_service
+from services.music_service import MusicService
+from utils.disk_cache import DiskLRUCache
+from utils.storage import StorageManager
+
+TRACK = b"ID3" + b"\x00" * 4096
+
+
+class StubMusicProvider:
+    """本地 stand-in：`POST` 回 JSON `{"audio_url"}`，`GET` 回音檔；`fail=True` 時回 502"""
+
+    def __init__(self, audio: bytes = TRACK, fail: bool = False):
+        self.audio = audio
+        self.fail = fail
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if self.fail:
+            return httpx.Response(502, text="upstream busy")
+        if request.method == "POST":
+            return httpx.Response(200, json={"data": [{"audio_url": "http://stub/track.mp3"}]})
+        return httpx.Response(200, content=self.audio, headers={"content-type": "audio/mpeg"})
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self)
+
+
+class FakeExecutor:
+    """記錄 ffmpeg 參數，輸出檔寫入 "trimmed:<秒數>" 代替實際轉檔"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def ffmpeg(self, args, priority="final", **kwargs):
+        self.calls.append(list(args))
+        Path(args[-1]).write_bytes(b"trimmed:" + args[args.index("-t") + 1].encode())
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    executor = FakeExecutor()
+    monkeypatch.setattr(music_service.settings, "SUNO_API_KEY", "test-key", raising=False)
+    monkeypatch.setattr(music_service.settings, "SUNO_API_URL", "http://stub/generate", raising=False)
+    monkeypatch.setattr(music_service.settings, "MUSIC_DURATION_BUCKET", 30, raising=False)
+    monkeypatch.setattr(music_service, "_music_cache", DiskLRUCache(tmp_path / "cache", 1 << 20, suffix=".mp3"))
+    monkeypatch.setattr(music_service, "get_storage", lambda: StorageManager(tmp_path / "out", tmp_path / "up"))
+    monkeypatch.setattr(music_service, "get_media_executor", lambda: executor)
+    return executor
+
+
+def test_stream_trim_fade_then_cache_hit(env):
+    provider = StubMusicProvider()
+    service = MusicService(transport=provider.transport())
+
+    first = asyncio.run(service.generate_and_cut_music("calm piano", 42.0, "job1", "t"))
+    assert [r.method for r in provider.requests] == ["POST", "GET"]
+    assert json.loads(provider.requests[0].content)["duration"] == 60  # 42 秒往上取到 30 秒 bucket
+    assert Path(first).read_bytes() == b"trimmed:42.000"
+
+    args = env.calls[0]
+    assert Path(args[args.index("-i") + 1]).read_bytes() == TRACK  # 從快取的整首剪
+    assert "afade=t=in:st=0:d=1.000" in args[args.index("-af") + 1]
+    assert "afade=t=out:st=39.000:d=3.000" in args[args.index("-af") + 1]
+
+    # 同 summary、同 bucket（50 秒 -> 60）：不再呼叫 provider，只重新剪
+    second = asyncio.run(service.generate_and_cut_music("calm piano", 50.0, "job2", "t"))
+    assert len(provider.requests) == 2
+    assert Path(second).read_bytes() == b"trimmed:50.000"
+    assert env.calls[1][env.calls[1].index("-i") + 1] == args[args.index("-i") + 1]
+    assert music_service.get_music_cache().hits == 1
+
+
+def test_provider_failure_warns_and_continues_without_music(env):
+    provider = StubMusicProvider(fail=True)
+    warnings = []
+
+    path = asyncio.run(
+        MusicService(transport=provider.transport()).generate_and_cut_music("x", 10.0, "job1", "t", warnings=warnings)
+    )
+    assert Path(path).read_bytes() == b""
+    assert len(warnings) == 1 and warnings[0].startswith("music: HTTPStatusError")
+    assert env.calls == []
@@ -0,0 +1,80 @@
+"""
+PromptImageCache：完全相同 / 相似命中、安全檢查結果只對同一個 prompt 有效、跨 process 合併寫回
+"""
+import pytest
+
+from utils.prompt_cache import PromptImageCache
+
+PROMPT = "a red fox sitting in a snowy forest at dawn, watercolor"
+VARIANT = '["engine", 576, 1024, null]'
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PromptImageCache(tmp_path / "cache", 1 << 20, threshold=0.8)
+
+
+@pytest.fixture
+def image(tmp_path):
+    def write(name, data):
+        path = tmp_path / name
+        path.write_bytes(data)
+        return str(path)
+    return write
+
+
+def test_exact_and_similar_hits(cache, image):
+    cache.put(PROMPT, VARIANT, image("fox.jpg", b"fox"))
+
+    assert cache.lookup("  A red fox sitting in a SNOWY forest at dawn,  watercolor ", VARIANT, "j1") == (b"fox", "exact")
+    assert cache.lookup(PROMPT + "!", VARIANT, "j1") == (b"fox", "similar")
+    assert cache.lookup("a blue whale in the deep ocean", VARIANT, "j1") is None
+    assert cache.lookup(PROMPT, '["other", 576, 1024, null]', "j1") is None
+    assert cache.release("j1") == {
+        "lookups": 4, "exact_hits": 1, "similar_hits": 1, "misses": 2, "verified_skips": 0
+    }
+
+
+def test_verdict_only_applies_to_the_same_prompt_and_image(cache, image):
+    fox = image("fox.jpg", b"fox")
+    cache.put(PROMPT, VARIANT, fox)
+    assert not cache.is_verified(fox, PROMPT, VARIANT)
+
+    cache.mark(fox, PROMPT, VARIANT, True)
+    assert cache.is_verified(fox, PROMPT, VARIANT, "j1")
+    assert cache.job_stats("j1")["verified_skips"] == 1
+    # 相似 prompt 命中的同一張圖：判定不沿用
+    assert not cache.is_verified(fox, PROMPT + "!", VARIANT)
+    # 同 prompt 但圖不同
+    assert not cache.is_verified(image("other.jpg", b"other"), PROMPT, VARIANT)
+
+
+def test_rejected_entries_are_not_returned(cache, image):
+    fox = image("fox.jpg", b"fox")
+    cache.put(PROMPT, VARIANT, fox)
+    cache.mark(fox, PROMPT, VARIANT, False)
+
+    assert cache.lookup(PROMPT, VARIANT) is None
+    assert cache.lookup(PROMPT + "!", VARIANT) is None
+
+
+def test_evicted_image_drops_the_entry(cache, image):
+    cache.put(PROMPT, VARIANT, image("fox.jpg", b"fox"))
+    for path in cache.images.root.rglob("*.jpg"):
+        path.unlink()
+
+    assert cache.lookup(PROMPT, VARIANT) is None
+    assert cache.summary()["entries"] == 0
+
+
+def test_save_merges_with_other_processes(tmp_path, image):
+    first = PromptImageCache(tmp_path / "cache", 1 << 20)
+    second = PromptImageCache(tmp_path / "cache", 1 << 20)
+    first.put(PROMPT, VARIANT, image("fox.jpg", b"fox"))
+    second.put("a castle on a hill", VARIANT, image("castle.jpg", b"castle"))
+    first.save()
+    second.save()
+
+    reopened = PromptImageCache(tmp_path / "cache", 1 << 20)
+    assert reopened.lookup(PROMPT, VARIANT) == (b"fox", "exact")
+    assert reopened.lookup("a castle on a hill", VARIANT) == (b"castle", "exact")
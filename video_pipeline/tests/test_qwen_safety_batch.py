@@ -0,0 +1,64 @@
+"""
+QwenService.check_safety_batch：布林值嚴格解析（不能 fail open）、字串 index 仍對得上
+"""
+import asyncio
+
+import pytest
+
+from services import qwen_service
+from services.qwen_service import QwenService
+
+
+def items(n):
+    return [{"clip_id": f"{i:02d}a", "img_path": f"clip_{i:02d}a.jpg", "prompt": "p"} for i in range(n)]
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(qwen_service.settings, "QWEN_API_KEY", "test-key", raising=False)
+    monkeypatch.setattr(qwen_service.settings, "QWEN_API_URL", "http://stub/qwen", raising=False)
+    monkeypatch.setattr(qwen_service.settings, "SAFETY_CONFIDENCE_THRESHOLD", 0.75, raising=False)
+    return QwenService()
+
+
+def reply_with(service, monkeypatch, entries):
+    calls = []
+
+    async def fake_request(batch):
+        calls.append([item["clip_id"] for item in batch])
+        return entries if len(batch) > 1 else []
+    monkeypatch.setattr(service, "_request_batch", fake_request)
+    return calls
+
+
+@pytest.mark.parametrize("value, expected", [
+    (True, True), ("true", True), (" TRUE ", True),
+    (False, False), ("false", False), ("False", False), ("yes", False), (1, False), (None, False)
+])
+def test_as_bool_is_strict(value, expected):
+    assert QwenService._as_bool(value) is expected
+
+
+def test_string_false_is_not_safe(service, monkeypatch):
+    reply_with(service, monkeypatch, [
+        {"index": 0, "safe": "false", "matches_prompt": "true", "confidence": 0.9},
+        {"index": 1, "safe": "true", "matches_prompt": "true", "confidence": 0.9},
+    ])
+    verdicts = asyncio.run(service.check_safety_batch(items(2)))
+
+    assert verdicts[0]["status"] == "bad" and verdicts[0]["safe"] is False
+    assert verdicts[0]["reason"] == "unsafe"
+    assert verdicts[1]["status"] == "ok" and verdicts[1]["safe"] is True
+
+
+def test_string_indexes_match_without_recheck(service, monkeypatch):
+    calls = reply_with(service, monkeypatch, [
+        {"index": "2", "safe": True, "matches_prompt": True, "confidence": 0.9},
+        {"index": "0", "safe": True, "matches_prompt": True, "confidence": 0.9},
+        {"index": "1", "safe": False, "matches_prompt": True, "confidence": 0.9},
+    ])
+    verdicts = asyncio.run(service.check_safety_batch(items(3)))
+
+    assert calls == [["00a", "01a", "02a"]]  # 一次 batch，沒有逐張重查
+    assert [v["status"] for v in verdicts] == ["ok", "bad", "ok"]
+    assert [v["clip_id"] for v in verdicts] == ["00a", "01a", "02a"]
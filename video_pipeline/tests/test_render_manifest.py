@@ -0,0 +1,69 @@
+"""
+RenderManifest 的 clip 順序與 rerender 的 clip_id 檢查
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from utils.render_manifest import RenderManifest, clip_order_key
+from utils.storage import StorageManager
+
+
+def clip_ids(sentences: int, per_sentence: int = 2):
+    return [f"{i:02d}{chr(97 + c)}" for i in range(sentences) for c in range(per_sentence)]
+
+
+def test_ordered_clips_past_100_sentences(tmp_path):
+    expected = clip_ids(120)
+    manifest = RenderManifest(tmp_path)
+    for clip_id in reversed(expected):
+        manifest.set_clip(clip_id, f"img/clip_{clip_id}.jpg", "h", f"video/clip_{clip_id}.mp4")
+    manifest.save()
+
+    ordered = [c["clip_id"] for c in RenderManifest(tmp_path).ordered_clips()]
+    assert ordered == expected
+    assert ordered.index("10a") < ordered.index("99b") < ordered.index("100a")
+
+
+def test_clip_order_key_puts_unparsable_ids_last():
+    assert sorted(["x", "100a", "9b", "9a"], key=clip_order_key) == ["9a", "9b", "100a", "x"]
+
+
+@pytest.fixture
+def job(tmp_path, monkeypatch):
+    storage = StorageManager(tmp_path / "out", tmp_path / "up")
+    monkeypatch.setattr(main, "get_storage", lambda: storage)
+    monkeypatch.setattr(main, "rerender_job", lambda job_id, force: None)
+
+    job_id = "20261019_120000_000000_abcdef"
+    manifest = RenderManifest(storage.job_dir(job_id))
+    manifest.set_clip("00a", "img/clip_00a.jpg", "h", "video/clip_00a.mp4")
+    manifest.save()
+    main.jobs[job_id] = {
+        "job_id": job_id, "status": "completed", "warnings": [],
+        "unified_data": {"per_sentence": [{"clips": [{"clip_id": "00a"}, {"clip_id": "00b"}]}]}
+    }
+    yield storage, job_id
+    main.jobs.pop(job_id, None)
+
+
+@pytest.mark.parametrize("clip_id", ["../00a", "00a/x", "07z", "00"])
+def test_rerender_rejects_bad_clip_id(job, clip_id):
+    storage, job_id = job
+    response = TestClient(main.app).post(
+        f"/api/pipeline/rerender/{job_id}", params={"clip_id": clip_id}, files={"file": ("a.jpg", b"jpeg")}
+    )
+    assert response.status_code == 400
+    assert "00a" in RenderManifest(storage.job_dir(job_id)).clips
+    assert len(RenderManifest(storage.job_dir(job_id)).clips) == 1
+
+
+def test_rerender_accepts_planned_clip_not_in_manifest(job):
+    storage, job_id = job
+    response = TestClient(main.app).post(
+        f"/api/pipeline/rerender/{job_id}", params={"clip_id": "00b"}, files={"file": ("a.jpg", b"jpeg")}
+    )
+    assert response.status_code == 200
+    img_path = storage.job_path(job_id, "img") / "clip_00b.jpg"
+    assert img_path.read_bytes() == b"jpeg"
+    assert RenderManifest(storage.job_dir(job_id)).clips["00b"]["img_path"] == str(img_path)
@@ -0,0 +1,39 @@
+"""
+merge_segment_transcripts：各段時間加上段落起點、限制在段落內、index 依全片順序重新編號
+"""
+from services.transcription import merge_segment_transcripts
+
+
+def seg(text, start, end, words=()):
+    return {"text": text, "start": start, "end": end, "words": [dict(w) for w in words]}
+
+
+def test_rebases_times_and_renumbers_in_order():
+    results = [
+        # 段落完成順序不一定照時間
+        (300.0, 600.0, [seg(" third ", 1.0, 4.0), seg("fourth", 10.0, 12.5)]),
+        (0.0, 300.0, [seg("first", 0.5, 2.0), seg("   ", 3.0, 4.0), seg("second", 290.0, 299.0)]),
+    ]
+    sentences = merge_segment_transcripts(results)
+
+    assert [s.text for s in sentences] == ["first", "second", "third", "fourth"]
+    assert [s.index for s in sentences] == [0, 1, 2, 3]
+    assert [(s.start, s.end) for s in sentences] == [(0.5, 2.0), (290.0, 299.0), (301.0, 304.0), (310.0, 312.5)]
+    assert sentences[3].duration == 2.5
+
+
+def test_clamps_to_segment_bounds():
+    words = [{"word": "tail", "start": 298.0, "end": 305.0}]
+    sentences = merge_segment_transcripts([
+        (0.0, 300.0, [seg("runs over", 298.0, 305.0, words), seg("after end", 301.0, 302.0)]),
+    ])
+
+    assert (sentences[0].start, sentences[0].end) == (298.0, 300.0)
+    assert sentences[0].words[0].end == 300.0
+    # 整句落在段落外：壓成段落終點、長度 0
+    assert (sentences[1].start, sentences[1].end, sentences[1].duration) == (300.0, 300.0, 0.0)
+
+
+def test_end_never_before_start():
+    sentences = merge_segment_transcripts([(60.0, 120.0, [seg("odd", 5.0, 4.0)])])
+    assert (sentences[0].start, sentences[0].end) == (65.0, 65.0)
@@ -0,0 +1,85 @@
+"""
+TTSService：逐句合成、失敗句以原長度靜音代替（時間軸不位移）
+"""
+import asyncio
+import json
+import wave
+
+import httpx
+import pytest
+
+from models import TranscriptSentence
+from services import tts_service
+from services.tts_service import TTSService
+from utils.storage import StorageManager
+
+RATE = 1000  # 測試用低取樣率，1 秒 = 2000 bytes
+
+
+class StubElevenLabs:
+    """每個字元回 0.1 秒 PCM；`fail` 內的文字回 500"""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.texts = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        text = json.loads(request.content)["text"]
+        self.texts.append(text)
+        if text in self.fail:
+            return httpx.Response(500, text="quota exceeded")
+        return httpx.Response(200, content=b"\x01\x00" * (len(text) * RATE // 10))
+
+
+def sentence(index, text, start, end):
+    return TranscriptSentence(index=index, text=text, start=start, end=end, duration=end - start)
+
+
+@pytest.fixture
+def service_for(tmp_path, monkeypatch):
+    monkeypatch.setattr(tts_service.settings, "ELEVENLABS_API_KEY", "test-key", raising=False)
+    monkeypatch.setattr(tts_service.settings, "ELEVENLABS_API_URL", "http://stub/tts", raising=False)
+    monkeypatch.setattr(tts_service.settings, "TTS_SAMPLE_RATE", RATE, raising=False)
+    monkeypatch.setattr(tts_service.settings, "TTS_SENTENCE_GAP", 0.0, raising=False)
+    monkeypatch.setattr(tts_service.settings, "TTS_CACHE_ENABLED", False, raising=False)
+    monkeypatch.setattr(tts_service, "get_storage", lambda: StorageManager(tmp_path / "out", tmp_path / "up"))
+
+    def build(provider):
+        return TTSService(transport=httpx.MockTransport(provider))
+    return build
+
+
+def test_failed_sentence_becomes_silence_of_original_length(service_for):
+    provider = StubElevenLabs(fail={"boom"})
+    script = [sentence(0, "hello", 0.0, 0.4), sentence(1, "boom", 0.4, 2.9), sentence(2, "bye", 2.9, 3.2)]
+    warnings = []
+
+    result = asyncio.run(service_for(provider).generate_dialogue(script, "job1", "t", warnings=warnings))
+
+    timings = [(t["start"], t["end"]) for t in result["sentence_timings"]]
+    assert timings == [(0.0, 0.5), (0.5, 3.0), (3.0, 3.3)]
+    assert result["duration"] == pytest.approx(3.3)
+    assert len(warnings) == 1
+    assert warnings[0].startswith("TTS: sentence 1 failed (HTTPStatusError")
+    assert "2.50s of silence" in warnings[0]
+
+    with wave.open(result["audio_path"], "rb") as wav:
+        frames = wav.readframes(wav.getnframes())
+    assert len(frames) == int(3.3 * RATE) * 2
+    assert frames[int(0.5 * RATE) * 2:int(3.0 * RATE) * 2] == b"\x00" * (int(2.5 * RATE) * 2)
+
+
+def test_duplicate_sentences_call_the_api_once(service_for, tmp_path, monkeypatch):
+    monkeypatch.setattr(tts_service.settings, "TTS_CACHE_ENABLED", True, raising=False)
+    monkeypatch.setattr(tts_service, "_audio_cache", tts_service.DiskLRUCache(tmp_path / "tts", 1 << 20, suffix=".pcm"))
+    provider = StubElevenLabs()
+    script = [sentence(0, "again", 0, 1), sentence(1, "other", 1, 2), sentence(2, " again ", 2, 3)]
+
+    first = asyncio.run(service_for(provider).generate_dialogue(script, "job1", "t"))
+    assert provider.texts.count("again") == 1 and len(provider.texts) == 2
+    assert first["cache"] == {"hits": 0, "misses": 2}
+    assert [t["end"] - t["start"] for t in first["sentence_timings"]] == pytest.approx([0.5, 0.5, 0.5])
+
+    second = asyncio.run(service_for(provider).generate_dialogue(script, "job2", "t"))
+    assert len(provider.texts) == 2
+    assert second["cache"] == {"hits": 2, "misses": 0}
@@ -0,0 +1,104 @@
+"""
+生圖結果在 stage 之間以記憶體傳遞（生圖 -> 安全檢查）
+
+原本 `ImageGenService.generate()` 把 API 回傳的 base64 decode 後寫檔，`QwenService` 緊接著同步讀回同一個檔案再 encode。
+`ImageArtifact` 是 str 的子類別（值就是圖檔路徑，既有把 img_path 當字串 / 路徑用的程式不受影響），另外帶著：
+- 圖片 bytes：API 的 base64 只 decode 一次（寫檔用）
+- base64：直接沿用 API 回傳的字串，安全檢查不必讀檔、不必再 encode（由 bytes 建立時第一次取用才 encode 一次）
+
+寫檔在背景 thread 進行（`persist()`），不阻塞 event loop。需要檔案的步驟（移到 bad_img、刪除候選、編碼 clip）
+之前先 `await settle(img_path)`：等寫檔完成並釋放記憶體中的 bytes / base64，之後只剩路徑。
+pickle / deepcopy 時退化成一般字串。
+"""
+import asyncio
+import base64
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import Any, Optional, Union
+
+
+class ImageArtifact(str):
+
+    def __new__(cls, path: Union[str, Path], data: Optional[bytes] = None, b64: Optional[str] = None):
+        obj = super().__new__(cls, str(path))
+        obj._data = data
+        obj._b64 = b64
+        obj._sha256: Optional[str] = None
+        obj._saving: Optional[asyncio.Future] = None
+        return obj
+
+    def __reduce__(self):
+        return (str, (str(self),))
+
+    @classmethod
+    def from_base64(cls, path: Union[str, Path], b64: str) -> "ImageArtifact":
+        return cls(path, base64.b64decode(b64), b64)
+
+    @property
+    def data(self) -> Optional[bytes]:
+        return self._data
+
+    @property
+    def b64(self) -> Optional[str]:
+        if self._b64 is None and self._data is not None:
+            self._b64 = base64.b64encode(self._data).decode()
+        return self._b64
+
+    @property
+    def sha256(self) -> Optional[str]:
+        """內容的 sha256（第一次取用時計算，release 後仍保留）"""
+        if self._sha256 is None and self._data is not None:
+            self._sha256 = hashlib.sha256(self._data).hexdigest()
+        return self._sha256
+
+    def persist(self) -> "ImageArtifact":
+        """開始在背景 thread 寫檔（只寫一次）；需在 event loop 內呼叫"""
+        if self._saving is None and self._data is not None:
+            self._saving = asyncio.ensure_future(asyncio.to_thread(self._write, self._data))
+        return self
+
+    def _write(self, data: bytes):
+        tmp = f"{self}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, str(self))
+
+    async def saved(self):
+        if self._saving is not None:
+            await asyncio.shield(self._saving)
+
+    def release(self):
+        """釋放 bytes / base64（檔案已寫好之後）"""
+        self._data = None
+        self._b64 = None
+
+
+def artifact_bytes(img_path: Any) -> Optional[bytes]:
+    """記憶體中的圖片內容；不是 artifact 或已釋放時回傳 None（呼叫端改讀檔）"""
+    return getattr(img_path, "data", None) if isinstance(img_path, ImageArtifact) else None
+
+
+def artifact_digest(img_path: Any) -> Optional[str]:
+    """artifact 的內容 sha256（不讀檔）；無法取得時回傳 None"""
+    return img_path.sha256 if isinstance(img_path, ImageArtifact) else None
+
+
+def _read_b64(path: str) -> str:
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode()
+
+
+async def read_b64(img_path: Any) -> str:
+    """圖片的 base64：artifact 直接用記憶體中的內容，否則在 thread 讀檔"""
+    if isinstance(img_path, ImageArtifact) and img_path.b64 is not None:
+        return img_path.b64
+    return await asyncio.to_thread(_read_b64, str(img_path))
+
+
+async def settle(img_path: Any):
+    """等 artifact 寫檔完成並釋放記憶體；一般路徑直接返回"""
+    if isinstance(img_path, ImageArtifact):
+        await img_path.saved()
+        img_path.release()
@@ -0,0 +1,151 @@
+"""
+Batch 提交（一次提交整個系列）
+
+- 每個來源（上傳檔或 manifest 指定的伺服器路徑）以內容 sha256 去重：
+  同一份內容只建立一個 job，重複的項目指向同一個 job_id，ASR / 抽 frame / LLM / 算圖都只跑一次。
+- 一個 batch 的所有 job 共用一個並行上限（`BATCH_MAX_CONCURRENT_JOBS`），不會一次全部開跑。
+- `BatchStore.summary()` 依 job 狀態算出整體進度（以 unique job 平均）。
+"""
+import hashlib
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional
+
+try:
+    from video_pipeline.utils.storage import new_job_id
+except Exception:
+    from utils.storage import new_job_id
+
+
+CHUNK_SIZE = 1024 * 1024
+
+FINISHED_STATUSES = ("completed", "failed")
+
+
+def new_batch_id() -> str:
+    return f"batch_{new_job_id()}"
+
+
+async def save_upload(upload, dest: Path) -> str:
+    """分塊寫入上傳檔（不整個讀進記憶體），同時計算 sha256"""
+    h = hashlib.sha256()
+    with open(dest, "wb") as f:
+        while True:
+            chunk = await upload.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+            f.write(chunk)
+    return h.hexdigest()
+
+
+def hash_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def resolve_manifest_path(root: Path, path: str) -> Path:
+    """manifest 只能指定 `root` 底下的既有檔案（避免讀取任意路徑）"""
+    root = Path(root).resolve()
+    candidate = (root / path).resolve()
+    if root != candidate and root not in candidate.parents:
+        raise ValueError(f"path outside manifest root: {path}")
+    if not candidate.is_file():
+        raise FileNotFoundError(f"no such file: {path}")
+    return candidate
+
+
+class BatchStore:
+    """batch_id -> {items, jobs, options}；item 記錄原始名稱、content hash 與對應 job_id"""
+
+    def __init__(self):
+        self._batches: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, batch_id: str) -> bool:
+        return batch_id in self._batches
+
+    def get(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        return self._batches.get(batch_id)
+
+    def create(self, batch_id: str, options: Dict[str, Any]) -> Dict[str, Any]:
+        batch = {
+            "batch_id": batch_id,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "options": options,
+            "items": [],
+            "by_hash": {}
+        }
+        with self._lock:
+            self._batches[batch_id] = batch
+        return batch
+
+    @staticmethod
+    def add_item(batch: Dict[str, Any], name: str, content_hash: str, job_id: Optional[str],
+                 title: Optional[str] = None, error: Optional[str] = None) -> Dict[str, Any]:
+        """
+        加入一個項目；內容已出現過時沿用先前的 job（`duplicate_of` 記錄第一個項目的索引）。
+        回傳 item，`item["new"]` 表示呼叫端需要為它建立 / 啟動 job。
+        """
+        item: Dict[str, Any] = {"index": len(batch["items"]), "name": name, "title": title, "content_hash": content_hash}
+        if error is not None:
+            item.update(job_id=None, error=error, new=False)
+        elif content_hash in batch["by_hash"]:
+            first = batch["items"][batch["by_hash"][content_hash]]
+            item.update(job_id=first["job_id"], duplicate_of=first["index"], new=False)
+        else:
+            batch["by_hash"][content_hash] = item["index"]
+            item.update(job_id=job_id, new=True)
+        batch["items"].append(item)
+        return item
+
+    @staticmethod
+    def summary(batch: Dict[str, Any], jobs: Mapping[str, Any]) -> Dict[str, Any]:
+        """
+        整體進度：各 unique job 的 progress 平均；狀態計數與各項目明細
+        jobs: job_id -> job 狀態（有共享隊列時由呼叫端傳入合併過隊列狀態的紀錄）
+        """
+        job_ids = list(dict.fromkeys(i["job_id"] for i in batch["items"] if i.get("job_id")))
+        states: Dict[str, Dict[str, Any]] = {}
+        for job_id in job_ids:
+            record = jobs.get(job_id) or {}
+            states[job_id] = {
+                "status": record.get("status", "unknown"),
+                "progress": record.get("progress", 0),
+                "current_step": record.get("current_step")
+            }
+
+        counts: Dict[str, int] = {}
+        for state in states.values():
+            counts[state["status"]] = counts.get(state["status"], 0) + 1
+        errors = sum(1 for i in batch["items"] if i.get("error"))
+        done = sum(1 for s in states.values() if s["status"] in FINISHED_STATUSES)
+        if not job_ids:
+            status = "failed"
+        elif done < len(job_ids):
+            status = "running"
+        elif counts.get("failed") or errors:
+            status = "completed_with_errors"
+        else:
+            status = "completed"
+
+        return {
+            "batch_id": batch["batch_id"],
+            "created_at": batch["created_at"],
+            "options": batch["options"],
+            "status": status,
+            "progress": round(sum(s["progress"] for s in states.values()) / len(states), 1) if states else 0,
+            "items_total": len(batch["items"]),
+            "unique_jobs": len(job_ids),
+            "duplicates": sum(1 for i in batch["items"] if "duplicate_of" in i),
+            "rejected": errors,
+            "jobs_by_status": counts,
+            "items": [
+                dict({k: v for k, v in i.items() if k != "new"}, **states.get(i.get("job_id"), {}))
+                for i in batch["items"]
+            ]
+        }
@@ -0,0 +1,145 @@
+"""
+Content-addressed 磁碟快取（LRU，依總大小淘汰）
+
+- key 由內容參數 hash 而來（`DiskLRUCache.make_key(...)`），同樣輸入一定得到同一個檔。
+- 每次命中會更新檔案 mtime，淘汰時從最久沒用的開始刪，直到總大小低於上限。
+- 第一次使用時掃描一次目錄建立記憶體索引（LRU 順序 + 大小），之後 put / 淘汰只更新索引，不再每次掃整個目錄。
+  其他 process 寫入的檔不在本 process 的索引內，多個 process 共用目錄時總量可能暫時超過上限（重新啟動掃描後修正）。
+- 只用檔案系統，多個 process 共用同一個目錄也安全（寫入採 tmp + rename）。
+- 方法都是同步檔案 I/O，async 程式碼以 `asyncio.to_thread` 呼叫；內部有 lock，可多個 thread 同時使用。
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional
+
+
+class DiskLRUCache:
+
+    def __init__(self, root: Path, max_bytes: int, suffix: str = ""):
+        self.root = Path(root)
+        self.max_bytes = int(max_bytes)
+        self.suffix = suffix
+        self._index: Optional["OrderedDict[Path, int]"] = None  # path -> bytes，最久沒用的在前；第一次使用時掃描目錄
+        self._total = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(**parts: Any) -> str:
+        """把任意可 JSON 化的參數組合成穩定的 sha256 key"""
+        raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}{self.suffix}"
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            self._ensure_index()
+            return self._total
+
+    def get_path(self, key: str) -> Optional[Path]:
+        """命中時回傳檔案路徑（並標記為最近使用），否則 None"""
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+                self._forget(path)
+            return None
+        with self._lock:
+            self.hits += 1
+            self._touch(path)
+        return path
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            # 剛好被其他 process 淘汰
+            with self._lock:
+                self._forget(path)
+            return None
+
+    def put(self, key: str, data: bytes) -> Path:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        self._account(path, len(data))
+        return path
+
+    def put_file(self, key: str, src: Path, move: bool = False) -> Path:
+        """把現成檔案放進快取（大檔如音樂不必整個讀進記憶體）"""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        if move:
+            shutil.move(str(src), str(tmp))
+        else:
+            shutil.copyfile(str(src), str(tmp))
+        os.replace(tmp, path)
+        self._account(path, path.stat().st_size)
+        return path
+
+    def _ensure_index(self):
+        """第一次使用時掃描目錄，依 mtime 建立 LRU 索引（呼叫端持有 lock）"""
+        if self._index is not None:
+            return
+        entries = []
+        if self.root.exists():
+            for p in self.root.rglob("*"):
+                if p.is_file() and not p.name.endswith(".tmp"):
+                    st = p.stat()
+                    entries.append((st.st_mtime, p, st.st_size))
+        self._index = OrderedDict((p, size) for _, p, size in sorted(entries, key=lambda e: e[0]))
+        self._total = sum(self._index.values())
+
+    def _touch(self, path: Path):
+        self._ensure_index()
+        if path in self._index:
+            self._index.move_to_end(path)
+
+    def _forget(self, path: Path):
+        if self._index is not None and path in self._index:
+            self._total -= self._index.pop(path)
+
+    def _account(self, path: Path, size: int):
+        with self._lock:
+            self._ensure_index()
+            self._forget(path)  # 同 key 覆寫：先扣掉舊的大小
+            self._index[path] = size
+            self._total += size
+            if self._total > self.max_bytes:
+                self._evict_locked()
+
+    def evict(self) -> int:
+        """刪除最久沒使用的檔案直到低於上限，回傳刪除的 bytes"""
+        with self._lock:
+            self._ensure_index()
+            return self._evict_locked()
+
+    def _evict_locked(self) -> int:
+        freed = 0
+        while self._total > self.max_bytes and self._index:
+            path, size = self._index.popitem(last=False)
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            self._total -= size
+            freed += size
+        return freed
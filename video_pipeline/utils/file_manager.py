@@ -6,6 +6,11 @@ import shutil
 import asyncio
 from functools import wraps
 
+try:
+    from video_pipeline.utils.storage import get_storage
+except Exception:
+    from utils.storage import get_storage
+
 
 # ==================== File Manager ====================
 class FileManager:
@@ -13,8 +18,7 @@ class FileManager:
     @staticmethod
     def move_to_bad(img_path: str, job_id: str, title: str) -> str:
         """把失敗的圖移到 bad_img"""
-        bad_dir = Path(f"outputs/{job_id}_{title}/bad_img")
-        bad_dir.mkdir(parents=True, exist_ok=True)
+        bad_dir = get_storage().job_path(job_id, "bad_img")
         
         src = Path(img_path)
         dst = bad_dir / src.name
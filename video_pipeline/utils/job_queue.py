@@ -0,0 +1,312 @@
+"""
+共享任務隊列（lease + heartbeat）
+
+- `JobQueue`: 隊列介面，外部 broker（Redis / RabbitMQ / SQS ...）實作同一組方法即可接入。
+- `SQLiteJobQueue`: 內建 embedded backend，單機多 process / 共用檔案系統的多台機器都可用。
+- `load_job_queue()`: 依 `settings.JOB_QUEUE_URL` 建立隊列；空字串代表不用隊列（API process 內執行）。
+
+Task 生命週期 / Task lifecycle:
+    queued -> leased -> done / failed
+    leased 的 task 如果 lease 過期（worker 死掉、斷線）會被放回 queued，直到 max_attempts 用完。
+"""
+import json
+import os
+from abc import ABC, abstractmethod
+import socket
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# flexible settings import
+try:
+    from video_pipeline.config import settings
+except Exception:
+    try:
+        from config import settings
+    except Exception:
+        settings = type("_S", (), {})()
+
+
+def to_jsonable(obj: Any) -> Any:
+    """把 job 狀態（含 pydantic 物件）轉成可 JSON 序列化的結構"""
+    if hasattr(obj, "model_dump"):
+        return to_jsonable(obj.model_dump())
+    if isinstance(obj, dict):
+        return {str(k): to_jsonable(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple, set)):
+        return [to_jsonable(v) for v in obj]
+    if isinstance(obj, Path):
+        return str(obj)
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    return str(obj)
+
+
+def default_worker_id() -> str:
+    """hostname-pid，方便在 status 中看出 task 在哪台機器執行"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class JobQueue(ABC):
+    """
+    隊列介面 / Queue interface
+
+    所有方法皆為同步呼叫；async 環境請用 `asyncio.to_thread` 包裝。
+    Task 以 dict 表示：task_id, task_type, payload, status, attempts, max_attempts,
+    lease_owner, lease_expires, result, error, state。
+    """
+
+    @abstractmethod
+    def enqueue(
+        self,
+        task_type: str,
+        payload: Dict[str, Any],
+        task_id: Optional[str] = None,
+        max_attempts: int = 3
+    ) -> str:
+        """放進隊列，回傳 task_id"""
+
+    @abstractmethod
+    def lease(
+        self,
+        worker_id: str,
+        task_types: Optional[Iterable[str]] = None,
+        lease_seconds: float = 60.0
+    ) -> Optional[Dict[str, Any]]:
+        """取出一個 queued task 並加上 lease；沒有 task 時回傳 None"""
+
+    @abstractmethod
+    def heartbeat(
+        self,
+        task_id: str,
+        worker_id: str,
+        lease_seconds: float = 60.0,
+        state: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """延長 lease（可順便回報進度 state）；lease 已失去時回傳 False"""
+
+    @abstractmethod
+    def complete(self, task_id: str, worker_id: str, result: Any = None) -> bool:
+        """標記完成並保存結果；lease 已失去時回傳 False"""
+
+    @abstractmethod
+    def fail(self, task_id: str, worker_id: str, error: str, retry: bool = True) -> bool:
+        """標記失敗；retry 且還有次數時放回隊列，否則為 failed"""
+
+    @abstractmethod
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """取得單一 task；不存在時回傳 None"""
+
+    @abstractmethod
+    def requeue_expired(self) -> int:
+        """把 lease 過期的 task 放回隊列，回傳數量"""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        """各狀態 task 數量"""
+
+
+class SQLiteJobQueue(JobQueue):
+    """
+    SQLite embedded backend
+
+    - 每次操作開新 connection，可安全地被多個 thread / process 共用。
+    - lease 以 `BEGIN IMMEDIATE` 取得寫鎖，確保同一 task 只會被一個 worker 拿到。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = str(db_path)
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    task_id TEXT PRIMARY KEY,
+                    task_type TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL DEFAULT 3,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    result TEXT,
+                    error TEXT,
+                    state TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status, created_at)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # autocommit 模式；需要原子性的地方自行 BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.db_path, timeout=30.0, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _row_to_task(row: sqlite3.Row) -> Dict[str, Any]:
+        task = dict(row)
+        for key in ("payload", "result", "state"):
+            if task.get(key) is not None:
+                task[key] = json.loads(task[key])
+        return task
+
+    def enqueue(self, task_type, payload, task_id=None, max_attempts=3):
+        task_id = task_id or uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO tasks (task_id, task_type, payload, max_attempts, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (task_id, task_type, json.dumps(to_jsonable(payload), ensure_ascii=False),
+                 max_attempts, now, now)
+            )
+        return task_id
+
+    def _requeue_expired(self, conn: sqlite3.Connection, now: float) -> int:
+        # 過期且還有次數 -> 回到 queued；次數用完 -> failed
+        requeued = conn.execute(
+            "UPDATE tasks SET status='queued', lease_owner=NULL, lease_expires=NULL, updated_at=? "
+            "WHERE status='leased' AND lease_expires < ? AND attempts < max_attempts",
+            (now, now)
+        ).rowcount
+        conn.execute(
+            "UPDATE tasks SET status='failed', error='lease expired (max attempts reached)', "
+            "lease_owner=NULL, updated_at=? "
+            "WHERE status='leased' AND lease_expires < ? AND attempts >= max_attempts",
+            (now, now)
+        )
+        return requeued
+
+    def requeue_expired(self):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                count = self._requeue_expired(conn, time.time())
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return count
+
+    def lease(self, worker_id, task_types=None, lease_seconds=60.0):
+        now = time.time()
+        types = list(task_types or [])
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._requeue_expired(conn, now)
+                query = "SELECT * FROM tasks WHERE status='queued'"
+                params: List[Any] = []
+                if types:
+                    query += f" AND task_type IN ({','.join('?' for _ in types)})"
+                    params.extend(types)
+                query += " ORDER BY created_at LIMIT 1"
+                row = conn.execute(query, params).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE tasks SET status='leased', lease_owner=?, lease_expires=?, "
+                    "attempts=attempts+1, updated_at=? WHERE task_id=?",
+                    (worker_id, now + lease_seconds, now, row["task_id"])
+                )
+                task = conn.execute(
+                    "SELECT * FROM tasks WHERE task_id=?", (row["task_id"],)
+                ).fetchone()
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return self._row_to_task(task)
+
+    def heartbeat(self, task_id, worker_id, lease_seconds=60.0, state=None):
+        now = time.time()
+        with self._connect() as conn:
+            if state is not None:
+                updated = conn.execute(
+                    "UPDATE tasks SET lease_expires=?, state=?, updated_at=? "
+                    "WHERE task_id=? AND lease_owner=? AND status='leased'",
+                    (now + lease_seconds, json.dumps(to_jsonable(state), ensure_ascii=False),
+                     now, task_id, worker_id)
+                ).rowcount
+            else:
+                updated = conn.execute(
+                    "UPDATE tasks SET lease_expires=?, updated_at=? "
+                    "WHERE task_id=? AND lease_owner=? AND status='leased'",
+                    (now + lease_seconds, now, task_id, worker_id)
+                ).rowcount
+        return updated == 1
+
+    def complete(self, task_id, worker_id, result=None):
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE tasks SET status='done', result=?, lease_owner=NULL, lease_expires=NULL, "
+                "updated_at=? WHERE task_id=? AND lease_owner=? AND status='leased'",
+                (json.dumps(to_jsonable(result), ensure_ascii=False), time.time(), task_id, worker_id)
+            ).rowcount
+        return updated == 1
+
+    def fail(self, task_id, worker_id, error, retry=True):
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE tasks SET "
+                "status=CASE WHEN ? AND attempts < max_attempts THEN 'queued' ELSE 'failed' END, "
+                "error=?, lease_owner=NULL, lease_expires=NULL, updated_at=? "
+                "WHERE task_id=? AND lease_owner=? AND status='leased'",
+                (1 if retry else 0, error, time.time(), task_id, worker_id)
+            ).rowcount
+        return updated == 1
+
+    def get(self, task_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM tasks WHERE task_id=?", (task_id,)).fetchone()
+        return self._row_to_task(row) if row else None
+
+    def stats(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM tasks GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+def load_job_queue(url: Optional[str] = None) -> Optional[JobQueue]:
+    """
+    依 URL 建立隊列 / Build a queue from a URL
+
+    - ""                         -> None（不用隊列，job 在 API process 內執行）
+    - "sqlite:///abs/path.db"    -> SQLiteJobQueue（絕對路徑）
+    - "sqlite:queue.db"          -> SQLiteJobQueue（相對 `settings.BASE_DIR`）
+    - "package.module:ClassName" -> 外部 broker 實作，以 `ClassName()` 建立
+    """
+    url = url if url is not None else getattr(settings, "JOB_QUEUE_URL", "")
+    if not url:
+        return None
+
+    if url.startswith("sqlite:"):
+        path = url[len("sqlite:"):]
+        if path.startswith("///"):
+            path = path[2:]
+        db_path = Path(path)
+        if not db_path.is_absolute():
+            db_path = Path(getattr(settings, "BASE_DIR", Path.cwd())) / db_path
+        return SQLiteJobQueue(str(db_path))
+
+    if ":" in url:
+        module_name, attr = url.split(":", 1)
+        module = __import__(module_name, fromlist=[attr])
+        queue = getattr(module, attr)()
+        if not isinstance(queue, JobQueue):
+            raise TypeError(f"{url} is not a JobQueue implementation")
+        return queue
+
+    raise ValueError(f"Unsupported JOB_QUEUE_URL: {url}")
@@ -0,0 +1,199 @@
+"""
+Job 狀態儲存（取代原本只增不減的 `jobs` dict）
+
+- 用法與 dict 相同：`jobs[job_id] = {...}`、`jobs[job_id]["progress"] = 50`。
+- 完成 / 失敗的 job 超過 `JOB_TTL_SECONDS` 後，transcript、syllable_data、new_script、
+  unified_data 等大型 artifact 會寫到 `JOB_STATE_DIR/{job_id}.json`，記憶體內只留摘要
+  （status、progress、errors、final_video ...）。
+- 已完成 job 的估計大小超過 `JOB_MEMORY_BUDGET_MB` 時，不等 TTL，從最早完成的開始 spill。
+- spill 後仍可用 `jobs[job_id]["transcript"]` 讀取：第一次存取時才從 JSON 載入（不放回記憶體）。
+  注意讀回來的是 JSON 結構（dict / list），不是 pydantic 物件。
+- 執行中的 job 不會被 spill。
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, MutableMapping, Optional
+
+try:
+    from video_pipeline.utils.job_queue import to_jsonable
+except Exception:
+    from utils.job_queue import to_jsonable
+
+
+FINISHED_STATUSES = ("completed", "failed")
+
+# spill 後仍留在記憶體的欄位（其餘一律寫到磁碟）
+SUMMARY_KEYS = (
+    "status", "title", "video_path", "current_step", "progress", "errors", "warnings",
+    "options", "final_video", "asr", "safety_stats", "queue", "artifacts", "job_dir", "disk_usage", "rerender", "preview_video", "unify_stream", "render_pipeline", "prompt_cache", "profile"
+)
+
+
+class JobRecord(dict):
+    """單一 job 的狀態；已 spill 的欄位在存取時才從磁碟載入"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._store: Optional["JobStore"] = None
+        self._job_id: Optional[str] = None
+
+    def __missing__(self, key):
+        if self._store is not None and key in self.get_spilled():
+            return self._store.load_artifact(self._job_id, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def get_spilled(self) -> List[str]:
+        return dict.get(self, "artifacts") or []
+
+
+class JobStore(MutableMapping):
+
+    def __init__(self, state_dir: Path, ttl_seconds: float = 900, memory_budget_bytes: int = 64 * 1024 * 1024):
+        self.state_dir = Path(state_dir)
+        self.ttl_seconds = ttl_seconds
+        self.memory_budget_bytes = memory_budget_bytes
+        self._records: Dict[str, JobRecord] = {}
+        self._finished_at: Dict[str, float] = {}
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self.spilled_total = 0
+
+    # ---------- dict 介面 ----------
+
+    def __getitem__(self, job_id: str) -> JobRecord:
+        return self._records[job_id]
+
+    def __setitem__(self, job_id: str, record: Dict[str, Any]):
+        rec = record if isinstance(record, JobRecord) else JobRecord(record)
+        rec._store, rec._job_id = self, job_id
+        with self._lock:
+            self._records[job_id] = rec
+            self._finished_at.pop(job_id, None)
+            self._sizes.pop(job_id, None)
+
+    def __delitem__(self, job_id: str):
+        with self._lock:
+            del self._records[job_id]
+            self._finished_at.pop(job_id, None)
+            self._sizes.pop(job_id, None)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._records))
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    # ---------- spill ----------
+
+    def _path(self, job_id: str) -> Path:
+        return self.state_dir / f"{job_id}.json"
+
+    def _read(self, job_id: str) -> Dict[str, Any]:
+        path = self._path(job_id)
+        if not path.exists():
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def load_artifact(self, job_id: str, key: str) -> Any:
+        """從 per-job JSON 讀取單一 artifact（不放回記憶體）"""
+        data = self._read(job_id)
+        if key not in data:
+            raise KeyError(key)
+        return data[key]
+
+    def restore(self, job_id: str) -> Optional[JobRecord]:
+        """記憶體中沒有（例如 API 重啟後）時，從磁碟還原摘要"""
+        data = self._read(job_id)
+        if not data:
+            return None
+        summary = JobRecord({k: v for k, v in data.items() if k in SUMMARY_KEYS})
+        summary["artifacts"] = sorted(k for k in data if k not in SUMMARY_KEYS)
+        self[job_id] = summary
+        with self._lock:
+            self._finished_at[job_id] = time.time()
+        return self._records[job_id]
+
+    def spill(self, job_id: str) -> None:
+        """把大型 artifact 寫到磁碟，記憶體內只留摘要"""
+        with self._lock:
+            rec = self._records.get(job_id)
+            if rec is None:
+                return
+            spilled = [k for k in rec if k not in SUMMARY_KEYS]
+            if not spilled:
+                return
+            # 之前 spill 過的欄位保留在檔案中，記憶體內的新值覆寫
+            data = self._read(job_id) if rec.get_spilled() else {}
+            data.update(to_jsonable(dict(rec)))
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+            tmp = self._path(job_id).with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            tmp.replace(self._path(job_id))
+
+            summary = JobRecord({k: v for k, v in rec.items() if k in SUMMARY_KEYS})
+            summary["artifacts"] = sorted(set(rec.get_spilled()) | set(spilled))
+            summary._store, summary._job_id = self, job_id
+            self._records[job_id] = summary
+            self._sizes.pop(job_id, None)
+            self.spilled_total += 1
+
+    def _estimate(self, job_id: str, rec: JobRecord) -> int:
+        if job_id not in self._sizes:
+            self._sizes[job_id] = len(json.dumps(to_jsonable(dict(rec)), ensure_ascii=False))
+        return self._sizes[job_id]
+
+    def sweep(self, now: Optional[float] = None) -> List[str]:
+        """
+        spill 超過 TTL 的已完成 job；已完成 job 的總估計大小超過 memory budget 時，
+        從最早完成的開始提前 spill。回傳這次 spill 的 job_id。
+        """
+        now = now or time.time()
+        spilled: List[str] = []
+        with self._lock:
+            finished = []
+            for job_id, rec in list(self._records.items()):
+                if rec.get("status") not in FINISHED_STATUSES:
+                    self._finished_at.pop(job_id, None)
+                    continue
+                finished_at = self._finished_at.setdefault(job_id, now)
+                if any(k not in SUMMARY_KEYS for k in rec):
+                    finished.append((finished_at, job_id))
+
+            finished.sort()
+            for finished_at, job_id in list(finished):
+                if now - finished_at >= self.ttl_seconds:
+                    self.spill(job_id)
+                    spilled.append(job_id)
+            remaining = [(t, j) for t, j in finished if j not in spilled]
+
+            total = sum(self._estimate(j, self._records[j]) for _, j in remaining)
+            for _, job_id in remaining:
+                if total <= self.memory_budget_bytes:
+                    break
+                total -= self._sizes.get(job_id, 0)
+                self.spill(job_id)
+                spilled.append(job_id)
+        return spilled
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_memory = sum(1 for r in self._records.values() if not r.get_spilled())
+            return {
+                "jobs": len(self._records),
+                "full_records": in_memory,
+                "spilled_records": len(self._records) - in_memory,
+                "estimated_finished_bytes": sum(self._sizes.values()),
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "spilled_total": self.spilled_total
+            }
@@ -0,0 +1,134 @@
+"""
+增量 JSON 解析（串流 LLM 回應用）
+
+LLM 串流回傳時，`per_sentence` 陣列的前幾項早在整個 completion 結束前就已完整。
+`JsonArrayStream` 逐段接收文字，掃描括號 / 字串狀態，指定路徑下的陣列每完成一個元素就立即回傳：
+
+    stream = JsonArrayStream(("per_sentence",))   # 根物件的 per_sentence 陣列；() = 根本身是陣列
+    for chunk in chunks:
+        for item in stream.feed(chunk):
+            ...
+    document = stream.close()                     # 完整文件（與 json.loads 結果相同）
+
+根容器之前只允許空白與一個 ```json（或 ```）fence；其他文字（e.g. "Here are the prompts [v2]:"）
+代表無法確定根容器在哪，改為不串流：`feed()` 不再回傳元素，`close()` 以與非串流相同的方式解析整段。
+只回傳物件 / 陣列型的元素（純量元素不會單獨回傳）。
+"""
+import json
+from typing import Any, List, Optional, Sequence
+
+
+class JsonArrayStream:
+
+    def __init__(self, path: Sequence[str] = ()):
+        self.path = tuple(path)
+        self._text = ""
+        self._pos = 0
+        # 每層 [容器類型, 從父層進來的 key, 目前的 key（物件用）]
+        self._stack: List[List[Any]] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._item_start: Optional[int] = None
+        self._doc_start: Optional[int] = None
+        self._doc_end: Optional[int] = None
+        self._fence_seen = False
+        self.streaming = True
+        self.items_emitted = 0
+
+    def _path_of_top(self) -> tuple:
+        return tuple(frame[1] for frame in self._stack[1:])
+
+    def _in_target(self) -> bool:
+        return bool(self._stack) and self._stack[-1][0] == "[" and self._path_of_top() == self.path
+
+    def feed(self, chunk: str) -> List[Any]:
+        """加入一段文字，回傳這段之後新完成的元素"""
+        if not chunk:
+            return []
+        self._text += chunk
+        if not self.streaming:
+            return []
+        items: List[Any] = []
+        text = self._text
+        i = self._pos
+        while i < len(text):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._last_string = json.loads(text[self._string_start:i + 1])
+                i += 1
+                continue
+
+            if self._doc_end is not None:
+                # 文件已結束（後面只剩 fence / 空白）
+                i += 1
+                continue
+
+            if not self._stack:
+                if ch.isspace():
+                    i += 1
+                    continue
+                if ch in "{[":
+                    self._doc_start = i
+                    self._stack.append([ch, None, None])
+                    i += 1
+                    continue
+                fence_end = None if self._fence_seen else self._fence_end(text, i)
+                if fence_end == -1:
+                    # fence 可能還沒收完（e.g. "``"、"```js"），等下一段
+                    break
+                if fence_end is None:
+                    # 根容器前有其他文字：不串流，close() 時整段解析
+                    self.streaming = False
+                    return []
+                self._fence_seen = True
+                i = fence_end
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == ":" and self._stack[-1][0] == "{":
+                self._stack[-1][2] = self._last_string
+            elif ch in "{[":
+                if self._in_target():
+                    self._item_start = i
+                parent = self._stack[-1]
+                self._stack.append([ch, parent[2] if parent[0] == "{" else "*", None])
+            elif ch in "}]":
+                self._stack.pop()
+                if not self._stack:
+                    self._doc_end = i + 1
+                elif self._in_target() and self._item_start is not None:
+                    items.append(json.loads(text[self._item_start:i + 1]))
+                    self._item_start = None
+            i += 1
+
+        self._pos = i
+        self.items_emitted += len(items)
+        return items
+
+    @staticmethod
+    def _fence_end(text: str, i: int) -> Optional[int]:
+        """text[i:] 是 ``` + 語言標記時回傳其後的位置；可能是不完整的 fence 回傳 -1；不是 fence 回傳 None"""
+        head = text[i:i + 3]
+        if head != "```":
+            return -1 if "```".startswith(head) else None
+        j = i + 3
+        while j < len(text) and text[j].isalpha():
+            j += 1
+        return -1 if j == len(text) else j
+
+    def close(self) -> Any:
+        """串流結束：解析完整文件"""
+        if not self.streaming or self._doc_start is None or self._doc_end is None:
+            content = self._text.replace("```json", "").replace("```", "").strip()
+            return json.loads(content)
+        return json.loads(self._text[self._doc_start:self._doc_end])
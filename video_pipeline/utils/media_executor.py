@@ -0,0 +1,269 @@
+"""
+共用的 ffmpeg / ffprobe 執行器
+
+- 所有 service 的 ffmpeg 呼叫都經過這裡：asyncio subprocess，不會卡住 event loop。
+- 全 process 共用一個並行上限（預設 CPU 數一半），跨 job 也不會同時開出幾十個 ffmpeg。
+- 每個 ffmpeg 加上 `-threads`，讓「並行數 × threads」大約等於 CPU 數。
+- 優先級：`probe`（ffprobe / 短查詢）> `preview`（抽 frame、預覽）> `final`（最終編碼）；
+  排隊時高優先先拿到名額，並依類別設定 nice 值（`MEDIA_NICE`）。
+- 收集 stderr、逾時會 kill process；失敗時拋出 `MediaProcessError`
+  （繼承 `subprocess.CalledProcessError`，原本捕捉 CalledProcessError 的程式碼不用改）。
+- 二進位輸出（e.g. 抽音訊的 PCM）可用 `on_stdout` 邊讀邊交給呼叫端，不經過暫存檔。
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import shutil
+import subprocess
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+# flexible settings import
+try:
+    from video_pipeline.config import settings
+except Exception:
+    try:
+        from config import settings
+    except Exception:
+        settings = type("_S", (), {})()
+
+
+PRIORITIES = {"probe": 0, "preview": 1, "final": 2}
+STREAM_CHUNK_BYTES = 1 << 16
+
+
+class MediaProcessError(subprocess.CalledProcessError):
+    """ffmpeg / ffprobe 失敗或逾時；`stderr` 保留最後的輸出方便除錯"""
+
+    def __init__(self, returncode: int, cmd: Sequence[str], output: Any = None,
+                 stderr: Any = None, timed_out: bool = False):
+        super().__init__(returncode, list(cmd), output, stderr)
+        self.timed_out = timed_out
+
+    def __str__(self):
+        if self.timed_out:
+            head = f"{os.path.basename(self.cmd[0])} timed out"
+        else:
+            head = f"{os.path.basename(self.cmd[0])} exited with {self.returncode}"
+        tail = (self.stderr or "").strip().splitlines()[-5:]
+        return head + (": " + " | ".join(tail) if tail else "")
+
+
+class MediaResult:
+
+    def __init__(self, returncode: int, stdout: str, stderr: str, elapsed: float):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.elapsed = elapsed
+
+
+class _PrioritySemaphore:
+    """
+    數字越小越先拿到名額；同優先級依排隊順序
+    可跨 event loop 使用（profile 的 job 在自己的 thread / loop 執行，共用同一個並行上限）
+    """
+
+    def __init__(self, value: int):
+        self._value = value
+        self._waiters: List[Any] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    async def acquire(self, priority: int):
+        with self._lock:
+            if self._value > 0 and not self.waiting:
+                self._value -= 1
+                return
+            fut = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # 名額已轉給我們但呼叫端被取消，交給下一位
+                self.release()
+            raise
+
+    def _grant(self, fut: asyncio.Future):
+        """在 waiter 所屬的 loop 上執行；等待期間已被取消時把名額交給下一位"""
+        if fut.done():
+            self.release()
+        else:
+            fut.set_result(None)
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                _, _, fut = heapq.heappop(self._waiters)
+                if fut.done():
+                    continue
+                loop = fut.get_loop()
+                try:
+                    same_loop = asyncio.get_running_loop() is loop
+                except RuntimeError:
+                    same_loop = False
+                if same_loop:
+                    fut.set_result(None)
+                else:
+                    loop.call_soon_threadsafe(self._grant, fut)
+                return
+            self._value += 1
+
+
+class MediaExecutor:
+
+    def __init__(
+        self,
+        max_processes: int,
+        threads_per_process: int,
+        nice: Optional[Dict[str, int]] = None,
+        timeout: Optional[float] = None
+    ):
+        self.max_processes = max(1, max_processes)
+        self.threads_per_process = max(1, threads_per_process)
+        self.nice = nice or {}
+        self.timeout = timeout
+        self._sem = _PrioritySemaphore(self.max_processes)
+        self.running = 0
+        self.stats: Dict[str, Dict[str, float]] = {
+            name: {"runs": 0, "failures": 0, "timeouts": 0, "busy_seconds": 0.0, "wait_seconds": 0.0}
+            for name in PRIORITIES
+        }
+
+    @staticmethod
+    def binary(name: str) -> str:
+        return shutil.which(name) or name
+
+    def _niced(self, cmd: List[str], priority: str) -> List[str]:
+        """
+        以 `nice -n` 前綴套用優先級的 nice 值（不用 preexec_fn：本 process 有許多 thread，
+        fork 後執行 Python callback 可能在 exec 前 deadlock）；沒有 nice 指令的平台不調整
+        """
+        level = int(self.nice.get(priority, 0))
+        nice = shutil.which("nice") if level else None
+        return [nice, "-n", str(level)] + cmd if nice else cmd
+
+    async def run(
+        self,
+        cmd: Sequence[str],
+        priority: str = "final",
+        timeout: Optional[float] = None,
+        check: bool = True,
+        on_stdout: Optional[Callable[[bytes], None]] = None
+    ) -> MediaResult:
+        """
+        在並行上限內執行一個外部 process，回傳 stdout / stderr（文字）
+        on_stdout: 給定時 stdout 以原始 bytes 邊讀邊交給它（e.g. `-f f32le -` 的 PCM），結果的 stdout 為空字串
+        """
+        cmd = [str(c) for c in cmd]
+        stats = self.stats[priority]
+        queued_at = time.perf_counter()
+        await self._sem.acquire(PRIORITIES[priority])
+        started = time.perf_counter()
+        stats["wait_seconds"] += started - queued_at
+        self.running += 1
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *self._niced(cmd, priority),
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                communicate = proc.communicate() if on_stdout is None else self._stream(proc, on_stdout)
+                out, err = await asyncio.wait_for(communicate, timeout or self.timeout)
+            except asyncio.TimeoutError:
+                proc.kill()
+                out, err = await proc.communicate()
+                stats["timeouts"] += 1
+                raise MediaProcessError(
+                    proc.returncode, cmd, out.decode(errors="replace"),
+                    err.decode(errors="replace"), timed_out=True
+                )
+            except asyncio.CancelledError:
+                # job 被取消時不要留下孤兒 ffmpeg
+                if proc.returncode is None:
+                    proc.kill()
+                    await proc.wait()
+                raise
+        finally:
+            self.running -= 1
+            stats["runs"] += 1
+            stats["busy_seconds"] += time.perf_counter() - started
+            self._sem.release()
+
+        result = MediaResult(
+            proc.returncode, out.decode(errors="replace"), err.decode(errors="replace"),
+            time.perf_counter() - started
+        )
+        if check and result.returncode != 0:
+            stats["failures"] += 1
+            raise MediaProcessError(result.returncode, cmd, result.stdout, result.stderr)
+        return result
+
+    @staticmethod
+    async def _stream(proc, on_stdout: Callable[[bytes], None]):
+        """stdout 分塊交給 on_stdout，stderr 同時讀完（避免 pipe 塞滿卡住 ffmpeg）"""
+        async def pump():
+            while True:
+                chunk = await proc.stdout.read(STREAM_CHUNK_BYTES)
+                if not chunk:
+                    break
+                on_stdout(chunk)
+
+        _, err = await asyncio.gather(pump(), proc.stderr.read())
+        await proc.wait()
+        return b"", err
+
+    async def ffmpeg(self, args: Sequence[str], priority: str = "final",
+                     threads: Optional[int] = None, **kwargs) -> MediaResult:
+        """
+        `args` 不含 ffmpeg 本身；`-threads` 插在最後一個參數（輸出檔）之前，限制 encoder threads
+        （呼叫端已指定 `-threads` 時不覆寫）
+        """
+        args = [str(a) for a in args]
+        if "-threads" not in args and args:
+            args = args[:-1] + ["-threads", str(threads or self.threads_per_process), args[-1]]
+        cmd = [self.binary("ffmpeg"), "-hide_banner", "-nostdin"] + args
+        return await self.run(cmd, priority=priority, **kwargs)
+
+    async def ffprobe(self, args: Sequence[str], priority: str = "probe", **kwargs) -> MediaResult:
+        return await self.run([self.binary("ffprobe")] + [str(a) for a in args], priority=priority, **kwargs)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "max_processes": self.max_processes,
+            "threads_per_process": self.threads_per_process,
+            "running": self.running,
+            "queued": self._sem.waiting,
+            "by_priority": {
+                name: dict(s, busy_seconds=round(s["busy_seconds"], 3), wait_seconds=round(s["wait_seconds"], 3))
+                for name, s in self.stats.items()
+            }
+        }
+
+
+_executor: Optional[MediaExecutor] = None
+
+
+def get_media_executor() -> MediaExecutor:
+    """同一 process 內共用的 executor（上限依 settings / CPU 數）"""
+    global _executor
+    if _executor is None:
+        cpus = os.cpu_count() or 1
+        max_processes = int(getattr(settings, "MEDIA_MAX_PROCESSES", 0) or 0) or max(1, cpus // 2)
+        threads = int(getattr(settings, "MEDIA_THREADS_PER_PROCESS", 0) or 0) or max(1, cpus // max_processes)
+        _executor = MediaExecutor(
+            max_processes,
+            threads,
+            nice=dict(getattr(settings, "MEDIA_NICE", {}) or {}),
+            timeout=float(getattr(settings, "MEDIA_TIMEOUT", 0) or 0) or None
+        )
+    return _executor
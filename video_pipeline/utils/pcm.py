@@ -0,0 +1,168 @@
+"""
+抽出的音訊以記憶體中的 PCM buffer 直接交給 ASR（不寫 wav、ASR 不再 decode 一次）
+
+原本：video -> `extract_audio` 寫 `.wav` -> Whisper / faster-whisper 再用自己的 ffmpeg 讀回來 decode。
+現在：一個 ffmpeg process 輸出 16 kHz mono float32（`-f f32le -`），stdout 邊讀邊寫進 `PCMBuffer`，
+`buffer.array` 就是 Whisper 要的輸入格式（float32、-1..1、16 kHz）。
+
+- `shared=True` 時 buffer 放在 `multiprocessing.shared_memory`：長片切段後，ASR process pool
+  的 worker 以 `PCMSlice`（segment 名稱 + sample 範圍）attach 同一塊記憶體，不需要切段 wav、也不用 pickle 音訊。
+- 靜音偵測改在 buffer 上用 numpy 算（`pcm_silences`），行為對應 ffmpeg silencedetect。
+- 用完要 `close()`（shared memory 會 unlink）。
+"""
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+
+SAMPLE_RATE = 16000
+BYTES_PER_SAMPLE = 4  # float32
+
+
+def pcm_available() -> bool:
+    return np is not None
+
+
+@dataclass(frozen=True)
+class PCMSlice:
+    """shared memory 中的一段音訊（可 pickle，給 process pool worker 用）"""
+    name: str
+    start: int
+    end: int
+
+    @property
+    def seconds(self) -> float:
+        return (self.end - self.start) / SAMPLE_RATE
+
+
+class PCMBuffer:
+    """
+    可成長的 float32 buffer，`feed()` 接 ffmpeg stdout 的原始 bytes（chunk 不必對齊 4 bytes）
+
+    `expected_seconds` 已知時（metadata 的 duration）一次配置好，通常不需要再擴充。
+    """
+
+    def __init__(self, expected_seconds: float = 0.0, shared: bool = False):
+        if np is None:
+            raise RuntimeError("numpy is required for in-memory PCM")
+        self.shared = shared
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._data = None
+        self._length = 0
+        self._pending = b""
+        # 多留 1 秒：container 的 duration 常比實際音訊短一點
+        self._allocate(int((max(0.0, expected_seconds) + 1.0) * SAMPLE_RATE))
+
+    def _allocate(self, samples: int):
+        samples = max(samples, SAMPLE_RATE)
+        old, old_shm = self._data, self._shm
+        if self.shared:
+            self._shm = shared_memory.SharedMemory(create=True, size=samples * BYTES_PER_SAMPLE)
+            self._data = np.ndarray((samples,), dtype=np.float32, buffer=self._shm.buf)
+        else:
+            self._data = np.empty(samples, dtype=np.float32)
+        if old is not None:
+            self._data[:self._length] = old[:self._length]
+        del old
+        if old_shm is not None:
+            old_shm.close()
+            old_shm.unlink()
+
+    def feed(self, chunk: bytes):
+        if self._pending:
+            chunk = self._pending + chunk
+        usable = len(chunk) - len(chunk) % BYTES_PER_SAMPLE
+        self._pending = chunk[usable:]
+        if not usable:
+            return
+        samples = np.frombuffer(chunk, dtype="<f4", count=usable // BYTES_PER_SAMPLE)
+        end = self._length + len(samples)
+        if end > len(self._data):
+            self._allocate(max(end, int(len(self._data) * 1.5)))
+        self._data[self._length:end] = samples
+        self._length = end
+
+    @property
+    def array(self):
+        """目前已收到的 samples（view，不複製）"""
+        return self._data[:self._length]
+
+    @property
+    def seconds(self) -> float:
+        return self._length / SAMPLE_RATE
+
+    def slice(self, start: float, end: float) -> PCMSlice:
+        """秒 -> shared memory 的 sample 範圍（shared=False 時不能用）"""
+        if self._shm is None:
+            raise RuntimeError("PCMBuffer is not backed by shared memory")
+        lo = min(self._length, max(0, int(round(start * SAMPLE_RATE))))
+        hi = min(self._length, max(lo, int(round(end * SAMPLE_RATE))))
+        return PCMSlice(self._shm.name, lo, hi)
+
+    def close(self):
+        self._data = None
+        self._length = 0
+        if self._shm is not None:
+            self._shm.unlink()
+            try:
+                self._shm.close()
+            except BufferError:
+                # 呼叫端還留著 array view 時，mapping 交給 GC（名稱已 unlink）
+                pass
+            self._shm = None
+
+
+class attach_pcm:
+    """
+    worker 端：`with attach_pcm(pcm_slice) as audio:` 取得該段的 float32 view
+    （離開時只 close mapping，unlink 由建立的 process 負責）
+    """
+
+    def __init__(self, pcm_slice: PCMSlice):
+        self.pcm_slice = pcm_slice
+        self._shm: Optional[shared_memory.SharedMemory] = None
+
+    def __enter__(self):
+        self._shm = shared_memory.SharedMemory(name=self.pcm_slice.name)
+        count = self.pcm_slice.end - self.pcm_slice.start
+        return np.ndarray(
+            (count,), dtype=np.float32, buffer=self._shm.buf, offset=self.pcm_slice.start * BYTES_PER_SAMPLE
+        )
+
+    def __exit__(self, *exc):
+        try:
+            self._shm.close()
+        except BufferError:
+            # ASR 還留著 view 的參考時，mapping 交給 GC
+            pass
+        return False
+
+
+def pcm_silences(
+    audio, noise_db: float = -35.0, min_silence: float = 0.4, window: float = 0.02
+) -> List[Tuple[float, float]]:
+    """
+    對應 ffmpeg `silencedetect=noise=..dB:d=..`：以 20 ms 視窗的 RMS 低於門檻、
+    連續至少 min_silence 秒視為靜音，回傳 [(start, end), ...]
+    """
+    hop = max(1, int(window * SAMPLE_RATE))
+    frames = len(audio) // hop
+    if frames == 0:
+        return []
+    blocks = np.asarray(audio[:frames * hop], dtype=np.float32).reshape(frames, hop)
+    rms = np.sqrt(np.mean(np.square(blocks), axis=1))
+    quiet = rms < 10 ** (noise_db / 20.0)
+
+    # quiet 區段的邊界
+    edges = np.diff(np.concatenate(([0], quiet.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    min_frames = int(np.ceil(min_silence / window))
+    return [
+        (float(s * hop / SAMPLE_RATE), float(e * hop / SAMPLE_RATE))
+        for s, e in zip(starts, ends) if e - s >= min_frames
+    ]
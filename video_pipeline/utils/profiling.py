@@ -0,0 +1,226 @@
+"""
+單一 job 的取樣 profiling（opt-in，`/api/pipeline/start?profile=true`）
+
+用 pyinstrument（選用套件）以 `async_mode="enabled"` 取樣整個 `run_pipeline`：
+await 中的時間會記在等待的那一行（`[await]`），所以看得出時間是花在 Python 本身
+（pydantic、base64、JSON ...）、等 provider 回應，還是等 ffmpeg。
+
+輸出到 job 目錄：
+- `profile.html`：pyinstrument 互動式報告
+- `profile.speedscope.json`：flamegraph（https://www.speedscope.app 開啟）
+- `profile_summary.json`：各 step 的 wall time，以及各 stage 的 python / await / ffmpeg 時間、
+  Python 時間最多的模組
+
+沒有開 profile 的 job 完全不經過這裡（不 import pyinstrument、不取樣）。
+pyinstrument 的 profiling hook 裝在執行它的 thread 上（`async_mode` 只過濾樣本，不會移除 hook 的成本），
+所以開了 profile 的 job 放在自己的 thread + event loop 執行：同一個 API process 裡其他 job 的 loop 不受影響。
+"""
+import asyncio
+import concurrent.futures
+import importlib.util
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional
+
+# flexible settings import
+try:
+    from video_pipeline.config import settings
+except Exception:
+    try:
+        from config import settings
+    except Exception:
+        settings = type("_S", (), {})()
+
+
+PACKAGE_MARKER = "video_pipeline"
+MEDIA_MODULE = "media_executor.py"
+
+
+def profiling_available() -> bool:
+    return importlib.util.find_spec("pyinstrument") is not None
+
+
+def _module_of(file_path: str) -> str:
+    """site-packages / 標準庫底下取頂層模組名，其餘取檔名（e.g. pydantic、json、base64）"""
+    parts = Path(file_path).parts
+    for idx, part in enumerate(parts[:-1]):
+        if part in ("site-packages", "dist-packages") or part.startswith("python3"):
+            name = parts[idx + 1]
+            if name not in ("site-packages", "dist-packages"):
+                return Path(name).stem
+    return Path(file_path).stem or "<unknown>"
+
+
+class _Summary:
+    """走訪 pyinstrument frame tree，把 self time 依 stage / 類別累計"""
+
+    def __init__(self, entry_functions):
+        self.entry_functions = set(entry_functions)
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.python_by_module: Dict[str, float] = {}
+
+    def walk(self, frame, stage: Optional[str] = None, in_media: bool = False, parent_file: str = ""):
+        identifier = getattr(frame, "identifier", "") or ""
+        # `[self]` 是 pyinstrument 補的合成 frame：時間屬於上一層函式本身
+        file_path = parent_file if identifier.startswith("[self]") else (getattr(frame, "file_path", None) or "")
+        function = getattr(frame, "function", None) or ""
+        ours = (PACKAGE_MARKER in file_path or Path(file_path).parent.name in ("services", "utils")) \
+            and Path(file_path).name != Path(__file__).name
+        in_media = in_media or file_path.endswith(MEDIA_MODULE)
+
+        # stage = run_pipeline 直接呼叫的函式；gather / create_task 出去的 task 不在 run_pipeline 底下，
+        # 以該 task 最外層的專案函式為 stage
+        if function in self.entry_functions:
+            stage = None
+        elif ours and stage is None:
+            stage = function
+
+        children = list(getattr(frame, "children", []) or [])
+        own = max(0.0, float(frame.time) - sum(float(c.time) for c in children))
+        if own > 0:
+            if in_media:
+                kind = "ffmpeg"
+            elif identifier.startswith("[await]"):
+                kind = "await"
+            elif identifier.startswith("[") and not identifier.startswith("[self]"):
+                kind = "other"
+            else:
+                kind = "python"
+                module = _module_of(file_path)
+                self.python_by_module[module] = self.python_by_module.get(module, 0.0) + own
+            bucket = self.stages.setdefault(
+                stage or "<outside pipeline>", {"total": 0.0, "python": 0.0, "await": 0.0, "ffmpeg": 0.0, "other": 0.0}
+            )
+            bucket[kind] += own
+            bucket["total"] += own
+
+        for child in children:
+            self.walk(child, stage, in_media, file_path)
+
+    def to_dict(self, top: int = 15) -> Dict[str, Any]:
+        return {
+            "stages": {
+                name: {k: round(v, 4) for k, v in bucket.items()}
+                for name, bucket in sorted(self.stages.items(), key=lambda kv: -kv[1]["total"])
+            },
+            "python_by_module": {
+                name: round(seconds, 4)
+                for name, seconds in sorted(self.python_by_module.items(), key=lambda kv: -kv[1])[:top]
+            }
+        }
+
+
+class JobProfiler:
+    """
+    包住一個 job 的 coroutine：
+
+        await JobProfiler(job_id, job_dir, jobs[job_id]).run(lambda: _run_pipeline(...))
+
+    `record` 的 `current_step` 變化另外以輕量 poll 記錄成 step timeline（wall time）。
+    job 在自己的 thread / event loop 執行，跨 job 共用的物件需可跨 loop 使用（e.g. media executor 的並行上限）。
+    """
+
+    def __init__(self, job_id: str, output_dir: Path, record: Mapping[str, Any],
+                 interval: Optional[float] = None, entry_functions=("_run_pipeline",)):
+        self.job_id = job_id
+        self.output_dir = Path(output_dir)
+        self.record = record
+        self.interval = float(interval or getattr(settings, "PROFILE_INTERVAL", 0.001))
+        self.entry_functions = entry_functions
+        self.steps: List[Dict[str, Any]] = []
+
+    async def _watch_steps(self, started: float):
+        current = None
+        while True:
+            step = self.record.get("current_step")
+            now = time.perf_counter() - started
+            if step != current:
+                if self.steps:
+                    self.steps[-1]["seconds"] = round(now - self.steps[-1]["start"], 3)
+                self.steps.append({"step": step, "start": round(now, 3)})
+                current = step
+            await asyncio.sleep(0.05)
+
+    async def run(self, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """在專用 thread 的 event loop 取樣執行 `factory()`；外層被取消時一併取消 job"""
+        holder: Dict[str, Any] = {}
+
+        async def main():
+            if holder.get("cancelled"):
+                raise asyncio.CancelledError()
+            holder["loop"], holder["task"] = asyncio.get_running_loop(), asyncio.current_task()
+            return await self._profile(factory)
+
+        done: concurrent.futures.Future = concurrent.futures.Future()
+
+        def target():
+            try:
+                done.set_result(asyncio.run(main()))
+            except BaseException as e:
+                done.set_exception(e)
+
+        threading.Thread(target=target, name=f"profile-{self.job_id}", daemon=True).start()
+        waiter = asyncio.wrap_future(done)
+        try:
+            return await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            holder["cancelled"] = True
+            if "task" in holder:
+                holder["loop"].call_soon_threadsafe(holder["task"].cancel)
+            await asyncio.wait([waiter])
+            raise
+
+    async def _profile(self, factory: Callable[[], Awaitable[Any]]) -> Any:
+        from pyinstrument import Profiler
+
+        started = time.perf_counter()
+        # watcher 在 profiler 啟動前建立：它的 context 不在取樣範圍內
+        watcher = asyncio.create_task(self._watch_steps(started))
+        profiler = Profiler(interval=self.interval, async_mode="enabled")
+        profiler.start()
+        try:
+            return await factory()
+        finally:
+            profiler.stop()
+            watcher.cancel()
+            wall = time.perf_counter() - started
+            if self.steps:
+                self.steps[-1]["seconds"] = round(wall - self.steps[-1]["start"], 3)
+            try:
+                files = await asyncio.to_thread(self._write, profiler, wall)
+                self.record["profile"] = files
+            except Exception as e:
+                # profiling 失敗不影響 job 結果
+                self.record["profile"] = {"error": str(e)}
+
+    def _write(self, profiler, wall: float) -> Dict[str, Any]:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        html_path = self.output_dir / "profile.html"
+        html_path.write_text(profiler.output_html(), encoding="utf-8")
+
+        files: Dict[str, Any] = {"html": str(html_path)}
+        try:
+            from pyinstrument.renderers import SpeedscopeRenderer
+            flame_path = self.output_dir / "profile.speedscope.json"
+            flame_path.write_text(profiler.output(SpeedscopeRenderer()), encoding="utf-8")
+            files["flamegraph"] = str(flame_path)
+        except ImportError:
+            # pyinstrument < 4.0 沒有 speedscope renderer，只留 HTML
+            pass
+
+        summary = _Summary(self.entry_functions)
+        session = profiler.last_session
+        root = session.root_frame() if session is not None else None
+        if root is not None:
+            summary.walk(root)
+        data = dict(
+            {"job_id": self.job_id, "wall_seconds": round(wall, 3), "sample_interval": self.interval, "steps": self.steps},
+            **summary.to_dict()
+        )
+        summary_path = self.output_dir / "profile_summary.json"
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        files["summary"] = str(summary_path)
+        return files
@@ -0,0 +1,289 @@
+"""
+跨 job 的生圖快取（以 prompt 為索引）
+
+系列影片重複出現同樣的角色與地點，prompt 幾乎相同。`ImageGenService.generate()` 先查這裡：
+- 完全相同（正規化後的 prompt + engine / 解析度 / steps）的 hash 命中直接沿用
+- 否則以字元 n-gram 的 Jaccard 相似度找最接近的一筆，超過 `PROMPT_CACHE_SIMILARITY` 才沿用
+- 每筆記錄該圖的安全檢查結果（`safe`: None = 未檢查、True = 通過、False = 未通過）；
+  未通過的不會再被命中。檢查結果是「這張圖 × 這個 prompt」的判定，只有完全相同的 prompt 再次命中時才跳過檢查；
+  相似命中的圖是對另一個 prompt 檢查過的，會以新 prompt 另存一筆（未檢查），照常做安全與 prompt 符合度檢查
+
+圖檔放在 `DiskLRUCache`（依總大小淘汰），索引是同目錄的 `index.json`（寫入時與檔案內容合併，多個 process 共用也不會互相覆蓋）。
+每個 job 的命中統計用 `job_stats(job_id)` 取得。
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional, Set, Tuple
+
+try:
+    from video_pipeline.utils.artifacts import artifact_bytes, artifact_digest
+    from video_pipeline.utils.disk_cache import DiskLRUCache
+except Exception:
+    from utils.artifacts import artifact_bytes, artifact_digest
+    from utils.disk_cache import DiskLRUCache
+
+# flexible settings import
+try:
+    from video_pipeline.config import settings
+except Exception:
+    try:
+        from config import settings
+    except Exception:
+        settings = type("_S", (), {})()
+
+
+def normalize_prompt(prompt: str) -> str:
+    return re.sub(r"\s+", " ", prompt or "").strip().lower()
+
+
+def ngrams(text: str, n: int) -> Set[str]:
+    if len(text) <= n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def image_digest(path: str) -> str:
+    """圖片內容的 sha256；記憶體中的 ImageArtifact 不讀檔"""
+    digest = artifact_digest(path)
+    if digest is not None:
+        return digest
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class PromptImageCache:
+
+    INDEX = "index.json"
+
+    def __init__(self, root: Path, max_bytes: int, threshold: float = 0.9, n: int = 3):
+        self.root = Path(root)
+        self.images = DiskLRUCache(self.root / "images", max_bytes, suffix=".jpg")
+        self.threshold = threshold
+        self.n = n
+        self._lock = threading.RLock()
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        self._index_mtime: Optional[float] = None
+        self._grams: Dict[str, Set[str]] = {}
+        self._dirty: Set[str] = set()
+        self._jobs: Dict[str, Dict[str, int]] = {}
+
+    # ---------- 索引 ----------
+
+    @property
+    def index_path(self) -> Path:
+        return self.root / self.INDEX
+
+    def _read_index(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _mtime(self) -> Optional[float]:
+        try:
+            return self.index_path.stat().st_mtime
+        except OSError:
+            return None
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        # 其他 process 更新了 index 且本地沒有未寫回的變更時重新載入
+        if self._entries is None or (not self._dirty and self._mtime() != self._index_mtime):
+            self._entries, self._grams = {}, {}
+            self._index_mtime = self._mtime()
+            for key, entry in self._read_index().items():
+                self._add(key, entry)
+        return self._entries
+
+    def _add(self, key: str, entry: Dict[str, Any]):
+        self._entries[key] = entry
+        for gram in ngrams(entry["norm"], self.n):
+            self._grams.setdefault(gram, set()).add(key)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for gram in ngrams(entry["norm"], self.n):
+            self._grams.get(gram, set()).discard(key)
+        self._dirty.add(key)
+
+    def save(self):
+        """把這個 process 改過的項目合併寫回 index.json"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = self._read_index()
+            for key in self._dirty:
+                if key in self._entries:
+                    data[key] = self._entries[key]
+                else:
+                    data.pop(key, None)
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp = self.index_path.with_name(f".{self.INDEX}.{uuid.uuid4().hex}.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.index_path)
+            self._dirty.clear()
+            self._index_mtime = self._mtime()
+
+    # ---------- 查詢 / 寫入 ----------
+
+    @staticmethod
+    def variant_of(profile: Dict[str, Any]) -> str:
+        """會影響圖片內容的生成參數（不同參數的圖不互相命中）"""
+        return json.dumps([
+            profile.get("image_engine") or getattr(settings, "IMAGE_ENGINE", ""),
+            profile.get("width") or getattr(settings, "IMAGE_WIDTH", 576),
+            profile.get("height") or getattr(settings, "IMAGE_HEIGHT", 1024),
+            profile.get("image_steps")
+        ])
+
+    def make_key(self, prompt: str, variant: str) -> str:
+        return DiskLRUCache.make_key(prompt=normalize_prompt(prompt), variant=variant)
+
+    def job_stats(self, job_id: str) -> Dict[str, int]:
+        with self._lock:
+            return self._jobs.setdefault(
+                job_id, {"lookups": 0, "exact_hits": 0, "similar_hits": 0, "misses": 0, "verified_skips": 0}
+            )
+
+    def release(self, job_id: str) -> Optional[Dict[str, int]]:
+        """job 結束：移除並回傳它的命中統計（沒有查詢過時回傳 None）"""
+        with self._lock:
+            return self._jobs.pop(job_id, None)
+
+    def _similar(self, norm: str, variant: str) -> Tuple[Optional[str], float]:
+        grams = ngrams(norm, self.n)
+        if not grams:
+            return None, 0.0
+        overlap: Dict[str, int] = {}
+        for gram in grams:
+            for key in self._grams.get(gram, ()):
+                overlap[key] = overlap.get(key, 0) + 1
+        best, best_score = None, 0.0
+        for key, shared in overlap.items():
+            entry = self._entries[key]
+            if entry["variant"] != variant or entry.get("safe") is False:
+                continue
+            # Jaccard = |A ∩ B| / |A ∪ B|
+            score = shared / (len(grams) + entry["grams"] - shared)
+            if score > best_score:
+                best, best_score = key, score
+        return (best, best_score) if best_score >= self.threshold else (None, best_score)
+
+    def lookup(self, prompt: str, variant: str, job_id: Optional[str] = None) -> Optional[Tuple[bytes, str]]:
+        """命中時回傳 (圖檔內容, "exact" / "similar")；圖檔已被 LRU 淘汰的項目順便移除"""
+        with self._lock:
+            self._load()
+            stats = self.job_stats(job_id) if job_id else {}
+            stats["lookups"] = stats.get("lookups", 0) + 1
+            key = self.make_key(prompt, variant)
+            entry = self._entries.get(key)
+            kind = "exact_hits"
+            if entry is None or entry.get("safe") is False:
+                key, _ = self._similar(normalize_prompt(prompt), variant)
+                entry = self._entries.get(key) if key else None
+                kind = "similar_hits"
+            data = self.images.get(entry["digest"]) if entry else None
+            if data is None:
+                if entry is not None:
+                    self._remove(key)
+                stats["misses"] = stats.get("misses", 0) + 1
+                return None
+            entry["hits"] = entry.get("hits", 0) + 1
+            entry["last_hit"] = time.time()
+            self._dirty.add(key)
+            stats[kind] = stats.get(kind, 0) + 1
+            return data, "exact" if kind == "exact_hits" else "similar"
+
+    def put(self, prompt: str, variant: str, img_path: str) -> str:
+        """生成後寫入（尚未檢查），回傳圖檔 digest"""
+        digest = image_digest(img_path)
+        data = artifact_bytes(img_path)
+        if data is not None:
+            # 檔案可能還在背景寫入，直接存記憶體中的內容
+            self.images.put(digest, data)
+        else:
+            self.images.put_file(digest, Path(img_path))
+        norm = normalize_prompt(prompt)
+        with self._lock:
+            self._load()
+            key = self.make_key(prompt, variant)
+            self._remove(key)
+            self._add(key, {
+                "prompt": prompt, "norm": norm, "variant": variant, "digest": digest,
+                "grams": len(ngrams(norm, self.n)), "safe": None, "created": time.time(), "hits": 0
+            })
+            self._dirty.add(key)
+        return digest
+
+    def _entry_for(self, img_path: str, prompt: str, variant: str) -> Optional[str]:
+        """這個 prompt 的項目且圖檔內容相同時回傳 key（同一張圖對別的 prompt 的判定不算）"""
+        digest = image_digest(img_path)
+        key = self.make_key(prompt, variant)
+        self._load()
+        entry = self._entries.get(key)
+        return key if entry is not None and entry["digest"] == digest else None
+
+    def mark(self, img_path: str, prompt: str, variant: str, ok: bool):
+        """記錄這張圖對這個 prompt 的檢查結果"""
+        with self._lock:
+            try:
+                key = self._entry_for(img_path, prompt, variant)
+            except OSError:
+                return
+            if key is not None:
+                self._entries[key]["safe"] = bool(ok)
+                self._dirty.add(key)
+
+    def is_verified(self, img_path: str, prompt: str, variant: str, job_id: Optional[str] = None) -> bool:
+        """這張圖之前已對同一個 prompt 通過檢查（只有完全相同的 prompt 命中才可跳過檢查）"""
+        with self._lock:
+            try:
+                key = self._entry_for(img_path, prompt, variant)
+            except OSError:
+                return False
+            verified = key is not None and self._entries[key].get("safe") is True
+            if verified and job_id:
+                self.job_stats(job_id)["verified_skips"] += 1
+            return verified
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._load()
+            return {
+                "entries": len(entries),
+                "verified": sum(1 for e in entries.values() if e.get("safe") is True),
+                "rejected": sum(1 for e in entries.values() if e.get("safe") is False),
+                "threshold": self.threshold,
+                "jobs": {job_id: dict(stats) for job_id, stats in self._jobs.items()}
+            }
+
+
+_cache: Optional[PromptImageCache] = None
+
+
+def get_prompt_cache() -> Optional[PromptImageCache]:
+    """同一 process 共用；PROMPT_CACHE_ENABLED=False 時回傳 None"""
+    global _cache
+    if not getattr(settings, "PROMPT_CACHE_ENABLED", True):
+        return None
+    if _cache is None:
+        root = getattr(settings, "PROMPT_CACHE_DIR", None) or Path(getattr(settings, "BASE_DIR", Path.cwd())) / "cache" / "images"
+        _cache = PromptImageCache(
+            Path(root),
+            int(getattr(settings, "PROMPT_CACHE_MAX_MB", 4096)) * 1024 * 1024,
+            threshold=float(getattr(settings, "PROMPT_CACHE_SIMILARITY", 0.9)),
+            n=int(getattr(settings, "PROMPT_CACHE_NGRAM", 3))
+        )
+    return _cache
@@ -0,0 +1,91 @@
+"""
+Render manifest（增量重新算圖用）
+
+每個 job 目錄下的 `render_manifest.json` 記錄：
+- clips：每個 clip 的來源圖、內容 hash（圖檔 bytes + 編碼參數）與輸出的 mp4
+- mixed_audio：混音輸入（對白 + 音樂）的 hash
+- renditions：各輸出規格（解析度 / 裁切 / 字幕）的輸入 hash 與輸出檔
+
+重新算圖時只重新編碼 hash 改變的 clip；其他 clip 與音訊直接沿用，最後以 stream copy 重新 concat / mux。
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+CHUNK_SIZE = 1024 * 1024
+CLIP_ID_RE = re.compile(r"(\d+)([a-z]+)")
+
+
+def file_hash(path: str, *extra: Any) -> str:
+    """檔案內容 + 額外參數（編碼設定等）的 sha256；檔案不存在時只 hash 參數"""
+    h = hashlib.sha256()
+    p = Path(path)
+    if p.is_file():
+        with open(p, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                h.update(chunk)
+    h.update(json.dumps(list(extra), sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+def clip_order_key(clip_id: str) -> Tuple[int, str]:
+    """clip_id 是 `"%02d" % 句子編號 + 字母`，句子數 >= 100 時字串排序會錯（"100a" < "10a"），改以數字比"""
+    match = CLIP_ID_RE.fullmatch(clip_id)
+    if match is None:
+        return (sys.maxsize, clip_id)
+    return (int(match.group(1)), match.group(2))
+
+
+class RenderManifest:
+
+    FILENAME = "render_manifest.json"
+
+    def __init__(self, job_dir: Path):
+        self.path = Path(job_dir) / self.FILENAME
+        self.data: Dict[str, Any] = {"clips": {}, "mixed_audio": {}, "renditions": {}}
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.data.update(json.load(f))
+            except (OSError, ValueError):
+                pass
+
+    @property
+    def clips(self) -> Dict[str, Dict[str, Any]]:
+        return self.data["clips"]
+
+    def ordered_clips(self) -> List[Dict[str, Any]]:
+        """依影片順序排序（句子編號再字母："09a" < "10a" < "100a"）"""
+        return [
+            dict(entry, clip_id=clip_id)
+            for clip_id, entry in sorted(self.clips.items(), key=lambda item: clip_order_key(item[0]))
+        ]
+
+    def is_fresh(self, clip_id: str, content_hash: str) -> bool:
+        entry = self.clips.get(clip_id)
+        return bool(entry) and entry.get("hash") == content_hash and Path(entry.get("video_path", "")).exists()
+
+    def set_clip(self, clip_id: str, img_path: str, content_hash: str, video_path: str) -> None:
+        self.clips[clip_id] = {"img_path": img_path, "hash": content_hash, "video_path": video_path}
+
+    def drop_missing(self, keep: Iterable[str]) -> None:
+        keep = set(keep)
+        for clip_id in list(self.clips):
+            if clip_id not in keep:
+                del self.clips[clip_id]
+
+    def save(self, only: Optional[Iterable[str]] = None) -> None:
+        """寫回檔案；`only` 指定時只更新這些欄位，其餘保留檔案內容（clip 編碼與混音可能同時進行）"""
+        data = self.data
+        if only is not None:
+            data = RenderManifest(self.path.parent).data
+            data.update({key: self.data[key] for key in only})
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        tmp.replace(self.path)
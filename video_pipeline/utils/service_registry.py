@@ -0,0 +1,109 @@
+"""
+Lazy service registry
+
+- 服務模組在第一次使用時才 import（例如 `services.transcription` 會拉進 whisper / torch），
+  API process 啟動時不需要載入任何重型依賴。
+- 每個服務預設為 singleton：第一次呼叫時建立，之後共用（Whisper model 只載入一次）。
+- 記錄每個模組的 import 時間與 instance 建立時間，供 `/api/startup` 與 `/api/warmup` 回報。
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+
+class ServiceRegistry:
+
+    def __init__(self, loader: Callable[[str, str], Any]):
+        # loader(module_name, attr) -> class / function，例如 main._import
+        self._loader = loader
+        self._specs: Dict[str, Tuple[str, str, bool]] = {}
+        self._targets: Dict[str, Any] = {}
+        self._instances: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        self.timings: Dict[str, Dict[str, float]] = {}
+
+    def register(self, name: str, module: str, attr: str, singleton: bool = True) -> "LazyService":
+        self._specs[name] = (module, attr, singleton)
+        return LazyService(self, name)
+
+    def override(self, name: str, target: Any = None, instance: Any = None) -> None:
+        """替換服務實作（load test / stub provider 用）：傳入 class 或現成 instance"""
+        with self._lock:
+            self._instances.pop(name, None)
+            if target is not None:
+                self._targets[name] = target
+            if instance is not None:
+                self._instances[name] = instance
+                self._targets.setdefault(name, type(instance))
+
+    def names(self) -> Iterable[str]:
+        return list(self._specs)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._targets
+
+    def target(self, name: str) -> Any:
+        """取得 class / function（第一次時才 import）"""
+        if name in self._targets:
+            return self._targets[name]
+        with self._lock:
+            if name not in self._targets:
+                module, attr, _ = self._specs[name]
+                started = time.perf_counter()
+                self._targets[name] = self._loader(module, attr)
+                self.timings.setdefault(name, {})["import_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return self._targets[name]
+
+    def get(self, name: str) -> Any:
+        """取得 singleton instance（第一次時才建立）"""
+        if name in self._instances:
+            return self._instances[name]
+        cls = self.target(name)
+        with self._lock:
+            if name not in self._instances:
+                started = time.perf_counter()
+                self._instances[name] = cls()
+                self.timings.setdefault(name, {})["init_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return self._instances[name]
+
+    def warmup(self, names: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """預先 import + 建立服務（同步；在 async 環境請丟到 thread 執行）"""
+        report: Dict[str, Any] = {}
+        for name in names or self.names():
+            if name not in self._specs:
+                report[name] = {"error": "unknown service"}
+                continue
+            _, _, singleton = self._specs[name]
+            try:
+                if singleton:
+                    self.get(name)
+                else:
+                    self.target(name)
+                report[name] = dict(self.timings.get(name, {}), loaded=True)
+            except Exception as e:
+                report[name] = {"error": str(e)}
+        return report
+
+
+class LazyService:
+    """
+    代替原本的 class 名稱使用：
+    - `VideoProcessor()` -> singleton instance（帶參數時則建立新的 instance）
+    - `FileManager.move_to_bad(...)` -> 轉給實際 class 的屬性
+    """
+
+    def __init__(self, registry: ServiceRegistry, name: str):
+        self._registry = registry
+        self._name = name
+
+    def __call__(self, *args, **kwargs):
+        _, _, singleton = self._registry._specs[self._name]
+        if singleton and not args and not kwargs:
+            return self._registry.get(self._name)
+        return self._registry.target(self._name)(*args, **kwargs)
+
+    def __getattr__(self, attr: str):
+        return getattr(self._registry.target(self._name), attr)
+
+    def __repr__(self):
+        return f"<LazyService {self._name}>"
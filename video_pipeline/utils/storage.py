@@ -0,0 +1,161 @@
+"""
+Artifact 儲存管理
+
+- `new_job_id()`：`YYYYmmdd_HHMMSS_ffffff_xxxxxx`，依時間排序、同一秒多個上傳也不會撞名。
+- `StorageManager`：所有 job 檔案路徑都由這裡決定，統一放在 `settings.OUTPUT_DIR`（上傳檔在
+  `settings.UPLOAD_DIR`），依日期分層：`OUTPUT_DIR/2026/10/19/{job_id}/img_raw/...`。
+  路徑只用 job_id（title 可能含任意字元，不放進路徑）。
+- `gc()`：依保留期限刪除中間檔（img_raw、segments、concat.txt、temp_video.mp4），
+  可選擇連整個 job 目錄一起刪；`disk_usage()` 回報每個 job 的磁碟用量。
+"""
+import secrets
+import shutil
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+# flexible settings import
+try:
+    from video_pipeline.config import settings
+except Exception:
+    try:
+        from config import settings
+    except Exception:
+        settings = type("_S", (), {})()
+
+
+# 完成後可以刪掉的中間檔（目錄或檔案，相對於 job 目錄）
+INTERMEDIATES = ("img_raw", "segments", "concat.txt", "temp_video.mp4")
+
+
+def new_job_id() -> str:
+    """時間排序（微秒）+ 隨機尾碼，e.g. 20261019_153000_123456_4f9a2c"""
+    return f"{datetime.now():%Y%m%d_%H%M%S_%f}_{secrets.token_hex(3)}"
+
+
+def _size_of(path: Path) -> int:
+    if path.is_file():
+        return path.stat().st_size
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+class StorageManager:
+
+    def __init__(self, output_root: Path, upload_root: Path):
+        self.output_root = Path(output_root)
+        self.upload_root = Path(upload_root)
+
+    @staticmethod
+    def shard(job_id: str) -> Path:
+        """依 job_id 的日期前綴分層；不是日期開頭的 id 放在 misc/"""
+        try:
+            day = datetime.strptime(job_id[:8], "%Y%m%d")
+        except ValueError:
+            return Path("misc")
+        return Path(f"{day:%Y}") / f"{day:%m}" / f"{day:%d}"
+
+    def job_dir(self, job_id: str, create: bool = True) -> Path:
+        path = self.output_root / self.shard(job_id) / job_id
+        if create:
+            path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def job_path(self, job_id: str, kind: str) -> Path:
+        """job 底下的子目錄（img_raw / img / bad_img / video / audio / segments ...），會自動建立"""
+        path = self.job_dir(job_id) / kind
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def upload_path(self, job_id: str, filename: str) -> Path:
+        """上傳檔位置；只取檔名部分，避免 `../` 之類的路徑"""
+        folder = self.upload_root / self.shard(job_id) / job_id
+        folder.mkdir(parents=True, exist_ok=True)
+        return folder / (Path(filename or "upload.mp4").name or "upload.mp4")
+
+    def iter_jobs(self) -> Iterator[Path]:
+        if not self.output_root.exists():
+            return
+        for path in sorted(self.output_root.glob("*/*/*/*")) + sorted(self.output_root.glob("misc/*")):
+            if path.is_dir():
+                yield path
+
+    def disk_usage(self, job_id: str) -> Dict[str, Any]:
+        """job 的磁碟用量（bytes），依子目錄 / 檔案分列"""
+        usage: Dict[str, int] = {}
+        job_dir = self.job_dir(job_id, create=False)
+        if job_dir.exists():
+            for child in job_dir.iterdir():
+                usage[child.name] = _size_of(child)
+        upload_dir = self.upload_root / self.shard(job_id) / job_id
+        if upload_dir.exists():
+            usage["upload"] = _size_of(upload_dir)
+        return {"job_id": job_id, "total_bytes": sum(usage.values()), "by_kind": usage}
+
+    def remove_intermediates(self, job_id: str) -> int:
+        """刪除 job 的中間檔，回傳釋放的 bytes"""
+        freed = 0
+        job_dir = self.job_dir(job_id, create=False)
+        for name in INTERMEDIATES:
+            path = job_dir / name
+            if not path.exists():
+                continue
+            freed += _size_of(path)
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink()
+        return freed
+
+    def gc(
+        self,
+        active: Iterable[str] = (),
+        intermediate_retention: Optional[float] = None,
+        job_retention: Optional[float] = None,
+        now: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        依保留期限清理（以 job 目錄最後修改時間起算，單位秒）：
+        - 超過 intermediate_retention：刪中間檔
+        - 超過 job_retention（> 0 時）：刪整個 job 目錄與上傳檔
+        `active` 內的 job（仍在執行）一律跳過。
+        """
+        now = now or time.time()
+        if intermediate_retention is None:
+            intermediate_retention = float(getattr(settings, "STORAGE_INTERMEDIATE_RETENTION_HOURS", 24)) * 3600
+        if job_retention is None:
+            job_retention = float(getattr(settings, "STORAGE_JOB_RETENTION_DAYS", 0)) * 86400
+        active = set(active)
+
+        report = {"intermediates_removed": [], "jobs_removed": [], "freed_bytes": 0}
+        for job_dir in list(self.iter_jobs()):
+            job_id = job_dir.name
+            if job_id in active:
+                continue
+            age = now - job_dir.stat().st_mtime
+            if job_retention > 0 and age >= job_retention:
+                report["freed_bytes"] += _size_of(job_dir)
+                shutil.rmtree(job_dir, ignore_errors=True)
+                shutil.rmtree(self.upload_root / self.shard(job_id) / job_id, ignore_errors=True)
+                report["jobs_removed"].append(job_id)
+            elif age >= intermediate_retention:
+                freed = self.remove_intermediates(job_id)
+                if freed:
+                    report["freed_bytes"] += freed
+                    report["intermediates_removed"].append(job_id)
+        return report
+
+
+_storage: Optional[StorageManager] = None
+
+
+def get_storage() -> StorageManager:
+    """同一 process 內共用的 StorageManager"""
+    global _storage
+    if _storage is None:
+        base = Path(getattr(settings, "BASE_DIR", Path.cwd()))
+        _storage = StorageManager(
+            Path(getattr(settings, "OUTPUT_DIR", base / "outputs")),
+            Path(getattr(settings, "UPLOAD_DIR", base / "uploads"))
+        )
+    return _storage
@@ -0,0 +1,186 @@
+"""
+Pipeline Worker
+
+檔案說明（File description）:
+    - 獨立的 worker 入口，與 `main.py`（uvicorn API）並行部署。
+    - 從共享隊列（`settings.JOB_QUEUE_URL`）以 lease 方式取出整個 job（task_type="pipeline"）
+      或單一 stage（例如 "transcription"），執行期間定時 heartbeat 延長 lease 並回報進度。
+    - worker 死掉時 lease 會過期，task 自動回到隊列由其他 worker 接手。
+    - 要提升吞吐量，只需在同一台或其他機器上多開幾個 worker（共用同一個隊列）。
+
+用法 / Usage:
+    JOB_QUEUE_URL=sqlite:queue.db python worker.py --concurrency 2
+    JOB_QUEUE_URL=sqlite:queue.db python worker.py --task-types transcription   # 專門跑 Whisper 的節點
+
+注意 / Notes:
+    - 多台機器共用時，uploads / outputs 需放在共享檔案系統（NFS 等），隊列需使用外部 broker
+      或放在共享磁碟上的 SQLite。
+    - 同時設定 WORKER_STAGES 時，處理 "pipeline" 的 worker 會等待 stage worker，
+      請另外啟動負責這些 stage 的 worker，避免互相等待。
+"""
+import argparse
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+try:
+    from video_pipeline.config import settings
+    from video_pipeline.utils.job_queue import JobQueue, default_worker_id, load_job_queue, to_jsonable
+    from video_pipeline import main as pipeline
+except Exception:
+    from config import settings
+    from utils.job_queue import JobQueue, default_worker_id, load_job_queue, to_jsonable
+    import main as pipeline
+
+
+async def handle_pipeline(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """執行整個 job；回傳最終 job 狀態"""
+    job_id = payload["job_id"]
+    record = dict(payload.get("record") or {})
+    record.setdefault("errors", [])
+    record.setdefault("warnings", [])
+    record["status"] = "started"
+    pipeline.jobs[job_id] = record
+
+    await pipeline.run_pipeline(job_id, payload["video_path"], payload.get("title"))
+    return pipeline.jobs[job_id]
+
+
+async def handle_transcription(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """只執行 ASR stage"""
+    return await pipeline.transcribe_audio(
+        payload["audio_path"], payload.get("segments"), payload.get("backend"), payload.get("model")
+    )
+
+
+HANDLERS: Dict[str, Callable[[Dict[str, Any]], Awaitable[Any]]] = {
+    "pipeline": handle_pipeline,
+    "transcription": handle_transcription,
+}
+
+
+class Worker:
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        worker_id: Optional[str] = None,
+        task_types: Optional[List[str]] = None,
+        concurrency: int = 1,
+        lease_seconds: float = 60.0,
+        heartbeat_seconds: float = 15.0,
+        poll_interval: float = 2.0
+    ):
+        self.queue = queue
+        self.worker_id = worker_id or default_worker_id()
+        self.task_types = task_types or list(HANDLERS)
+        self.concurrency = max(1, concurrency)
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.poll_interval = poll_interval
+        self._stopping = False
+
+    def _state_of(self, task: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # pipeline task 回報目前 job 狀態，讓 API 的 /status 看得到進度
+        if task["task_type"] != "pipeline":
+            return None
+        record = pipeline.jobs.get(task["payload"]["job_id"])
+        return to_jsonable(record) if record is not None else None
+
+    async def _heartbeat(self, task: Dict[str, Any], runner: asyncio.Task):
+        while not runner.done():
+            await asyncio.sleep(self.heartbeat_seconds)
+            alive = await asyncio.to_thread(
+                self.queue.heartbeat, task["task_id"], self.worker_id,
+                self.lease_seconds, self._state_of(task)
+            )
+            if not alive:
+                # lease 已被收回（例如太久沒 heartbeat），交給其他 worker，本地停止
+                print(f"[{self.worker_id}] lost lease on {task['task_id']}, cancelling")
+                runner.cancel()
+                return
+
+    async def _run_task(self, task: Dict[str, Any]):
+        handler = HANDLERS[task["task_type"]]
+        runner = asyncio.create_task(handler(task["payload"]))
+        beat = asyncio.create_task(self._heartbeat(task, runner))
+        try:
+            result = await runner
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            await asyncio.to_thread(self.queue.fail, task["task_id"], self.worker_id, str(e), True)
+            print(f"[{self.worker_id}] task {task['task_id']} failed: {e}")
+            return
+        finally:
+            beat.cancel()
+
+        if task["task_type"] == "pipeline" and result.get("status") == "failed":
+            # run_pipeline 自己捕捉了錯誤；視為確定性失敗，不再重試
+            await asyncio.to_thread(
+                self.queue.heartbeat, task["task_id"], self.worker_id,
+                self.lease_seconds, to_jsonable(result)
+            )
+            errors = result.get("errors") or ["pipeline failed"]
+            await asyncio.to_thread(self.queue.fail, task["task_id"], self.worker_id, errors[-1], False)
+            return
+
+        if task["task_type"] == "pipeline":
+            await asyncio.to_thread(
+                self.queue.heartbeat, task["task_id"], self.worker_id,
+                self.lease_seconds, to_jsonable(result)
+            )
+        await asyncio.to_thread(self.queue.complete, task["task_id"], self.worker_id, result)
+
+    async def _slot(self, slot: int):
+        while not self._stopping:
+            task = await asyncio.to_thread(
+                self.queue.lease, self.worker_id, self.task_types, self.lease_seconds
+            )
+            if task is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            print(f"[{self.worker_id}#{slot}] leased {task['task_type']} {task['task_id']} "
+                  f"(attempt {task['attempts']})")
+            await self._run_task(task)
+            pipeline.jobs.sweep()
+
+    async def run(self):
+        print(f"[{self.worker_id}] worker started: types={self.task_types}, concurrency={self.concurrency}")
+        await asyncio.gather(*(self._slot(i) for i in range(self.concurrency)))
+
+    def stop(self):
+        self._stopping = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI Video Pipeline worker")
+    parser.add_argument("--queue-url", default=getattr(settings, "JOB_QUEUE_URL", "") or "sqlite:queue.db")
+    parser.add_argument("--worker-id", default=None)
+    parser.add_argument("--task-types", default=",".join(HANDLERS),
+                        help="逗號分隔，e.g. pipeline,transcription")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--lease-seconds", type=float, default=settings.WORKER_LEASE_SECONDS)
+    parser.add_argument("--heartbeat-seconds", type=float, default=settings.WORKER_HEARTBEAT_SECONDS)
+    parser.add_argument("--poll-interval", type=float, default=settings.WORKER_POLL_INTERVAL)
+    args = parser.parse_args()
+
+    # stage 結果也要透過同一個隊列回傳給 pipeline worker
+    settings.JOB_QUEUE_URL = args.queue_url
+    queue = load_job_queue(args.queue_url)
+    worker = Worker(
+        queue,
+        worker_id=args.worker_id,
+        task_types=[t.strip() for t in args.task_types.split(",") if t.strip()],
+        concurrency=args.concurrency,
+        lease_seconds=args.lease_seconds,
+        heartbeat_seconds=args.heartbeat_seconds,
+        poll_interval=args.poll_interval
+    )
+    try:
+        asyncio.run(worker.run())
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+if __name__ == "__main__":
+    main()